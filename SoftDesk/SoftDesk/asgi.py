@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+The list and detail GETs of the api are served by the async read path
+(soft_desk_api.async_views) unless SOFT_DESK_ASYNC_READS is set to 0.
+The event stream of /api/events/ (soft_desk_api.events) is only served
+under ASGI, as it holds its connection open.
 """
 
 import os
@@ -12,5 +17,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'SoftDesk.settings')
+os.environ.setdefault('SOFT_DESK_ASYNC_READS', '1')
 
 application = get_asgi_application()
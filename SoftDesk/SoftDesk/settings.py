@@ -48,6 +48,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'soft_desk_api.instrumentation.QueryMetricsMiddleware',
+    'soft_desk_api.profiling.ProfilingMiddleware',
+    'soft_desk_api.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -88,6 +91,148 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'soft-desk',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+SOFT_DESK_RESPONSE_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': 300,
+    'ENABLED': True,
+}
+
+SOFT_DESK_SEARCH = {
+    'BACKEND': None,
+    'HIGHLIGHT': ('<mark>', '</mark>'),
+}
+
+
+# Change feed
+# Tombstones of the deleted rows are kept TOMBSTONE_RETENTION seconds,
+# pruned by `python manage.py prune_tombstones`. Each sync reads again
+# the last OVERLAP seconds of the previous one, see
+# soft_desk_api/changes.py.
+
+SOFT_DESK_CHANGES = {
+    'TOMBSTONE_RETENTION': 30 * 24 * 3600,
+    'OVERLAP': 5,
+}
+
+
+# Query instrumentation
+# Maximum number of queries per endpoint, checked by QueryMetricsMiddleware.
+# Exceeding a budget is logged, or raises with the mode 'raise', which the
+# test suite (soft_desk_api/tests/) sets with override_settings.
+
+SOFT_DESK_QUERY_BUDGETS = {
+    'ProjectViewset.list': 5,
+    'ProjectViewset.retrieve': 6,
+    'ProjectViewset.changes': 8,
+    'ProjectViewset.export': 5,
+    'ProjectViewset.stats': 3,
+    'ProjectViewset.search': 4,
+    'IssueViewset.list': 5,
+    'IssueViewset.retrieve': 4,
+    'CommentViewset.list': 5,
+    'CommentViewset.retrieve': 4,
+    'SearchViewset.list': 4,
+}
+
+SOFT_DESK_QUERY_BUDGET_MODE = 'log'
+
+# /metrics/ is served to staff users logged in to the admin and to scrapers
+# sending "Authorization: Bearer <SOFT_DESK_METRICS_TOKEN>". The addresses
+# of SOFT_DESK_METRICS_ALLOWED_IPS are let in without credentials: behind a
+# reverse proxy every request comes from the proxy's address, so leave it
+# empty there.
+
+SOFT_DESK_METRICS_TOKEN = os.getenv('SOFT_DESK_METRICS_TOKEN')
+
+SOFT_DESK_METRICS_ALLOWED_IPS = []
+
+
+# Response compression
+# brotli is used when the brotli package is installed, gzip otherwise.
+
+SOFT_DESK_COMPRESSION = {
+    'ENABLED': True,
+    'MIN_SIZE': 1024,
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 4,
+    'STREAM_FLUSH_SIZE': 64 * 1024,
+}
+
+
+# Async read path
+# Set by SoftDesk/asgi.py: under ASGI the list and detail GETs of the
+# projects, issues and comments are served by soft_desk_api.async_views.
+
+SOFT_DESK_ASYNC_READS = os.getenv('SOFT_DESK_ASYNC_READS') == '1'
+
+
+# Event streams
+# Changes pushed to the clients of /api/events/ under ASGI, see
+# soft_desk_api/events.py.
+
+SOFT_DESK_EVENTS = {
+    'BACKEND': 'soft_desk_api.events.LocalBackend',
+    'QUEUE_SIZE': 256,
+    'HEARTBEAT': 15,
+    'RETRY': 3000,
+}
+
+
+# Job queue
+# Work deferred out of the requests is stored in the database and run by
+# `python manage.py run_jobs`, see soft_desk_api/jobs.py.
+
+SOFT_DESK_JOBS = {
+    'MAX_ATTEMPTS': 3,
+    'RETRY_DELAY': 10,
+    'TIMEOUT': 3600,
+    'POLL_INTERVAL': 1,
+    'RETENTION': 7 * 24 * 3600,
+}
+
+
+# Background deletion
+# Deleted users and projects are hidden at once and purged in batches by
+# a job, see soft_desk_api/deletion.py.
+
+SOFT_DESK_DELETION = {
+    'BATCH_SIZE': 1000,
+    'CLAIM_TIMEOUT': 600,
+}
+
+
+# Request profiling
+# Off unless SOFT_DESK_PROFILING=1. Profiles are aggregated with
+# `python manage.py profile_report`.
+
+SOFT_DESK_PROFILING = {
+    'ENABLED': os.getenv('SOFT_DESK_PROFILING') == '1',
+    'SAMPLE_RATE': float(os.getenv('SOFT_DESK_PROFILING_RATE', '0.01')),
+    'SLOW_THRESHOLD': 1.0,
+    'INTERVAL': 0.005,
+    'DIRECTORY': BASE_DIR / 'profiles',
+    'MAX_PROFILES': 500,
+}
+
+
+# Benchmarks
+# Where `python manage.py benchmark` writes its results without --output.
+
+SOFT_DESK_BENCHMARK_OUTPUT = os.getenv(
+    'SOFT_DESK_BENCHMARK_OUTPUT', BASE_DIR / 'benchmarks' / 'results.json')
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -124,6 +269,21 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploaded and generated files (deferred exports)
+
+MEDIA_ROOT = BASE_DIR / 'media'
+
+MEDIA_URL = 'media/'
+
+# Email
+# Notifications are printed to the console unless a backend is set.
+
+EMAIL_BACKEND = os.getenv('DJANGO_EMAIL_BACKEND',
+                          'django.core.mail.backends.console.EmailBackend')
+
+DEFAULT_FROM_EMAIL = os.getenv('DJANGO_DEFAULT_FROM_EMAIL',
+                               'softdesk@localhost')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -132,7 +292,50 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
     'PAGE_SIZE': 100,
-    'DEFAULT_AUTHENTICATION_CLASSES': ('rest_framework_simplejwt.authentication.JWTAuthentication',)
+    'DEFAULT_AUTHENTICATION_CLASSES': ('custom_auth.authentication.JWTAuthentication',),
+    'DEFAULT_RENDERER_CLASSES': (
+        'soft_desk_api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'soft_desk_api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
 AUTH_USER_MODEL = 'custom_auth.User'
+
+AUTHENTICATION_BACKENDS = ['custom_auth.backends.ModelBackend']
+
+# Registration and login hash passwords on a pool of worker processes, see
+# custom_auth/hashing.py. Past MAX_PENDING hashes they answer 503.
+
+SOFT_DESK_PASSWORD_HASHING = {
+    'ENABLED': True,
+    'WORKERS': 2,
+    'MAX_PENDING': 8,
+    'RETRY_AFTER': 1,
+    'NICENESS': 10,
+    'HASHER': None,
+}
+
+SIMPLE_JWT = {
+    'TOKEN_OBTAIN_SERIALIZER':
+        'custom_auth.serializers.TokenObtainPairSerializer',
+}
+
+# Users authenticated by custom_auth.authentication.JWTAuthentication are
+# cached per process, see custom_auth/user_cache.py. Add e.g.
+# ['username', 'is_active'] to TOKEN_CLAIMS to authenticate from the token
+# on cache misses. When several processes serve the api, ALIAS must name a
+# cache they share, so that all of them stop trusting a user's cached entry
+# and tokens as soon as the user is saved or deleted.
+
+SOFT_DESK_AUTH_CACHE = {
+    'ENABLED': True,
+    'MAX_SIZE': 10000,
+    'TIMEOUT': 60,
+    'TOKEN_CLAIMS': [],
+    'ALIAS': 'default',
+}
@@ -14,6 +14,7 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework import routers
@@ -22,10 +23,17 @@ from rest_framework_simplejwt.views import (
 from rest_framework_nested.routers import NestedSimpleRouter
 
 from custom_auth.views import UserCreateView, UserDeleteView
-from soft_desk_api.views import ProjectViewset, IssueViewset, CommentViewset
+from soft_desk_api.views import (
+    ProjectViewset, IssueViewset, CommentViewset, SearchViewset,
+    JobViewset, DeletionView)
+from soft_desk_api.events import events_view
+from soft_desk_api.instrumentation import metrics_view
+from soft_desk_api.async_views import async_urlpatterns
 
 router = routers.SimpleRouter()
 router.register('projects', ProjectViewset, basename='projects')
+router.register('search', SearchViewset, basename='search')
+router.register('jobs', JobViewset, basename='jobs')
 
 projects_router = NestedSimpleRouter(router, 'projects',
                                      lookup='project')
@@ -34,15 +42,26 @@ projects_router.register('issues', IssueViewset, basename='issues')
 issues_router = NestedSimpleRouter(projects_router, 'issues', lookup='issue')
 issues_router.register('comments', CommentViewset, basename='comments')
 
+
+def api_urls(router):
+    if settings.SOFT_DESK_ASYNC_READS:
+        return async_urlpatterns(router.urls)
+    return router.urls
+
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('register/', UserCreateView.as_view(), name='register'),
     path('delete-account/', UserDeleteView.as_view(), name='delete-account'),
-    path('api/', include(router.urls)),
-    path('api/', include(projects_router.urls)),
-    path('api/', include(issues_router.urls)),
+    path('api/', include(api_urls(router))),
+    path('api/', include(api_urls(projects_router))),
+    path('api/', include(api_urls(issues_router))),
+    path('api/events/', events_view, name='events'),
+    path('api/deletions/<uuid:uuid>/', DeletionView.as_view(),
+         name='deletion'),
     path('api/token/', TokenObtainPairView.as_view(),
          name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(),
          name='token_refresh'),
+    path('metrics/', metrics_view, name='metrics'),
 ]
@@ -0,0 +1,142 @@
+"""
+Authentication classes of the api.
+
+JWTAuthentication is simplejwt's, reading the user of the token from
+custom_auth.user_cache before the database, or building it from the
+claims listed in SOFT_DESK_AUTH_CACHE['TOKEN_CLAIMS'], so that most
+requests authenticate without a query. Neither is trusted once the user
+changed after it was loaded or issued: the time of the last change is
+read from the shared cache first (see user_cache.invalidate_users()).
+
+It also has aauthenticate(), the coroutine the async read path
+(soft_desk_api.async_views) awaits instead of running authenticate() in
+a thread: the token is decoded and validated in the event loop and the
+user, on a cache miss, loaded with the async ORM.
+"""
+import time
+
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import authentication
+from rest_framework_simplejwt.exceptions import (
+    AuthenticationFailed, InvalidToken
+)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from custom_auth.user_cache import (
+    user_cache, get_setting, stats, get_changed_at, aget_changed_at
+)
+
+
+class JWTAuthentication(authentication.JWTAuthentication):
+    def get_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        changed_at = None
+        if get_setting('ENABLED'):
+            changed_at = get_changed_at(user_id)
+        user = self.get_known_user(user_id, validated_token, changed_at)
+        if user is None:
+            loaded_at = time.time()
+            try:
+                user = self.user_model.objects.get(
+                    **{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist as e:
+                raise AuthenticationFailed(
+                    _('User not found'), code='user_not_found'
+                ) from e
+            self.remember_user(user_id, user, loaded_at)
+        self.check_user(user, validated_token)
+        return user
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        """ get_user() through the async ORM """
+        user_id = self.get_user_id(validated_token)
+        changed_at = None
+        if get_setting('ENABLED'):
+            changed_at = await aget_changed_at(user_id)
+        user = self.get_known_user(user_id, validated_token, changed_at)
+        if user is None:
+            loaded_at = time.time()
+            try:
+                user = await self.user_model.objects.aget(
+                    **{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist as e:
+                raise AuthenticationFailed(
+                    _('User not found'), code='user_not_found'
+                ) from e
+            self.remember_user(user_id, user, loaded_at)
+        self.check_user(user, validated_token)
+        return user
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(
+                _('Token contained no recognizable user identification')
+            ) from e
+
+    def get_known_user(self, user_id, validated_token, changed_at):
+        """
+        The user from the cache or the token claims, without I/O. Neither
+        is used when the user changed, at changed_at, after its entry was
+        loaded or the token issued.
+        """
+        if not get_setting('ENABLED'):
+            return None
+        user = user_cache.get(user_id, changed_at)
+        if user is None:
+            user = self.user_from_claims(user_id, validated_token,
+                                         changed_at)
+        return user
+
+    def remember_user(self, user_id, user, loaded_at):
+        if get_setting('ENABLED'):
+            user_cache.set(user_id, user, loaded_at)
+
+    def user_from_claims(self, user_id, validated_token, changed_at):
+        """
+        A user holding the TOKEN_CLAIMS fields of the token, the others
+        deferred, or None when the token lacks one of them or was issued
+        before changed_at. Not used when the revocation check needs the
+        password hash.
+        """
+        claims = get_setting('TOKEN_CLAIMS')
+        if (not claims or api_settings.CHECK_REVOKE_TOKEN
+                or any(claim not in validated_token for claim in claims)):
+            return None
+        if (changed_at is not None
+                and validated_token.get('iat', 0) <= changed_at):
+            return None
+        id_field = self.user_model._meta.get_field(api_settings.USER_ID_FIELD)
+        field_names = [id_field.attname, *claims]
+        values = [id_field.to_python(user_id)]
+        values += [validated_token[claim] for claim in claims]
+        stats['claims'] += 1
+        return self.user_model.from_db(
+            router.db_for_read(self.user_model), field_names, values)
+
+    def check_user(self, user, validated_token):
+        """ The checks get_user() runs on the user it loaded """
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'),
+                                       code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."),
+                    code='password_changed'
+                )
@@ -0,0 +1,35 @@
+"""
+Authentication backends of the project.
+
+ModelBackend is Django's, checking passwords with custom_auth.hashing so
+that the token endpoint and the admin login hash on the worker pool.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth import backends, get_user_model
+
+from custom_auth import hashing
+
+UserModel = get_user_model()
+
+
+class ModelBackend(backends.ModelBackend):
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # Hash once, as Django does, so that a nonexistent user does
+            # not answer faster than a wrong password (#20760).
+            hashing.make_password(password)
+        else:
+            if (hashing.check_password(user, password)
+                    and self.user_can_authenticate(user)):
+                return user
+
+    async def aauthenticate(self, request, username=None, password=None,
+                            **kwargs):
+        return await sync_to_async(self.authenticate)(
+            request, username, password, **kwargs)
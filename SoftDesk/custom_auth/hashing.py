@@ -0,0 +1,177 @@
+"""
+Password hashing on a bounded pool of worker processes.
+
+Hashing a password (PBKDF2 runs a million iterations) takes a core for a
+noticeable time. Registration and login hash through make_password() and
+check_password() below, which run the hasher in a ProcessPoolExecutor of
+WORKERS processes started at a lower CPU priority, so that a burst of
+logins cannot take the cores the other requests are served on. The
+workers are spawned, which re-imports the __main__ module: scripts
+hashing passwords need an `if __name__ == '__main__':` guard.
+
+Admission control bounds the hashes queued or running in the pool to
+MAX_PENDING per process: past it, HashingUnavailable answers 503 with a
+Retry-After header right away instead of queueing the request.
+
+A password that checks out but is stored with another algorithm than
+HASHER, or with outdated parameters (e.g. fewer iterations), is rehashed
+with HASHER and saved, like Django's own check_password() does with the
+first of PASSWORD_HASHERS.
+
+Configured through the SOFT_DESK_PASSWORD_HASHING setting:
+    ENABLED     - set to False to hash on the request thread
+    WORKERS     - processes of the pool, in every server process
+    MAX_PENDING - hashes queued or running before requests are refused
+    RETRY_AFTER - seconds sent in the Retry-After header of the 503
+    NICENESS    - added to the niceness of the worker processes
+    HASHER      - algorithm of new hashes, one of PASSWORD_HASHERS;
+                  None for the first of them
+"""
+import multiprocessing
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+DEFAULTS = {
+    'ENABLED': True,
+    'WORKERS': 2,
+    'MAX_PENDING': 8,
+    'RETRY_AFTER': 1,
+    'NICENESS': 10,
+    'HASHER': None,
+}
+
+stats = Counter()
+
+
+def get_setting(name):
+    return getattr(settings, 'SOFT_DESK_PASSWORD_HASHING', {}).get(
+        name, DEFAULTS[name])
+
+
+class HashingUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _('Too many logins in progress, retry shortly.')
+    default_code = 'hashing_unavailable'
+
+    def __init__(self):
+        super().__init__()
+        # Sent as Retry-After by rest_framework.views.exception_handler.
+        self.wait = get_setting('RETRY_AFTER')
+
+
+def start_worker(niceness):
+    if niceness and hasattr(os, 'nice'):
+        os.nice(niceness)
+
+
+def encode(hasher, password, salt):
+    return hasher.encode(password, salt)
+
+
+def verify(hasher, password, encoded):
+    return hasher.verify(password, encoded)
+
+
+class HashingPool:
+    """
+    The process pool, created on first use, and the count of the hashes
+    it was handed that are not done yet.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+        self.pending = 0
+
+    def get_executor(self):
+        if self.executor is None:
+            # Workers only run the hashers: spawning them keeps the
+            # database connections and threads of the server out.
+            self.executor = ProcessPoolExecutor(
+                get_setting('WORKERS'),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=start_worker,
+                initargs=(get_setting('NICENESS'),),
+            )
+        return self.executor
+
+    def run(self, function, *args):
+        with self.lock:
+            if self.pending >= get_setting('MAX_PENDING'):
+                stats['rejected'] += 1
+                raise HashingUnavailable
+            self.pending += 1
+            executor = self.get_executor()
+        stats['admitted'] += 1
+        try:
+            return executor.submit(function, *args).result()
+        except BrokenProcessPool as e:
+            # A worker died: the next hash starts a new pool.
+            with self.lock:
+                if self.executor is executor:
+                    self.executor = None
+            raise HashingUnavailable from e
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+    def shutdown(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown()
+
+
+pool = HashingPool()
+
+
+def run(function, *args):
+    if not get_setting('ENABLED'):
+        stats['inline'] += 1
+        return function(*args)
+    return pool.run(function, *args)
+
+
+def get_preferred_hasher():
+    return hashers.get_hasher(get_setting('HASHER') or 'default')
+
+
+def make_password(password):
+    """ django.contrib.auth.hashers.make_password() through the pool """
+    hasher = get_preferred_hasher()
+    return run(encode, hasher, password, hasher.salt())
+
+
+def check_password(user, password):
+    """
+    User.check_password() through the pool. A correct password stored
+    with another hasher than HASHER, or outdated parameters, is rehashed
+    and saved.
+    """
+    encoded = user.password
+    if password is None or not hashers.is_password_usable(encoded):
+        return False
+    try:
+        hasher = hashers.identify_hasher(encoded)
+    except ValueError:
+        return False
+    if not run(verify, hasher, password, encoded):
+        return False
+    preferred = get_preferred_hasher()
+    if hasher.algorithm != preferred.algorithm or hasher.must_update(encoded):
+        try:
+            user.password = make_password(password)
+        except HashingUnavailable:
+            # The login goes through, a later one rehashes.
+            return True
+        user.save(update_fields=['password'])
+        stats['rehashed'] += 1
+    return True
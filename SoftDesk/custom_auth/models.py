@@ -17,10 +17,14 @@ class User(AbstractUser):
     age - SmallIntegerField with min value of 15
     can_be_contacted - Boolean Field set to false by default
     can_data_be_shared - Boolean Field set to false by default.
+    deletion_requested_at - set, with is_active cleared, when the account
+    is deleted, until soft_desk_api.deletion purges it.
     """
     age = models.SmallIntegerField(validators=[MinValueValidator(15)])
     can_be_contacted = models.BooleanField(default=False)
     can_data_be_shared = models.BooleanField(default=False)
+    deletion_requested_at = models.DateTimeField(null=True, blank=True,
+                                                 editable=False)
 
     groups = models.ManyToManyField(
         Group,
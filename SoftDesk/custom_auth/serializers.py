@@ -3,8 +3,11 @@ This module contains serializers
 relevant to user creation and authentication in custom_auth application.
 """
 from rest_framework import serializers
+from rest_framework_simplejwt import serializers as jwt_serializers
 
+from custom_auth import hashing
 from custom_auth.models import User
+from custom_auth.user_cache import get_setting
 
 
 class UserCreateSerializer(serializers.ModelSerializer):
@@ -16,11 +19,26 @@ class UserCreateSerializer(serializers.ModelSerializer):
                   'can_be_contacted', 'can_data_be_shared']
 
     def create(self, validated_data):
-        user = User.objects.create_user(
-            username=validated_data['username'],
-            password=validated_data['password'],
+        # What User.objects.create_user() does, hashing on the worker pool.
+        password = hashing.make_password(validated_data['password'])
+        user = User.objects.create(
+            username=User.normalize_username(validated_data['username']),
+            password=password,
             age=validated_data['age'],
             can_be_contacted=validated_data['can_be_contacted'],
             can_data_be_shared=validated_data['can_data_be_shared'],
         )
         return user
+
+
+class TokenObtainPairSerializer(jwt_serializers.TokenObtainPairSerializer):
+    """
+    Copies the SOFT_DESK_AUTH_CACHE['TOKEN_CLAIMS'] fields of the user
+    into the issued tokens, see custom_auth.authentication.
+    """
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        for claim in get_setting('TOKEN_CLAIMS'):
+            token[claim] = getattr(user, claim)
+        return token
@@ -0,0 +1,19 @@
+"""
+Signal handlers dropping users from custom_auth.user_cache whenever
+their row is saved or deleted.
+"""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from custom_auth.models import User
+from custom_auth.user_cache import invalidate_users
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    user_id = instance.pk
+    invalidate_users(user_id)
+    # A request may cache the old row again before the change commits.
+    transaction.on_commit(lambda: invalidate_users(user_id))
@@ -1,3 +1,198 @@
-from django.test import TestCase
+"""
+Registration and account deletion, with their queries, the cache of the
+authenticated users and the pool hashing their passwords.
+"""
+import time
 
-# Create your tests here.
+from django.contrib.auth.hashers import identify_hasher
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+
+from custom_auth import hashing
+from custom_auth.authentication import JWTAuthentication
+from custom_auth.models import User
+from custom_auth.serializers import TokenObtainPairSerializer
+from custom_auth.user_cache import changed_key, user_cache
+from soft_desk_api.models import Deletion, Job, Project
+
+PASSWORD = 'a-long-enough-password'
+
+
+class RegisterTests(APITestCase):
+    def register(self, username):
+        return self.client.post('/register/', {
+            'username': username, 'password': PASSWORD, 'age': 30,
+            'can_be_contacted': False, 'can_data_be_shared': False,
+        }, format='json')
+
+    def test_register(self):
+        # The username uniqueness check and the insert.
+        with self.assertNumQueries(2):
+            response = self.register('newcomer')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(),
+                         {'detail': 'User created successfully'})
+        self.assertTrue(
+            User.objects.get(username='newcomer').check_password(PASSWORD))
+
+    def test_register_taken_username(self):
+        User.objects.create(username='newcomer', age=30)
+        response = self.register('newcomer')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'username'})
+
+
+class DeleteAccountTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='leaving', age=30)
+        self.project = Project.objects.create(author=self.user, name='Gone',
+                                              project_type='back-end')
+
+    def test_delete_account(self):
+        self.client.force_authenticate(self.user)
+        # One transaction: the user, their projects, the deletion, the
+        # members to invalidate and the purge job.
+        with self.assertNumQueries(9):
+            response = self.client.delete('/delete-account/')
+        self.assertEqual(response.status_code, 202)
+        deletion = Deletion.objects.get()
+        self.assertEqual(response.json()['uuid'], str(deletion.uuid))
+        self.assertTrue(response['Location'].endswith(
+            f'/api/deletions/{deletion.uuid}/'))
+        self.user.refresh_from_db()
+        self.project.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertIsNotNone(self.project.deletion_requested_at)
+        self.assertTrue(Job.objects.filter(task='purge_deletion').exists())
+
+    def test_anonymous(self):
+        response = self.client.delete('/delete-account/')
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(SOFT_DESK_AUTH_CACHE={
+    'TOKEN_CLAIMS': ['username', 'is_active']})
+class UserCacheTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='cached', age=30)
+        cache.clear()
+        user_cache.clear()
+
+    def token(self, claims=True):
+        if claims:
+            return TokenObtainPairSerializer.get_token(self.user).access_token
+        return AccessToken.for_user(self.user)
+
+    def authenticate(self, token):
+        return JWTAuthentication().get_user(AccessToken(str(token)))
+
+    def client_for(self, token):
+        return APIClient(headers={'Authorization': f'Bearer {token}'})
+
+    def test_claims(self):
+        with self.assertNumQueries(0):
+            user = self.authenticate(self.token())
+        self.assertEqual((user.pk, user.username), (self.user.pk, 'cached'))
+
+    def test_cache(self):
+        token = self.token(claims=False)
+        with self.assertNumQueries(1):
+            self.authenticate(token)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate(token).pk, self.user.pk)
+
+    def test_deactivated(self):
+        token = self.token()
+        self.authenticate(token)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_deleted(self):
+        token = self.token()
+        self.user.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_delete_account(self):
+        client = self.client_for(self.token())
+        response = client.delete('/delete-account/')
+        self.assertEqual(response.status_code, 202)
+        response = client.get('/api/projects/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_changed_in_another_process(self):
+        token = self.token(claims=False)
+        self.authenticate(token)
+        # What invalidate_users() leaves in the shared cache when it runs
+        # in another process: the local entry stays.
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        cache.set(changed_key(self.user.pk), time.time())
+        self.assertEqual(len(user_cache), 1)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_token_issued_after_change(self):
+        cache.set(changed_key(self.user.pk), time.time() - 60)
+        with self.assertNumQueries(0):
+            self.authenticate(self.token())
+
+
+class HashingTests(APITestCase):
+    def login(self, password=PASSWORD):
+        return self.client.post('/api/token/', {
+            'username': 'hashed', 'password': password}, format='json')
+
+    def assertUnavailable(self, response):
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '3')
+        self.assertEqual(response.json()['detail'],
+                         'Too many logins in progress, retry shortly.')
+
+    def test_login(self):
+        user = User.objects.create(username='hashed', age=30)
+        user.set_password(PASSWORD)
+        user.save()
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(self.login('wrong password').status_code, 401)
+
+    @override_settings(SOFT_DESK_PASSWORD_HASHING={'MAX_PENDING': 0,
+                                                   'RETRY_AFTER': 3})
+    def test_admission(self):
+        User.objects.create(username='hashed', age=30,
+                            password=hashing.hashers.make_password(PASSWORD))
+        rejected = hashing.stats['rejected']
+        self.assertUnavailable(self.client.post('/register/', {
+            'username': 'newcomer', 'password': PASSWORD, 'age': 30,
+        }, format='json'))
+        self.assertUnavailable(self.login())
+        self.assertEqual(hashing.stats['rejected'], rejected + 2)
+        self.assertFalse(User.objects.filter(username='newcomer').exists())
+
+    @override_settings(SOFT_DESK_PASSWORD_HASHING={'MAX_PENDING': 1})
+    def test_pending(self):
+        pool = hashing.HashingPool()
+        self.addCleanup(pool.shutdown)
+        hasher = hashing.get_preferred_hasher()
+        encoded = pool.run(hashing.encode, hasher, PASSWORD, hasher.salt())
+        self.assertEqual(pool.pending, 0)
+        self.assertTrue(hasher.verify(PASSWORD, encoded))
+        # One hash still running.
+        pool.pending = 1
+        with self.assertRaises(hashing.HashingUnavailable):
+            pool.run(hashing.encode, hasher, PASSWORD, hasher.salt())
+        self.assertEqual(pool.pending, 1)
+
+    def test_rehash(self):
+        user = User.objects.create(username='hashed', age=30)
+        user.password = hashing.hashers.make_password(
+            PASSWORD, hasher='pbkdf2_sha1')
+        user.save()
+        self.assertEqual(self.login().status_code, 200)
+        user.refresh_from_db()
+        self.assertEqual(identify_hasher(user.password).algorithm,
+                         hashing.get_preferred_hasher().algorithm)
@@ -0,0 +1,140 @@
+"""
+Process-local cache of the users authenticated by JWTAuthentication.
+
+Entries are kept at most TIMEOUT seconds and the least recently used ones
+are evicted past MAX_SIZE. The signal handlers in custom_auth.signals, and
+UserDeleteView, call invalidate_users() as soon as the row is saved or
+deleted: it drops the local entry and records when the user changed in
+the ALIAS cache. Authentication reads that record first, and neither a
+cached entry nor the claims of a token older than it are trusted, so the
+user loads from the database again.
+
+The record reaches every process only when ALIAS is a cache they share
+(Memcached, Redis, the database): with a per-process backend such as
+LocMemCache, run a single process, or leave TOKEN_CLAIMS empty and keep
+TIMEOUT short, as a change made elsewhere goes unseen until the entry, or
+the token holding the claims, expires. A queryset update() sends no
+signal: call invalidate_users() after it.
+
+Configured through the SOFT_DESK_AUTH_CACHE setting:
+    ENABLED      - set to False to load the user on every request
+    MAX_SIZE     - number of users kept
+    TIMEOUT      - lifetime of an entry in seconds
+    TOKEN_CLAIMS - User fields copied into the tokens when they are issued;
+                   on a cache miss, tokens holding all of them authenticate
+                   a user built from the claims, whose other fields load
+                   from the database only if read
+    ALIAS        - the CACHES alias recording when the users changed
+"""
+import copy
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework_simplejwt.settings import api_settings
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MAX_SIZE': 10000,
+    'TIMEOUT': 60,
+    'TOKEN_CLAIMS': [],
+    'ALIAS': 'default',
+}
+
+stats = Counter()
+
+
+def get_setting(name):
+    return getattr(settings, 'SOFT_DESK_AUTH_CACHE', {}).get(
+        name, DEFAULTS[name])
+
+
+def get_cache():
+    return caches[get_setting('ALIAS')]
+
+
+def changed_key(user_id):
+    return f'soft_desk:auth:changed:{user_id}'
+
+
+class UserCache:
+    """
+    Thread-safe TTL / LRU mapping of user ids to User instances. Ids are
+    keyed as strings: tokens carry them as such. Each entry keeps the time
+    its user was loaded, compared with the changed_at of get().
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, user_id, changed_at=None):
+        """
+        A copy of the cached user, so requests never share one. None as
+        well when the user was loaded before changed_at.
+        """
+        user_id = str(user_id)
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is not None:
+                expires, user, loaded_at = entry
+                if changed_at is not None and loaded_at <= changed_at:
+                    stats['stale'] += 1
+                elif expires > time.monotonic():
+                    self.entries.move_to_end(user_id)
+                    stats['hit'] += 1
+                    return copy.copy(user)
+                del self.entries[user_id]
+            stats['miss'] += 1
+            return None
+
+    def set(self, user_id, user, loaded_at):
+        """ Caches user, read from the database at loaded_at (time()) """
+        user_id = str(user_id)
+        expires = time.monotonic() + get_setting('TIMEOUT')
+        with self.lock:
+            self.entries[user_id] = (expires, copy.copy(user), loaded_at)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > get_setting('MAX_SIZE'):
+                self.entries.popitem(last=False)
+                stats['eviction'] += 1
+
+    def delete(self, *user_ids):
+        with self.lock:
+            for user_id in user_ids:
+                if self.entries.pop(str(user_id), None) is not None:
+                    stats['invalidation'] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+user_cache = UserCache()
+
+
+def changed_timeout():
+    """ Outlives the access tokens and the entries issued before a change """
+    return max(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds(),
+               get_setting('TIMEOUT'))
+
+
+def get_changed_at(user_id):
+    """ The time() the user last changed, or None """
+    return get_cache().get(changed_key(user_id))
+
+
+async def aget_changed_at(user_id):
+    """ get_changed_at() through the async cache api """
+    return await get_cache().aget(changed_key(user_id))
+
+
+def invalidate_users(*user_ids):
+    user_cache.delete(*user_ids)
+    changed_at = time.time()
+    get_cache().set_many({changed_key(user_id): changed_at
+                          for user_id in user_ids}, changed_timeout())
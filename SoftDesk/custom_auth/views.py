@@ -17,7 +17,11 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 
+from soft_desk_api.deletion import request_user_deletion
+from soft_desk_api.views import deletion_response
+
 from .serializers import UserCreateSerializer
+from .user_cache import invalidate_users
 
 
 class UserCreateView(APIView):
@@ -34,6 +38,11 @@ class UserDeleteView(APIView):
     permission_classes = [IsAuthenticated]
 
     def delete(self, request):
+        """
+        Deactivates the account and answers 202: its projects, issues
+        and comments are purged in the background.
+        """
         user = request.user
-        user.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        deletion = request_user_deletion(user)
+        invalidate_users(user.pk)
+        return deletion_response(request, deletion)
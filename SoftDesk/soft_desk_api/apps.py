@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'soft_desk_api'
+
+    def ready(self):
+        from soft_desk_api import signals, tasks  # noqa: F401
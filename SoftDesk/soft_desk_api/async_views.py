@@ -0,0 +1,164 @@
+"""
+Asynchronous read path of the project, issue and comment endpoints.
+
+Under ASGI (SOFT_DESK_ASYNC_READS, set by SoftDesk/asgi.py) the list and
+detail routes of the viewsets are served by as_async_view(): GET and HEAD
+requests the viewset serves_async() are answered on the event loop with
+the async ORM, every other request goes to the regular viewset through
+sync_to_async, so writes keep their transactions and signal handlers.
+
+The async handlers are alist() / aretrieve(), chained through the same
+mixins as list() / retrieve() (conditional requests, response cache,
+sparse fieldsets, rows). They reuse the viewsets to build their querysets,
+which needs no I/O once the request is resolved:
+    - the JWT is checked with the authenticator's aauthenticate(), the
+      user loaded with aget()
+    - the membership is loaded with aget_membership() and kept on the
+      request, so the permission classes and get_scoped_queryset() read
+      it without querying
+    - validators, counts and rows come from aaggregate(), aget(),
+      acount() and aiterator()
+Lists asking for includes, stats or a cursor page, and anything rendered
+by the browsable api, are handed to the synchronous viewset.
+"""
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import Http404
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from soft_desk_api.membership import aget_membership
+from soft_desk_api.pagination import is_async_paginator
+
+SAFE_READS = ('GET', 'HEAD')
+
+
+async def authenticate(request):
+    """
+    Request._authenticate() awaiting aauthenticate() on the
+    authenticators having one, running authenticate() in a thread
+    on the others.
+    """
+    for authenticator in request.authenticators:
+        aauthenticate = getattr(authenticator, 'aauthenticate', None)
+        if aauthenticate is None:
+            aauthenticate = sync_to_async(authenticator.authenticate)
+        try:
+            user_auth_tuple = await aauthenticate(request)
+        except APIException:
+            request._not_authenticated()
+            raise
+        if user_auth_tuple is not None:
+            request._authenticator = authenticator
+            request.user, request.auth = user_auth_tuple
+            return
+    request._not_authenticated()
+
+
+async def aget_object_or_404(queryset, **kwargs):
+    """ rest_framework.generics.get_object_or_404 through aget() """
+    try:
+        return await queryset.aget(**kwargs)
+    except (queryset.model.DoesNotExist, TypeError, ValueError,
+            DjangoValidationError):
+        raise Http404
+
+
+class AsyncReadMixin:
+    """
+    Terminal aretrieve() of the async read path, and the test of which
+    requests it serves. Lists are served by RowListMixin.alist().
+    """
+    async_actions = ['list', 'retrieve']
+
+    def serves_async(self):
+        if self.action not in self.async_actions:
+            return False
+        if not isinstance(self.request.accepted_renderer, JSONRenderer):
+            return False
+        if self.action != 'list':
+            return True
+        try:
+            return (self.use_rows()
+                    and is_async_paginator(self.paginator, self.request))
+        except ValidationError:
+            # Reported by the synchronous viewset, after authentication.
+            return False
+
+    async def aget_object(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        obj = await aget_object_or_404(
+            queryset, **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def aretrieve(self, request, *args, **kwargs):
+        instance = await self.aget_object()
+        serializer = self.get_serializer(instance)
+        # Representations nesting related rows read them lazily.
+        data = await sync_to_async(lambda: serializer.data)()
+        return Response(data)
+
+
+def as_async_view(sync_view):
+    """
+    Wraps the view function of a viewset route, as returned by
+    ViewSet.as_view(), into the coroutine serving its async reads.
+    """
+    cls = sync_view.cls
+    actions = dict(sync_view.actions)
+    if 'get' in actions:
+        actions.setdefault('head', actions['get'])
+    run_sync = sync_to_async(sync_view)
+
+    async def view(request, *args, **kwargs):
+        action = actions.get(request.method.lower())
+        if request.method not in SAFE_READS or action not in cls.async_actions:
+            return await run_sync(request, *args, **kwargs)
+        self = cls(**sync_view.initkwargs)
+        self.action_map = actions
+        self.args = args
+        self.kwargs = kwargs
+        drf_request = self.initialize_request(request, *args, **kwargs)
+        self.request = drf_request
+        self.headers = self.default_response_headers
+        try:
+            self.format_kwarg = self.get_format_suffix(**kwargs)
+            negotiated = self.perform_content_negotiation(drf_request)
+            drf_request.accepted_renderer = negotiated[0]
+            drf_request.accepted_media_type = negotiated[1]
+            if not self.serves_async():
+                return await run_sync(request, *args, **kwargs)
+            await authenticate(drf_request)
+            self.initial(drf_request, *args, **kwargs)
+            await aget_membership(drf_request)
+            response = await getattr(self, f'a{action}')(
+                drf_request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        response = self.finalize_response(drf_request, response,
+                                          *args, **kwargs)
+        return response.render()
+
+    view.cls = cls
+    view.initkwargs = sync_view.initkwargs
+    view.actions = sync_view.actions
+    view.csrf_exempt = True
+    view.__name__ = sync_view.__name__
+    view.__doc__ = sync_view.__doc__
+    return view
+
+
+def async_urlpatterns(urlpatterns):
+    """
+    The urlpatterns with the routes of viewsets using AsyncReadMixin
+    wrapped by as_async_view().
+    """
+    for pattern in urlpatterns:
+        callback = pattern.callback
+        cls = getattr(callback, 'cls', None)
+        if cls is not None and issubclass(cls, AsyncReadMixin):
+            pattern.callback = as_async_view(callback)
+    return urlpatterns
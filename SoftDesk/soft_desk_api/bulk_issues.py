@@ -0,0 +1,156 @@
+"""
+Bulk creation and update of the issues of a project.
+
+Rows are validated in batches of BATCH_SIZE with IssueBulkSerializer. The
+attribution usernames of a batch are resolved with one query, and the
+valid rows are written with a single bulk_create / bulk_update inside a
+transaction. A row that fails validation is reported with its errors and
+does not prevent the other rows of its batch from being written.
+"""
+from itertools import islice
+
+from django.db import transaction, DatabaseError
+from django.utils import timezone
+
+from custom_auth.models import User
+from soft_desk_api.models import Issue, Contributor
+from soft_desk_api.serializers import IssueBulkSerializer
+from soft_desk_api.signals import issues_changed
+
+BATCH_SIZE = 500
+
+
+def iter_batches(rows, size=BATCH_SIZE):
+    rows = iter(rows)
+    index = 0
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield index, batch
+        index += len(batch)
+
+
+def resolve_contributors(project_id, rows):
+    """
+    Maps the attribution usernames found in rows to their Contributor,
+    or to None for existing users who do not contribute to the project.
+    """
+    usernames = {row.get('attribution') for row in rows
+                 if isinstance(row, dict) and row.get('attribution')}
+    if not usernames:
+        return {}
+    contributors = {
+        contributor.user.username: contributor
+        for contributor in Contributor.objects.filter(
+            project_id=project_id, user__username__in=usernames
+        ).select_related('user')
+    }
+    missing = usernames - set(contributors)
+    if missing:
+        for username in User.objects.filter(
+                username__in=missing).values_list('username', flat=True):
+            contributors[username] = None
+    return contributors
+
+
+def validate_row(row, context, instance=None):
+    """ Returns (serializer, errors) for one row of a batch """
+    if isinstance(row, ValueError):
+        return None, {'non_field_errors': [f'Invalid JSON: {row}']}
+    if not isinstance(row, dict):
+        return None, {'non_field_errors': ['Expected an object.']}
+    serializer = IssueBulkSerializer(instance, data=row, context=context,
+                                     partial=instance is not None)
+    if not serializer.is_valid():
+        return None, serializer.errors
+    return serializer, None
+
+
+def write_batch(results, write):
+    """
+    Runs write() in a transaction; on a database error every row that
+    was going to be written in this batch is reported as failed.
+    """
+    try:
+        with transaction.atomic():
+            return write()
+    except DatabaseError as error:
+        for result in results:
+            if 'errors' not in result:
+                result.pop('id', None)
+                result['errors'] = {'non_field_errors': [str(error)]}
+        return []
+
+
+def create_issues(project_id, author, rows):
+    results = []
+    for start, batch in iter_batches(rows):
+        context = {'project_id': project_id,
+                   'contributors': resolve_contributors(project_id, batch)}
+        batch_results = []
+        issues = []
+        for offset, row in enumerate(batch):
+            serializer, errors = validate_row(row, context)
+            if errors:
+                batch_results.append({'index': start + offset,
+                                      'errors': errors})
+                continue
+            issues.append(Issue(project_id=project_id, author=author,
+                                **serializer.validated_data))
+            batch_results.append({'index': start + offset})
+
+        def write():
+            return Issue.objects.bulk_create(issues)
+
+        created = write_batch(batch_results, write) if issues else []
+        valid_results = [r for r in batch_results if 'errors' not in r]
+        for result, issue in zip(valid_results, created):
+            result['id'] = issue.pk
+        if created:
+            issues_changed(project_id, [issue.pk for issue in created])
+        results += batch_results
+    return results
+
+
+def update_issues(project_id, rows):
+    results = []
+    for start, batch in iter_batches(rows):
+        context = {'project_id': project_id,
+                   'contributors': resolve_contributors(project_id, batch)}
+        ids = [row.get('id') for row in batch if isinstance(row, dict)]
+        existing = Issue.objects.filter(project_id=project_id).in_bulk(
+            [pk for pk in ids if isinstance(pk, int)]
+        )
+        batch_results = []
+        issues = []
+        fields = {'updated_at'}
+        now = timezone.now()
+        for offset, row in enumerate(batch):
+            result = {'index': start + offset}
+            batch_results.append(result)
+            pk = row.get('id') if isinstance(row, dict) else None
+            if isinstance(row, dict) and pk not in existing:
+                result['errors'] = {'id': [f'Issue {pk} not found.']}
+                continue
+            issue = existing.get(pk)
+            serializer, errors = validate_row(row, context, instance=issue)
+            if errors:
+                result['errors'] = errors
+                continue
+            for name, value in serializer.validated_data.items():
+                setattr(issue, name, value)
+                fields.add(name)
+            issue.updated_at = now
+            issues.append(issue)
+            result['id'] = issue.pk
+
+        def write():
+            Issue.objects.bulk_update(issues, sorted(fields))
+            return issues
+
+        updated = write_batch(batch_results, write) if issues else []
+        if updated:
+            issues_changed(project_id, [issue.pk for issue in updated])
+        results += batch_results
+    return results
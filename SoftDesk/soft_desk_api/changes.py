@@ -0,0 +1,208 @@
+"""
+Incremental change feed of a project.
+
+Each stream (issues, comments, contributors and tombstones of deleted
+rows) is read in (timestamp, id) order from a position, through an index
+starting with the project and that timestamp. The positions of all
+streams are handed back to the client as one opaque cursor, so a sync
+only ever reads the rows changed since the previous one.
+
+Timestamps are taken when a row is written, not when its transaction
+commits, so a row committed after a later one can land behind a position
+already handed out. Once a sync has read everything (has_more false),
+the cursor is moved OVERLAP seconds back: the next sync reads the rows
+of that window again, and only a transaction open for longer than
+OVERLAP can still be missed. Rows may thus come twice; clients apply
+them by id.
+
+Tombstones are kept TOMBSTONE_RETENTION seconds (SOFT_DESK_CHANGES
+setting), then deleted by prune_tombstones(). A client that has not
+synced for that long may miss deletions and must sync again from
+scratch: ?updated_since= older than the retention is refused.
+"""
+import base64
+import json
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive, make_aware, now
+from rest_framework.exceptions import ValidationError
+
+from soft_desk_api.models import Issue, Comment, Contributor, Tombstone
+from soft_desk_api.serializers import (
+    IssueDetailSerializer, CommentDetailSerializer,
+    ContributorChangeSerializer, TombstoneSerializer
+    )
+
+DEFAULTS = {
+    'TOMBSTONE_RETENTION': 30 * 24 * 3600,
+    'OVERLAP': 5,
+}
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+PRUNE_BATCH_SIZE = 1000
+
+
+def get_setting(name):
+    return getattr(settings, 'SOFT_DESK_CHANGES', {}).get(
+        name, DEFAULTS[name])
+
+
+def retention_cutoff():
+    """ Time before which the tombstones are pruned """
+    return now() - timedelta(
+        seconds=get_setting('TOMBSTONE_RETENTION'))
+
+
+def prune_tombstones(batch_size=PRUNE_BATCH_SIZE):
+    """
+    Deletes the tombstones older than TOMBSTONE_RETENTION, batch_size per
+    query, returns how many were deleted.
+    """
+    cutoff = retention_cutoff()
+    pruned = 0
+    while True:
+        pks = list(Tombstone.objects.filter(deleted_at__lt=cutoff)
+                   .values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return pruned
+        pruned += Tombstone.objects.filter(pk__in=pks).delete()[0]
+
+
+class Stream(ABC):
+    """
+    Rows of a project, read in (timestamp_field, id) order and serialized
+    with serializer_class, their related relations joined.
+    """
+    def __init__(self, name, serializer_class, timestamp_field, related):
+        self.name = name
+        self.serializer_class = serializer_class
+        self.timestamp_field = timestamp_field
+        self.related = related
+
+    @abstractmethod
+    def get_queryset(self, project_id):
+        """ The rows of the stream in project_id """
+
+    def read(self, project_id, position, limit):
+        """
+        Returns up to limit serialized rows after position, the position
+        of the last row returned and whether more rows are waiting.
+        """
+        timestamp, last_id = position
+        field = self.timestamp_field
+        after = Q(**{f'{field}__gt': timestamp}) | Q(
+            **{field: timestamp, 'id__gt': last_id}
+        )
+        queryset = (self.get_queryset(project_id).filter(after)
+                    .select_related(*self.related)
+                    .order_by(field, 'id'))
+        rows = list(queryset[:limit + 1])
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if rows:
+            position = (getattr(rows[-1], field), rows[-1].pk)
+        data = self.serializer_class(rows, many=True).data
+        return data, position, has_more
+
+
+class IssueStream(Stream):
+    def get_queryset(self, project_id):
+        return Issue.objects.filter(project_id=project_id)
+
+
+class CommentStream(Stream):
+    def get_queryset(self, project_id):
+        return Comment.objects.filter(project_id=project_id)
+
+
+class ContributorStream(Stream):
+    def get_queryset(self, project_id):
+        return Contributor.objects.filter(project_id=project_id)
+
+
+class TombstoneStream(Stream):
+    def get_queryset(self, project_id):
+        return Tombstone.objects.filter(project_id=project_id)
+
+
+STREAMS = [
+    IssueStream('issues', IssueDetailSerializer, 'updated_at',
+                ['author', 'attribution__user', 'attribution__project']),
+    CommentStream('comments', CommentDetailSerializer, 'updated_at',
+                  ['author']),
+    ContributorStream('contributors', ContributorChangeSerializer,
+                      'created_at', ['user']),
+    TombstoneStream('deleted', TombstoneSerializer, 'deleted_at', []),
+]
+
+
+def overlap(position):
+    """ position moved OVERLAP seconds back, to read that window again """
+    timestamp, last_id = position
+    if timestamp == datetime.min.replace(tzinfo=timezone.utc):
+        return position
+    return timestamp - timedelta(seconds=get_setting('OVERLAP')), 0
+
+
+def encode_cursor(positions):
+    data = {name: [timestamp.isoformat(), last_id]
+            for name, (timestamp, last_id) in positions.items()}
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        positions = {}
+        for stream in STREAMS:
+            timestamp, last_id = data[stream.name]
+            positions[stream.name] = (datetime.fromisoformat(timestamp),
+                                      int(last_id))
+        return positions
+    except (ValueError, TypeError, KeyError):
+        raise ValidationError({'cursor': 'Invalid cursor.'})
+
+
+def initial_positions(updated_since):
+    timestamp = parse_datetime(updated_since) if updated_since else None
+    if updated_since and timestamp is None:
+        raise ValidationError(
+            {'updated_since': 'Expected an ISO 8601 datetime.'}
+        )
+    if timestamp is None:
+        timestamp = datetime.min.replace(tzinfo=timezone.utc)
+    else:
+        if is_naive(timestamp):
+            timestamp = make_aware(timestamp)
+        if timestamp < retention_cutoff():
+            raise ValidationError({'updated_since': (
+                'Older than the retention of the deletions, '
+                'sync again without updated_since.')})
+    return {stream.name: (timestamp, 0) for stream in STREAMS}
+
+
+def get_changes(project_id, cursor=None, updated_since=None,
+                limit=DEFAULT_LIMIT):
+    if cursor:
+        positions = decode_cursor(cursor)
+    else:
+        positions = initial_positions(updated_since)
+    limit = max(1, min(limit, MAX_LIMIT))
+    result = {}
+    has_more = False
+    for stream in STREAMS:
+        data, positions[stream.name], more = stream.read(
+            project_id, positions[stream.name], limit
+        )
+        result[stream.name] = data
+        has_more = has_more or more
+    if not has_more:
+        positions = {name: overlap(position)
+                     for name, position in positions.items()}
+    result['cursor'] = encode_cursor(positions)
+    result['has_more'] = has_more
+    return result
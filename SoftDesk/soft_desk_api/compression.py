@@ -0,0 +1,225 @@
+"""
+Content-negotiated compression of the api responses.
+
+CompressionMiddleware picks the best encoding the client accepts (brotli
+when the brotli package is installed, then gzip) and compresses:
+    - regular responses of at least MIN_SIZE bytes, in one go
+    - streaming responses (the exports), chunk by chunk as they are
+      produced, flushing the compressor every STREAM_FLUSH_SIZE bytes of
+      input so that clients keep receiving data while nothing is held
+      in memory
+Only the COMPRESSIBLE content types are touched, and responses already
+encoded or marked Cache-Control: no-transform are left alone. Since the
+bytes no longer match the identity representation, ETags get the encoding
+as a suffix ("abc" becomes "abc-gzip") and stay strong: conditional
+.etag_matches strips the suffix, so they answer If-None-Match and If-Match
+alike. The middleware runs in sync and async mode alike.
+
+The api holds no secrets in its response bodies next to attacker
+controlled input (tokens travel in headers), so unlike Django's
+GZipMiddleware no BREACH padding is added.
+
+Configured through the SOFT_DESK_COMPRESSION setting:
+    ENABLED           - the middleware removes itself when False
+    MIN_SIZE          - smallest body compressed, in bytes
+    GZIP_LEVEL        - zlib compression level, 1 to 9
+    BROTLI_QUALITY    - brotli quality, 0 to 11
+    STREAM_FLUSH_SIZE - bytes of input between two flushes of a stream
+"""
+import re
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MIN_SIZE': 1024,
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 4,
+    'STREAM_FLUSH_SIZE': 64 * 1024,
+}
+COMPRESSIBLE = ['application/json', 'application/x-ndjson', 'text/']
+ACCEPT_ENCODING = re.compile(r'^\s*([\w*-]+)\s*(?:;\s*q=([0-9.]+))?')
+NO_TRANSFORM = re.compile(r'\bno-transform\b')
+ENCODED_ETAG = re.compile(r'-(?:br|gzip)"$')
+
+
+def get_setting(name):
+    return getattr(settings, 'SOFT_DESK_COMPRESSION', {}).get(
+        name, DEFAULTS[name])
+
+
+def supported_encodings():
+    """ The encodings the middleware can produce, preferred first """
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def negotiate(accept_encoding):
+    """
+    The supported encoding of highest quality in an Accept-Encoding
+    header, ties going to the preferred one. None for identity.
+    """
+    qualities = {}
+    for part in accept_encoding.split(','):
+        match = ACCEPT_ENCODING.match(part)
+        if match is None:
+            continue
+        try:
+            quality = float(match.group(2) or 1)
+        except ValueError:
+            continue
+        qualities[match.group(1).lower()] = quality
+    best, best_quality = None, 0
+    for encoding in supported_encodings():
+        quality = qualities.get(encoding, qualities.get('*', 0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class Compressor:
+    """ Incremental compressor of one response body """
+    def __init__(self, encoding):
+        if encoding == 'br':
+            self.compressor = brotli.Compressor(
+                quality=get_setting('BROTLI_QUALITY'))
+        else:
+            # wbits 16 + MAX_WBITS writes the gzip header and trailer.
+            self.compressor = zlib.compressobj(get_setting('GZIP_LEVEL'),
+                                               zlib.DEFLATED,
+                                               16 + zlib.MAX_WBITS)
+        self.encoding = encoding
+
+    def compress(self, data):
+        if self.encoding == 'br':
+            return self.compressor.process(data)
+        return self.compressor.compress(data)
+
+    def flush(self):
+        if self.encoding == 'br':
+            return self.compressor.flush()
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self.compressor.finish()
+        return self.compressor.flush(zlib.Z_FINISH)
+
+
+def compress(data, encoding):
+    compressor = Compressor(encoding)
+    return compressor.compress(data) + compressor.finish()
+
+
+def compress_stream(chunks, encoding, flush_size):
+    compressor = Compressor(encoding)
+    pending = 0
+    for chunk in chunks:
+        output = compressor.compress(chunk)
+        pending += len(chunk)
+        if pending >= flush_size:
+            output += compressor.flush()
+            pending = 0
+        if output:
+            yield output
+    yield compressor.finish()
+
+
+async def compress_async_stream(chunks, encoding, flush_size):
+    compressor = Compressor(encoding)
+    pending = 0
+    async for chunk in chunks:
+        output = compressor.compress(chunk)
+        pending += len(chunk)
+        if pending >= flush_size:
+            output += compressor.flush()
+            pending = 0
+        if output:
+            yield output
+    yield compressor.finish()
+
+
+def is_compressible(response):
+    if response.has_header('Content-Encoding'):
+        return False
+    if NO_TRANSFORM.search(response.get('Cache-Control', '')):
+        return False
+    content_type = response.get('Content-Type', '').lower()
+    return any(content_type.startswith(prefix) for prefix in COMPRESSIBLE)
+
+
+def encode_etag(response, encoding):
+    """ Suffixes a strong ETag with the encoding of the body """
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response['ETag'] = f'{etag[:-1]}-{encoding}"'
+
+
+def identity_etag(etag):
+    """ The ETag of the identity representation behind an encoded one """
+    return ENCODED_ETAG.sub('"', etag)
+
+
+class CompressionMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not get_setting('ENABLED'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request,
+                                     await self.get_response(request))
+
+    def process_response(self, request, response):
+        encoding = negotiate(request.headers.get('Accept-Encoding', ''))
+        if response.status_code == 304:
+            # Same validator as the compressed 200 it stands for.
+            if encoding is not None:
+                encode_etag(response, encoding)
+            return response
+        if not is_compressible(response):
+            return response
+        # The representation depends on Accept-Encoding even when the
+        # response ends up sent as is.
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if encoding is None:
+            return response
+        if response.streaming:
+            flush_size = get_setting('STREAM_FLUSH_SIZE')
+            if response.is_async:
+                response.streaming_content = compress_async_stream(
+                    response.streaming_content, encoding, flush_size)
+            else:
+                response.streaming_content = compress_stream(
+                    response.streaming_content, encoding, flush_size)
+            if response.has_header('Content-Length'):
+                del response['Content-Length']
+        else:
+            if len(response.content) < get_setting('MIN_SIZE'):
+                return response
+            compressed = compress(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+        encode_etag(response, encoding)
+        response['Content-Encoding'] = encoding
+        return response
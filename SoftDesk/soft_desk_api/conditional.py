@@ -0,0 +1,257 @@
+"""
+Conditional request support (ETag / Last-Modified) for the api viewsets.
+
+Validators are computed from updated_at with a single aggregate query,
+before anything is serialized:
+    collections - MAX(updated_at) and COUNT(*) of the scoped queryset
+                  plus any aggregates declared by the viewset in
+                  get_validator_aggregates(), as an ETag only: a delete
+                  or a SET_NULL leaves MAX(updated_at) where it was, so
+                  a collection has no Last-Modified and If-Modified-Since
+                  is not honored on it
+    objects     - updated_at of the object, plus any annotations declared
+                  by the viewset in get_validator_annotations()
+
+GET requests matching If-None-Match / If-Modified-Since are answered with
+304 Not Modified, and PUT / PATCH requests failing If-Match with
+412 Precondition Failed. If-Match is checked on the row read with
+SELECT ... FOR UPDATE in the transaction saving it, so two writers
+holding the same ETag cannot both pass. The validators of an update's
+response are those of the instance it saved. alist() and aretrieve()
+answer the same conditional GETs on the async read path, through
+aaggregate() and aget().
+"""
+import hashlib
+from datetime import datetime
+
+from django.db import transaction
+from django.db.models import Max, Count, Subquery
+from django.shortcuts import get_object_or_404, aget_object_or_404
+from django.utils.http import (
+    http_date, parse_etags, parse_http_date_safe, quote_etag
+)
+from rest_framework import status
+from rest_framework.response import Response
+
+from soft_desk_api.compression import identity_etag
+
+
+class Validators:
+    def __init__(self, etag, last_modified):
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def apply(self, response):
+        response['ETag'] = self.etag
+        if self.last_modified is not None:
+            response['Last-Modified'] = http_date(
+                self.last_modified.timestamp()
+            )
+        return response
+
+
+def build_validators(request, *values):
+    """
+    Hashes the state values together with what makes the representation
+    differ between requests: url, user and negotiated media type.
+    """
+    parts = [request.build_absolute_uri(), str(request.user.pk),
+             str(getattr(request, 'accepted_media_type', ''))]
+    parts += [value.isoformat() if isinstance(value, datetime) else str(value)
+              for value in values]
+    digest = hashlib.sha1('|'.join(parts).encode()).hexdigest()
+    dates = [value for value in values if isinstance(value, datetime)]
+    return Validators(quote_etag(digest), max(dates) if dates else None)
+
+
+def count_subquery(queryset, group_by):
+    """ COUNT(*) of a correlated queryset, usable in annotate() """
+    return Subquery(
+        queryset.order_by().values(group_by)
+        .annotate(total=Count('pk')).values('total')
+    )
+
+
+def latest_subquery(queryset, field='updated_at'):
+    return Subquery(queryset.order_by(f'-{field}').values(field)[:1])
+
+
+def etag_matches(header, etag, weak=True):
+    """
+    Weak comparison by default, for If-None-Match. If-Match requires the
+    strong comparison (RFC 9110 13.1.1): a weak ETag never matches. The
+    encoding suffix the compression adds is ignored either way, as the
+    validators describe the state of the resource, not its bytes.
+    """
+    etags = parse_etags(header)
+    if '*' in etags:
+        return True
+    etags = [identity_etag(value) for value in etags]
+    if weak:
+        etags = [value.removeprefix('W/') for value in etags]
+        return etag.removeprefix('W/') in etags
+    return not etag.startswith('W/') and etag in etags
+
+
+class ConditionalRequestMixin:
+    """
+    Requires a get_scoped_queryset() returning the permission-scoped
+    queryset of the viewset, without any query plan applied.
+    `validator_related` lists the relations the object permission
+    checks read, so they can be joined when loading the validators.
+    """
+    validator_related = []
+
+    def get_validator_annotations(self):
+        return {}
+
+    def get_validator_aggregates(self):
+        """ Extra aggregates of the collection validators """
+        return {}
+
+    def get_collection_state(self):
+        """ (queryset, aggregates) the collection validators read """
+        aggregates = self.get_validator_aggregates()
+        queryset = self.filter_queryset(self.get_scoped_queryset())
+        return queryset, {'last_modified': Max('updated_at'),
+                          'count': Count('pk'), **aggregates}
+
+    def collection_validators(self, state):
+        values = [state.pop('last_modified'), state.pop('count')]
+        values += [state[name] for name in sorted(state)]
+        validators = build_validators(self.request, *values)
+        validators.last_modified = None
+        return validators
+
+    def get_collection_validators(self):
+        queryset, aggregates = self.get_collection_state()
+        return self.collection_validators(queryset.aggregate(**aggregates))
+
+    async def aget_collection_validators(self):
+        queryset, aggregates = self.get_collection_state()
+        return self.collection_validators(
+            await queryset.aaggregate(**aggregates))
+
+    def get_object_state(self):
+        """
+        (queryset, lookup, names) of the object the validators read,
+        names being its annotations in validator order
+        """
+        annotations = self.get_validator_annotations()
+        queryset = self.get_scoped_queryset()
+        if self.validator_related:
+            queryset = queryset.select_related(*self.validator_related)
+        queryset = queryset.annotate(**annotations)
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        lookup = {self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        return queryset, lookup, sorted(annotations)
+
+    def object_validators(self, obj, names):
+        self.check_object_permissions(self.request, obj)
+        values = [obj.updated_at] + [getattr(obj, name) for name in names]
+        return build_validators(self.request, *values)
+
+    def get_object_validators(self, lock=False):
+        """ With lock, the row stays locked until the transaction ends """
+        queryset, lookup, names = self.get_object_state()
+        if lock:
+            queryset = queryset.select_for_update(of=('self',))
+        return self.object_validators(get_object_or_404(queryset, **lookup),
+                                      names)
+
+    async def aget_object_validators(self):
+        queryset, lookup, names = self.get_object_state()
+        return self.object_validators(
+            await aget_object_or_404(queryset, **lookup), names)
+
+    def not_modified(self, request, validators):
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            return etag_matches(if_none_match, validators.etag)
+        if_modified_since = parse_http_date_safe(
+            request.headers.get('If-Modified-Since')
+        )
+        if if_modified_since is None or validators.last_modified is None:
+            return False
+        return int(validators.last_modified.timestamp()) <= if_modified_since
+
+    def conditional_response(self, handler, validators, request,
+                             *args, **kwargs):
+        if self.not_modified(request, validators):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            return validators.apply(response)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            validators.apply(response)
+        return response
+
+    async def aconditional_response(self, handler, validators, request,
+                                    *args, **kwargs):
+        if self.not_modified(request, validators):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            return validators.apply(response)
+        response = await handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            validators.apply(response)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, self.get_collection_validators(),
+            request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, self.get_object_validators(),
+            request, *args, **kwargs
+        )
+
+    async def alist(self, request, *args, **kwargs):
+        return await self.aconditional_response(
+            super().alist, await self.aget_collection_validators(),
+            request, *args, **kwargs
+        )
+
+    async def aretrieve(self, request, *args, **kwargs):
+        return await self.aconditional_response(
+            super().aretrieve, await self.aget_object_validators(),
+            request, *args, **kwargs
+        )
+
+    def saved_validators(self, instance):
+        """
+        Validators of instance as perform_update() saved it. Its
+        annotations are read by primary key: the update may have moved
+        it out of the queryset of the url.
+        """
+        annotations = self.get_validator_annotations()
+        names = sorted(annotations)
+        values = [instance.updated_at]
+        if names:
+            values += type(instance)._default_manager.filter(
+                pk=instance.pk).annotate(**annotations).values_list(
+                *names).get()
+        return build_validators(self.request, *values)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.updated_instance = serializer.instance
+
+    def update(self, request, *args, **kwargs):
+        self.updated_instance = None
+        if_match = request.headers.get('If-Match')
+        if if_match is None:
+            response = super().update(request, *args, **kwargs)
+        else:
+            with transaction.atomic():
+                validators = self.get_object_validators(lock=True)
+                if not etag_matches(if_match, validators.etag, weak=False):
+                    data = {'detail': 'The resource has been modified.'}
+                    return Response(
+                        data, status=status.HTTP_412_PRECONDITION_FAILED)
+                response = super().update(request, *args, **kwargs)
+        if (response.status_code == status.HTTP_200_OK
+                and self.updated_instance is not None):
+            self.saved_validators(self.updated_instance).apply(response)
+        return response
@@ -0,0 +1,150 @@
+"""
+Set-based contributor management.
+
+Usernames are resolved with one IN query, memberships are written with a
+single bulk_create and removed with a single filtered delete, all inside
+one transaction. Neither sends signals: what the Contributor handlers of
+soft_desk_api.signals do per row (unassigning the issues, writing the
+tombstones) is done once for all the rows, so the queries do not grow
+with the number of usernames. Every function returns a
+{username: result} mapping. The project author always stays a
+contributor.
+"""
+from django.db import transaction
+from django.db.models.functions import Now
+
+from custom_auth.models import User
+from soft_desk_api import events
+from soft_desk_api.deletion import delete_rows
+from soft_desk_api.models import Contributor, Issue, Tombstone
+from soft_desk_api.signals import contributors_changed
+
+ADDED = 'added'
+REMOVED = 'removed'
+ALREADY_CONTRIBUTOR = 'already a contributor'
+NOT_CONTRIBUTOR = 'not a contributor'
+PROJECT_AUTHOR = 'project author'
+UNKNOWN_USER = 'not a user'
+
+
+def resolve_users(usernames):
+    """ Returns {username: user_id} for the usernames that exist """
+    return dict(
+        User.objects.filter(username__in=set(usernames),
+                            deletion_requested_at=None)
+        .values_list('username', 'id')
+    )
+
+
+def get_member_ids(project):
+    return set(
+        Contributor.objects.filter(project=project)
+        .values_list('user_id', flat=True)
+    )
+
+
+def add_contributors(project, usernames):
+    with transaction.atomic():
+        user_ids = resolve_users(usernames)
+        member_ids = get_member_ids(project)
+        results = {}
+        new_ids = set()
+        for username in usernames:
+            user_id = user_ids.get(username)
+            if user_id is None:
+                results[username] = UNKNOWN_USER
+            elif user_id in member_ids:
+                results[username] = ALREADY_CONTRIBUTOR
+            else:
+                results[username] = ADDED
+                new_ids.add(user_id)
+        _create_memberships(project, new_ids)
+    return results
+
+
+def remove_contributors(project, usernames):
+    with transaction.atomic():
+        user_ids = resolve_users(usernames)
+        member_ids = get_member_ids(project)
+        results = {}
+        removed_ids = set()
+        for username in usernames:
+            user_id = user_ids.get(username)
+            if user_id is None:
+                results[username] = UNKNOWN_USER
+            elif user_id == project.author_id:
+                results[username] = PROJECT_AUTHOR
+            elif user_id not in member_ids:
+                results[username] = NOT_CONTRIBUTOR
+            else:
+                results[username] = REMOVED
+                removed_ids.add(user_id)
+        _delete_memberships(project, removed_ids)
+    return results
+
+
+def sync_contributors(project, usernames):
+    """
+    Makes the listed users (plus the project author) the exact set of
+    contributors of project. Members left out are reported as removed.
+    """
+    with transaction.atomic():
+        user_ids = resolve_users(usernames)
+        member_ids = get_member_ids(project)
+        desired_ids = set(user_ids.values()) | {project.author_id}
+        results = {}
+        for username in usernames:
+            user_id = user_ids.get(username)
+            if user_id is None:
+                results[username] = UNKNOWN_USER
+            elif user_id in member_ids:
+                results[username] = ALREADY_CONTRIBUTOR
+            else:
+                results[username] = ADDED
+        removed_ids = member_ids - desired_ids
+        if removed_ids:
+            removed = User.objects.filter(pk__in=removed_ids).values_list(
+                'username', flat=True)
+            results.update((username, REMOVED) for username in removed)
+        _create_memberships(project, desired_ids - member_ids)
+        _delete_memberships(project, removed_ids)
+    return results
+
+
+def _create_memberships(project, user_ids):
+    if not user_ids:
+        return
+    Contributor.objects.bulk_create(
+        [Contributor(project=project, user_id=user_id)
+         for user_id in user_ids],
+        ignore_conflicts=True,
+    )
+    # bulk_create sends no post_save signal.
+    contributors_changed(project.pk, user_ids)
+    events.publish(project.pk, 'contributors', Contributor.objects.filter(
+        project=project, user_id__in=user_ids))
+
+
+def _delete_memberships(project, user_ids):
+    if not user_ids:
+        return
+    rows = list(Contributor.objects.filter(
+        project=project, user_id__in=user_ids).values_list('pk', 'user_id'))
+    pks = [pk for pk, user_id in rows]
+    # Ahead of the delete, as contributor_deleting() does: the SET_NULL
+    # would leave updated_at alone.
+    issue_ids = list(Issue.objects.filter(attribution_id__in=pks)
+                     .values_list('pk', flat=True))
+    if issue_ids:
+        Issue.objects.filter(pk__in=issue_ids).update(attribution=None,
+                                                      updated_at=Now())
+    delete_rows(Contributor, pks)
+    tombstones = Tombstone.objects.bulk_create([
+        Tombstone(project_id=project.pk, kind='contributor', object_id=pk,
+                  data={'user': user_id})
+        for pk, user_id in rows])
+    contributors_changed(project.pk, [user_id for pk, user_id in rows])
+    if issue_ids:
+        events.publish(project.pk, 'issues',
+                       Issue.objects.filter(pk__in=issue_ids))
+    events.publish(project.pk, 'deleted', tombstones)
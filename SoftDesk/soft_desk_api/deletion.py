@@ -0,0 +1,361 @@
+"""
+Deletion of users and projects in the background.
+
+Deleting a user or a project through the ORM makes Django's collector
+load every dependent row (issues, comments, contributors, through the
+CASCADE foreign keys) in memory and delete them in one transaction,
+sending a signal per row. Instead, request_user_deletion() and
+request_project_deletion() only mark the object pending deletion, which
+hides it from the api right away:
+    - projects with deletion_requested_at set are left out of
+      Project.objects.visible_to() and of the memberships, so their
+      issues, comments and search results go with them
+    - users with deletion_requested_at set are deactivated, so neither
+      their tokens nor their password authenticate any more
+and record a Deletion, which the purge_deletion job purges: dependent
+rows are deleted in BATCH_SIZE raw batches, one transaction each, with
+what their signal handlers would have done (tombstones, search index,
+counters, caches) done per batch. Once the dependents are gone the
+object itself is deleted through the ORM, which leaves little for the
+collector to do and sends its usual signals. Deletion.progress counts
+the rows deleted so far per table.
+
+A purge can be resumed from any point: a failed job is retried, and a
+Deletion whose claim was not renewed for CLAIM_TIMEOUT seconds is taken
+over by the next run, of the job or of `python manage.py purge_deletions`.
+Every batch renews the claim in its transaction, and rolls back if
+another worker took the Deletion over in the meantime, so a long purge
+keeps its claim and two workers never purge the same Deletion at once.
+
+Configured through the SOFT_DESK_DELETION setting:
+    BATCH_SIZE    - rows deleted per transaction
+    CLAIM_TIMEOUT - seconds without a batch before a purge is taken over
+"""
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Q
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from custom_auth.models import User
+from soft_desk_api.models import (
+    Comment, Contributor, Deletion, Issue, Project, Tombstone
+)
+from soft_desk_api.membership import invalidate_membership
+from soft_desk_api import (
+    events, jobs, response_cache, search, stats as project_stats
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BATCH_SIZE': 1000,
+    'CLAIM_TIMEOUT': 600,
+}
+
+stats = Counter()
+purged_rows = Counter()
+
+
+def get_setting(name):
+    return getattr(settings, 'SOFT_DESK_DELETION', {}).get(
+        name, DEFAULTS[name])
+
+
+class ClaimLost(Exception):
+    """ Another worker took over the Deletion being purged """
+
+
+def members_changed(project_ids):
+    """ Invalidates what the members of project_ids may see """
+    user_ids = set(Contributor.objects.filter(
+        project_id__in=project_ids).values_list('user_id', flat=True))
+    user_ids.update(Project.objects.filter(
+        pk__in=project_ids).values_list('author_id', flat=True))
+    invalidate_membership(*user_ids)
+    response_cache.invalidate_users(*user_ids)
+    response_cache.invalidate_projects(*project_ids,
+                                       response_cache.PROJECT_LIST)
+    events.memberships_changed(user_ids)
+
+
+def request_project_deletion(project):
+    """ Hides project and records its Deletion, returned """
+    with transaction.atomic():
+        Project.objects.filter(pk=project.pk).update(
+            deletion_requested_at=Now())
+        deletion = Deletion.objects.create(kind='project',
+                                           object_id=project.pk)
+        members_changed([project.pk])
+        jobs.enqueue('purge_deletion', deletion.pk)
+    stats['requested'] += 1
+    return deletion
+
+
+def request_user_deletion(user):
+    """
+    Deactivates user, hides the projects they authored and records the
+    Deletion of the account, returned.
+    """
+    with transaction.atomic():
+        user.is_active = False
+        user.deletion_requested_at = timezone.now()
+        user.save(update_fields=['is_active', 'deletion_requested_at'])
+        project_ids = list(Project.objects.filter(
+            author=user).values_list('pk', flat=True))
+        Project.objects.filter(pk__in=project_ids).update(
+            deletion_requested_at=Now())
+        deletion = Deletion.objects.create(kind='user', object_id=user.pk)
+        members_changed(project_ids)
+        jobs.enqueue('purge_deletion', deletion.pk)
+    stats['requested'] += 1
+    return deletion
+
+
+def delete_rows(model, pks):
+    """ Deletes the rows of pks, without loading them nor signals """
+    model.objects.filter(pk__in=pks)._raw_delete(
+        router.db_for_write(model))
+
+
+@contextmanager
+def claimed_transaction(deletion):
+    """
+    The transaction of a batch, starting by renewing the claim of
+    deletion: the row stays locked until it commits. Raises ClaimLost
+    when another worker claimed it since.
+    """
+    claimed_at = timezone.now()
+    with transaction.atomic():
+        if not Deletion.objects.filter(
+                pk=deletion.pk, claimed_at=deletion.claimed_at,
+                finished_at=None).update(claimed_at=claimed_at):
+            raise ClaimLost(deletion.pk)
+        yield
+    # Only once committed: a rolled back batch leaves the claim as it was.
+    deletion.claimed_at = claimed_at
+
+
+def record_progress(deletion, table, count):
+    if not count:
+        return
+    deletion.progress[table] = deletion.progress.get(table, 0) + count
+    Deletion.objects.filter(pk=deletion.pk).update(
+        progress=deletion.progress)
+    purged_rows[table] += count
+
+
+def purge_batches(deletion, table, select, delete, batch_size):
+    """
+    Calls delete(rows) on the rows select(batch_size) returns, in one
+    transaction each, until there are none left.
+    """
+    while True:
+        with claimed_transaction(deletion):
+            rows = select(batch_size)
+            if not rows:
+                return
+            delete(rows)
+            record_progress(deletion, table, len(rows))
+
+
+def purge_comments(deletion, queryset, batch_size, tombstones=True):
+    """
+    Deletes the comments of queryset, writing the tombstones and search
+    removals of comment_deleted(). Returns the ids of their projects.
+    """
+    project_ids = set()
+
+    def select(batch_size):
+        return list(queryset.order_by().values_list(
+            'pk', 'uuid', 'issue_id', 'issue__project_id')[:batch_size])
+
+    def delete(rows):
+        pks = [pk for pk, uuid, issue_id, project_id in rows]
+        delete_rows(Comment, pks)
+        search.remove('comment', pks)
+        if tombstones:
+            Tombstone.objects.bulk_create([
+                Tombstone(project_id=project_id, kind='comment',
+                          object_id=pk,
+                          data={'issue': issue_id, 'uuid': str(uuid)})
+                for pk, uuid, issue_id, project_id in rows])
+        project_ids.update(row[3] for row in rows)
+
+    purge_batches(deletion, 'comments', select, delete, batch_size)
+    return project_ids
+
+
+def purge_issues(deletion, queryset, batch_size, tombstones=True):
+    """
+    Deletes the issues of queryset, having no comment left, as
+    issue_deleted() would. Returns the ids of their projects.
+    """
+    project_ids = set()
+
+    def select(batch_size):
+        return list(queryset.order_by().values_list(
+            'pk', 'project_id')[:batch_size])
+
+    def delete(rows):
+        pks = [pk for pk, project_id in rows]
+        delete_rows(Issue, pks)
+        search.remove('issue', pks)
+        if tombstones:
+            Tombstone.objects.bulk_create([
+                Tombstone(project_id=project_id, kind='issue', object_id=pk)
+                for pk, project_id in rows])
+        project_ids.update(project_id for pk, project_id in rows)
+
+    purge_batches(deletion, 'issues', select, delete, batch_size)
+    return project_ids
+
+
+def purge_contributors(deletion, queryset, batch_size,
+                       tombstones=True):
+    """
+    Deletes the contributors of queryset, unassigning their issues
+    first as the SET_NULL foreign key would. Returns the ids of their
+    projects.
+    """
+    project_ids = set()
+
+    def select(batch_size):
+        return list(queryset.order_by().values_list(
+            'pk', 'project_id', 'user_id')[:batch_size])
+
+    def delete(rows):
+        pks = [pk for pk, project_id, user_id in rows]
+        Issue.objects.filter(attribution_id__in=pks).update(
+            attribution=None, updated_at=Now())
+        delete_rows(Contributor, pks)
+        if tombstones:
+            Tombstone.objects.bulk_create([
+                Tombstone(project_id=project_id, kind='contributor',
+                          object_id=pk, data={'user': user_id})
+                for pk, project_id, user_id in rows])
+        invalidate_membership(*{user_id for pk, project_id, user_id in rows})
+        project_ids.update(project_id for pk, project_id, user_id in rows)
+
+    purge_batches(deletion, 'contributors', select, delete, batch_size)
+    return project_ids
+
+
+def purge_project(deletion, project_id, batch_size):
+    """ Deletes the project project_id and everything it holds """
+    # The project goes, so do its tombstones: none are written.
+    purge_comments(deletion, Comment.objects.filter(
+        issue__project_id=project_id), batch_size, tombstones=False)
+    purge_issues(deletion, Issue.objects.filter(project_id=project_id),
+                 batch_size, tombstones=False)
+    purge_contributors(deletion, Contributor.objects.filter(
+        project_id=project_id), batch_size, tombstones=False)
+
+    def select(batch_size):
+        return list(Tombstone.objects.filter(project_id=project_id)
+                    .values_list('pk', flat=True)[:batch_size])
+
+    purge_batches(deletion, 'tombstones', select,
+                  lambda pks: delete_rows(Tombstone, pks), batch_size)
+    with claimed_transaction(deletion):
+        count, deleted = Project.objects.filter(pk=project_id).delete()
+        record_progress(deletion, 'projects',
+                        deleted.get(Project._meta.label, 0))
+
+
+def purge_user(deletion, user_id, batch_size):
+    """
+    Deletes the user user_id, the projects they authored, and their
+    issues, comments and memberships in the projects of others.
+    """
+    for project_id in Project.objects.filter(
+            author_id=user_id).values_list('pk', flat=True):
+        purge_project(deletion, project_id, batch_size)
+    # Two index lookups rather than one OR scanning the table.
+    changed = purge_comments(deletion, Comment.objects.filter(
+        author_id=user_id), batch_size)
+    changed |= purge_comments(deletion, Comment.objects.filter(
+        issue__author_id=user_id), batch_size)
+    changed |= purge_issues(deletion, Issue.objects.filter(
+        author_id=user_id), batch_size)
+    changed |= purge_contributors(deletion, Contributor.objects.filter(
+        user_id=user_id), batch_size)
+    if changed:
+        # Counters and comment counts of the projects that lost rows.
+        project_stats.reconcile(sorted(changed))
+        response_cache.invalidate_projects(*changed)
+    with claimed_transaction(deletion):
+        count, deleted = User.objects.filter(pk=user_id).delete()
+        record_progress(deletion, 'users', deleted.get(User._meta.label, 0))
+
+
+PURGES = {
+    'user': purge_user,
+    'project': purge_project,
+}
+
+
+def claim(deletion, claim_timeout):
+    """
+    Whether this worker took deletion over, unclaimed or not renewed for
+    claim_timeout seconds. Its claimed_at is then the one this worker
+    set, which claimed_transaction() expects to find.
+    """
+    claimed_at = timezone.now()
+    stale = claimed_at - timedelta(seconds=claim_timeout)
+    if not (Deletion.objects.filter(pk=deletion.pk, finished_at=None)
+            .filter(Q(claimed_at=None) | Q(claimed_at__lt=stale))
+            .update(claimed_at=claimed_at)):
+        return False
+    deletion.claimed_at = claimed_at
+    return True
+
+
+def purge(deletion, batch_size=None, claim_timeout=None):
+    """
+    Runs deletion to its end, unless another worker holds it. batch_size
+    and claim_timeout default to the BATCH_SIZE and CLAIM_TIMEOUT
+    settings.
+    """
+    if batch_size is None:
+        batch_size = get_setting('BATCH_SIZE')
+    if claim_timeout is None:
+        claim_timeout = get_setting('CLAIM_TIMEOUT')
+    if not claim(deletion, claim_timeout):
+        return False
+    try:
+        PURGES[deletion.kind](deletion, deletion.object_id, batch_size)
+    except ClaimLost:
+        # The worker that took it over finishes it.
+        logger.warning('Purge of %s taken over', deletion)
+        stats['taken_over'] += 1
+        return False
+    except Exception as e:
+        logger.exception('Purge of %s failed', deletion)
+        # Released, the next worker resumes it.
+        Deletion.objects.filter(
+            pk=deletion.pk, claimed_at=deletion.claimed_at).update(
+            claimed_at=None, error=repr(e))
+        stats['failed'] += 1
+        raise
+    Deletion.objects.filter(pk=deletion.pk).update(finished_at=Now(),
+                                                   error='')
+    stats['finished'] += 1
+    return True
+
+
+def purge_pending(batch_size=None, claim_timeout=None):
+    """ Purges the unfinished deletions, oldest first, see purge() """
+    purged = 0
+    for deletion in Deletion.objects.filter(
+            finished_at=None).order_by('requested_at'):
+        try:
+            purged += purge(deletion, batch_size, claim_timeout)
+        except Exception:
+            continue
+    return purged
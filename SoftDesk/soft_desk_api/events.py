@@ -0,0 +1,277 @@
+"""
+Server-Sent Events stream of the changes of the projects a user can see.
+
+GET /api/events/ (ASGI only, see SoftDesk/asgi.py) answers a
+text/event-stream kept open until the client disconnects, replacing the
+polling of the issue and comment lists. Its events are named after the
+streams of the changes feed (soft_desk_api.changes) and carry the same
+rows:
+    issues, comments, contributors - a row created or updated
+    deleted                        - the tombstone of a deleted row
+    ready, membership              - the ids of the projects streamed, on
+                                     connection and whenever they change
+    overflow                       - the last event before the server
+                                     closes a stream too slow to keep up
+?project= (repeatable) restricts the stream to some of the projects.
+Events are not replayed: a client reconnecting catches up with
+/api/projects/<id>/changes/?updated_since= from the last row it got.
+
+The signal handlers of soft_desk_api.signals (and the bulk writes)
+publish the events once their transaction commits, unless no stream
+listens to the project. The rows are serialized then, once per event
+whatever the number of streams, and handed to the backend:
+    BACKEND - dotted path of the class fanning the events out to the
+              streams, LocalBackend by default, which reaches the
+              streams of the current process only. A backend reaching
+              the other processes (Redis pub/sub, PostgreSQL NOTIFY)
+              implements the same listening(), subscribe(),
+              unsubscribe() and publish().
+Each stream queues up to QUEUE_SIZE events for its client; once full,
+the queued events are dropped for an overflow event and the stream ends,
+so a slow client never holds memory nor slows the publishers down. A
+comment line is sent after HEARTBEAT idle seconds, which keeps proxies
+from closing the connection and the server noticing the clients gone.
+RETRY is the reconnection delay, in milliseconds, sent to the clients.
+"""
+import asyncio
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import QuerySet
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import APIException, NotAuthenticated
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from soft_desk_api.async_views import authenticate
+from soft_desk_api.changes import STREAMS
+from soft_desk_api.membership import aload_membership, to_project_id
+from soft_desk_api.renderers import dumps
+
+DEFAULTS = {
+    'BACKEND': 'soft_desk_api.events.LocalBackend',
+    'QUEUE_SIZE': 256,
+    'HEARTBEAT': 15,
+    'RETRY': 3000,
+}
+HEARTBEAT = b': heartbeat\n\n'
+
+stats = Counter()
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_setting(name):
+    return getattr(settings, 'SOFT_DESK_EVENTS', {}).get(
+        name, DEFAULTS[name])
+
+
+def get_backend():
+    """ The backend of the process, created on first use """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = import_string(get_setting('BACKEND'))()
+    return _backend
+
+
+def project_channel(project_id):
+    return f'project:{int(project_id)}'
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def encode(name, data):
+    """ The bytes of the event name, data encoded as JSON """
+    return b'event: %s\ndata: %s\n\n' % (name.encode(), dumps(data))
+
+
+class LocalBackend:
+    """
+    Fans the events published in this process out to the subscriptions
+    of this process.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = defaultdict(set)
+
+    def listening(self, channel):
+        return bool(self.subscriptions.get(channel))
+
+    def subscribe(self, subscription, channels):
+        with self.lock:
+            for channel in channels:
+                self.subscriptions[channel].add(subscription)
+
+    def unsubscribe(self, subscription, channels):
+        with self.lock:
+            for channel in channels:
+                subscriptions = self.subscriptions.get(channel)
+                if subscriptions is None:
+                    continue
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.subscriptions[channel]
+
+    def publish(self, channel, message):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.deliver(message)
+
+
+class Subscription:
+    """
+    The (name, bytes) messages of one stream, queued on the event loop
+    serving it, at most size of them.
+    """
+    def __init__(self, loop, size):
+        self.loop = loop
+        self.queue = asyncio.Queue(size)
+        self.overflowed = False
+
+    def deliver(self, message):
+        """ Queues message, from any thread """
+        try:
+            self.loop.call_soon_threadsafe(self.put, message)
+        except RuntimeError:
+            # The loop is closed, and the stream with it.
+            pass
+
+    def put(self, message):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            stats['overflowed'] += 1
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(('overflow', encode('overflow', {})))
+
+
+def publish(project_id, name, rows):
+    """
+    Publishes an event name per row of rows (instances, or a queryset
+    read then) to the streams of project_id, once the current
+    transaction commits.
+    """
+    channel = project_channel(project_id)
+    if not get_backend().listening(channel):
+        return
+    stream = next(stream for stream in STREAMS if stream.name == name)
+
+    def send():
+        instances = rows
+        if isinstance(instances, QuerySet):
+            instances = instances.select_related(*stream.related)
+        backend = get_backend()
+        for data in stream.serializer_class(instances, many=True).data:
+            backend.publish(channel, (name, encode(name, data)))
+            stats['published'] += 1
+
+    transaction.on_commit(send, robust=True)
+
+
+def memberships_changed(user_ids):
+    """ Has the streams of user_ids reload the projects they stream """
+    channels = [user_channel(user_id) for user_id in user_ids
+                if get_backend().listening(user_channel(user_id))]
+    if not channels:
+        return
+
+    def send():
+        backend = get_backend()
+        for channel in channels:
+            backend.publish(channel, ('membership', b''))
+
+    transaction.on_commit(send, robust=True)
+
+
+async def stream(user, requested=None):
+    """
+    The events of the projects user can see, of those in requested if
+    given, until the client disconnects.
+    """
+    backend = get_backend()
+    subscription = Subscription(asyncio.get_running_loop(),
+                                get_setting('QUEUE_SIZE'))
+    channels = set()
+
+    async def subscribe():
+        nonlocal channels
+        membership = await aload_membership(user)
+        project_ids = membership.visible
+        if requested is not None:
+            project_ids = project_ids & requested
+        wanted = {user_channel(user.pk)}
+        wanted.update(project_channel(pk) for pk in project_ids)
+        backend.subscribe(subscription, wanted - channels)
+        backend.unsubscribe(subscription, channels - wanted)
+        channels = wanted
+        return sorted(project_ids)
+
+    stats['opened'] += 1
+    try:
+        projects = await subscribe()
+        yield (b'retry: %d\n' % get_setting('RETRY')
+               + encode('ready', {'projects': projects}))
+        heartbeat = get_setting('HEARTBEAT')
+        while True:
+            try:
+                name, message = await asyncio.wait_for(
+                    subscription.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield HEARTBEAT
+                continue
+            if name == 'membership':
+                message = encode(name, {'projects': await subscribe()})
+            yield message
+            stats['delivered'] += 1
+            if name == 'overflow':
+                return
+    finally:
+        backend.unsubscribe(subscription, channels)
+        stats['closed'] += 1
+
+
+def error_response(exc):
+    return JsonResponse({'detail': exc.detail}, status=exc.status_code)
+
+
+async def events_view(request):
+    if not isinstance(request, ASGIRequest):
+        # A WSGI worker would be held for the whole connection.
+        return JsonResponse({'detail': 'Only served under ASGI.'},
+                            status=501)
+    drf_request = Request(request, authenticators=[
+        authenticator() for authenticator
+        in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        await authenticate(drf_request)
+    except APIException as exc:
+        return error_response(exc)
+    user = drf_request.user
+    if not user.is_authenticated:
+        return error_response(NotAuthenticated())
+    requested = None
+    if 'project' in request.GET:
+        requested = {to_project_id(value)
+                     for value in request.GET.getlist('project')}
+        if None in requested:
+            return JsonResponse({'project': ['Expected project ids.']},
+                                status=400)
+    response = StreamingHttpResponse(stream(user, requested),
+                                     content_type='text/event-stream')
+    # no-transform keeps CompressionMiddleware from buffering events.
+    response['Cache-Control'] = 'no-cache, no-transform'
+    response['X-Accel-Buffering'] = 'no'
+    return response
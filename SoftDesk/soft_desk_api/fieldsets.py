@@ -0,0 +1,317 @@
+"""
+JSON:API style sparse fieldsets and includes for the read endpoints.
+
+    ?fields[issue]=id,name,status     only serialize these issue fields
+    ?include=issues,issues.comments   nest these relations in the response
+
+Fieldsets apply to every object of that type in the response, whether it
+is the requested resource or an included one. Without ?include= the
+serializers keep their default relations; with it, exactly the listed
+relations are nested, whatever the fieldset of their parent.
+
+Both parameters drive the query plan as well: the requested fields
+become the only() columns (plus the ones permission checks need) and
+the includes become the prefetches, so unrequested columns and
+relations are never loaded.
+"""
+import re
+
+from django.db.models import Prefetch
+from django.db.models.constants import LOOKUP_SEP
+from rest_framework.exceptions import ValidationError
+
+from soft_desk_api.models import Project, Issue, Comment, Contributor
+
+FIELDS_PARAM = re.compile(r'^fields\[(\w+)\]$')
+INCLUDE_PARAM = 'include'
+INCLUDED_COMMENTS = 20
+
+
+class Resource:
+    """
+    How the serializer fields of a resource type map to the database.
+    `required` columns are always loaded, `related` maps a serializer field
+    to the select_related paths and columns it reads.
+    """
+    def __init__(self, model, fields, required, related=None):
+        self.model = model
+        self.fields = fields
+        self.required = required
+        self.related = related or {}
+
+    def get_plan(self, fieldset=None, required=()):
+        """
+        (select_related, only) loading the fields of fieldset, or every
+        field, and the required columns.
+        """
+        select_related = []
+        only = list(self.required) + list(required)
+        for name in self.fields if fieldset is None else fieldset:
+            if name in self.related:
+                paths, columns = self.related[name]
+                select_related += paths
+                only += columns
+            elif name in self.concrete_fields:
+                only.append(name)
+        select_related += [column.rsplit('__', 1)[0] for column in only
+                           if '__' in column]
+        return list(dict.fromkeys(select_related)), only
+
+    @property
+    def concrete_fields(self):
+        return {field.name for field in self.model._meta.concrete_fields}
+
+
+RESOURCES = {
+    'project': Resource(
+        Project,
+        fields=['id', 'name', 'author', 'description', 'project_type',
+                'created_at', 'updated_at', 'issues', 'contributors',
+                'stats'],
+        required=['id', 'author'],
+        related={
+            'author': (['author'], ['author__id', 'author__username']),
+            'stats': (['stats'], ['stats']),
+        },
+    ),
+    'issue': Resource(
+        Issue,
+        fields=['id', 'name', 'description', 'status', 'priority', 'flag',
+                'attribution', 'author', 'project', 'comment_count',
+                'created_at', 'updated_at', 'comments'],
+        required=['id', 'project', 'author'],
+        related={
+            'author': (['author'], ['author__id', 'author__username']),
+            'attribution': (
+                ['attribution__user', 'attribution__project'],
+                ['attribution__id', 'attribution__user__id',
+                 'attribution__user__username', 'attribution__project__id',
+                 'attribution__project__name'],
+            ),
+        },
+    ),
+    'comment': Resource(
+        Comment,
+        fields=['id', 'uuid', 'issue', 'author', 'description',
+                'created_at', 'updated_at'],
+        required=['id', 'author', 'issue'],
+        related={
+            'author': (['author'], ['author__id', 'author__username']),
+        },
+    ),
+    'contributor': Resource(
+        Contributor,
+        fields=['username'],
+        required=['id', 'project', 'user'],
+        related={
+            'username': (['user'], ['user__id', 'user__username']),
+        },
+    ),
+}
+
+
+class Include:
+    """
+    A relation that can be nested with ?include=: the related name to
+    prefetch, the queryset to prefetch it from and the attribute the
+    serializers read it from.
+    """
+    def __init__(self, resource_type, lookup, to_attr, queryset=None,
+                 limit=None):
+        self.resource_type = resource_type
+        self.lookup = lookup
+        self.to_attr = to_attr
+        self.queryset = queryset
+        self.limit = limit
+
+    def get_queryset(self):
+        if self.queryset is None:
+            return RESOURCES[self.resource_type].model._default_manager.all()
+        return self.queryset.all()
+
+
+def get_fieldsets(request):
+    """
+    {type: [field, ...]} from the fields[type] query parameters.
+    Unknown types and fields are answered with 400 Bad Request.
+    """
+    fieldsets = {}
+    errors = {}
+    for param, value in request.query_params.items():
+        match = FIELDS_PARAM.match(param)
+        if match is None:
+            continue
+        resource_type = match.group(1)
+        if resource_type not in RESOURCES:
+            errors[param] = [f"Unknown type '{resource_type}'."]
+            continue
+        names = [name.strip() for name in value.split(',') if name.strip()]
+        allowed = RESOURCES[resource_type].fields
+        unknown = [name for name in names if name not in allowed]
+        if unknown:
+            errors[param] = [f"Unknown field(s): {', '.join(unknown)}."]
+        else:
+            fieldsets[resource_type] = names
+    if errors:
+        raise ValidationError(errors)
+    return fieldsets
+
+
+def get_includes(request, allowed):
+    """
+    The set of ?include= paths, None when the parameter is absent.
+    Including 'a.b' includes 'a' too.
+    """
+    value = request.query_params.get(INCLUDE_PARAM)
+    if value is None:
+        return None
+    paths = {path.strip() for path in value.split(',') if path.strip()}
+    unknown = sorted(paths - set(allowed))
+    if unknown:
+        message = f"Cannot include: {', '.join(unknown)}."
+        if allowed:
+            message += f" Expected one of: {', '.join(allowed)}."
+        raise ValidationError({INCLUDE_PARAM: [message]})
+    for path in list(paths):
+        parts = path.split('.')
+        paths.update('.'.join(parts[:index])
+                     for index in range(1, len(parts)))
+    return paths
+
+
+def get_prefetches(includes, declared, fieldsets, prefix=''):
+    """
+    Prefetch objects loading the included relations directly under
+    prefix, each one restricted to the fields of its type and carrying
+    the prefetches of the relations included below it.
+    """
+    prefetches = []
+    for path, include in declared.items():
+        parent, _, name = path.rpartition('.')
+        if parent != prefix or path not in includes:
+            continue
+        select_related, only = RESOURCES[include.resource_type].get_plan(
+            fieldsets.get(include.resource_type))
+        queryset = include.get_queryset().only(*only)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        nested = get_prefetches(includes, declared, fieldsets, path)
+        if nested:
+            queryset = queryset.prefetch_related(*nested)
+        if include.limit is not None:
+            queryset = queryset[:include.limit]
+        prefetches.append(Prefetch(include.lookup, queryset=queryset,
+                                   to_attr=include.to_attr))
+    return prefetches
+
+
+def prefetch_field(lookup):
+    """ The name of the relation a prefetch lookup starts from """
+    if isinstance(lookup, Prefetch):
+        lookup = lookup.prefetch_through
+    return lookup.split(LOOKUP_SEP)[0]
+
+
+def get_include_path(serializer):
+    """ Dotted path of the field a nested serializer is bound to """
+    names = []
+    node = serializer
+    while node.parent is not None:
+        if node.field_name:
+            names.append(node.field_name)
+        node = node.parent
+    return '.'.join(reversed(names))
+
+
+class SparseFieldsMixin:
+    """
+    Serializer side of the fieldsets: swaps the relations listed in
+    `includes` ({name: factory of the nested field}) for the ones asked
+    for in context['include'], and drops the other fields missing from
+    context['fieldsets'][resource_type].
+    """
+    resource_type = None
+    includes = {}
+
+    def get_fieldset(self, resource_type):
+        """ The requested fields of resource_type, None for all of them """
+        return self.context.get('fieldsets', {}).get(resource_type)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        included = self.context.get('include')
+        nested = []
+        if included is not None:
+            path = get_include_path(self)
+            for name, factory in self.includes.items():
+                fields.pop(name, None)
+                if f'{path}.{name}'.lstrip('.') in included:
+                    fields[name] = factory()
+                    nested.append(name)
+        fieldset = self.get_fieldset(self.resource_type)
+        if fieldset is not None:
+            fields = {name: field for name, field in fields.items()
+                      if name in fieldset or name in nested}
+        return fields
+
+
+class SparseFieldsetsMixin:
+    """
+    View side of the fieldsets, for viewsets using QueryPlanMixin.
+    `resource_type` is the type of the viewset's objects and `includes`
+    declares the relations ({path: Include}) its responses can nest.
+    `fieldset_required` maps actions to the extra columns their object
+    permission checks read. Fieldsets apply to the `sparse_actions` and
+    includes to the `include_actions`, elsewhere ?include= is rejected.
+    """
+    resource_type = None
+    includes = {}
+    fieldset_required = {}
+    sparse_actions = ['list', 'retrieve']
+    include_actions = ['list', 'retrieve']
+
+    def get_sparse_request(self):
+        """ (fieldsets, includes), parsed once per request """
+        if not hasattr(self, '_sparse_request'):
+            if self.action in self.sparse_actions:
+                allowed = (list(self.includes)
+                           if self.action in self.include_actions else [])
+                self._sparse_request = (
+                    get_fieldsets(self.request),
+                    get_includes(self.request, allowed),
+                )
+            else:
+                self._sparse_request = ({}, None)
+        return self._sparse_request
+
+    def is_included(self, path):
+        """ Whether the response nests the relation at path """
+        includes = self.get_sparse_request()[1]
+        return includes is not None and path in includes
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        fieldsets, includes = self.get_sparse_request()
+        context['fieldsets'] = fieldsets
+        context['include'] = includes
+        return context
+
+    def get_query_plan(self, action=None):
+        plan = super().get_query_plan(action)
+        fieldsets, includes = self.get_sparse_request()
+        fieldset = fieldsets.get(self.resource_type)
+        if fieldset is None and includes is None:
+            return plan
+        plan = dict(plan)
+        if fieldset is not None:
+            resource = RESOURCES[self.resource_type]
+            plan['select_related'], plan['only'] = resource.get_plan(
+                fieldset, self.fieldset_required.get(self.action, []))
+            plan['prefetch_related'] = [
+                lookup for lookup in plan.get('prefetch_related', [])
+                if prefetch_field(lookup) in fieldset
+            ]
+        if includes is not None:
+            plan['prefetch_related'] = get_prefetches(
+                includes, self.includes, fieldsets)
+        return plan
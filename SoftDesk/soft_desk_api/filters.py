@@ -0,0 +1,105 @@
+"""
+Query parameter filtering of the issue lists.
+
+Every filter is a plain column comparison on soft_desk_api_issue, so that
+the combinations used by triage boards are answered by the composite
+indexes declared in Issue.Meta rather than by scanning a project.
+"""
+from datetime import datetime, time
+
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.timezone import is_naive, make_aware
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from custom_auth.models import User
+from soft_desk_api.models import Contributor, Issue
+
+CURRENT_USER = 'me'
+NOBODY = 'none'
+
+
+def parse_timestamp(value):
+    """ An aware datetime from an ISO 8601 date or datetime, or None """
+    try:
+        timestamp = parse_datetime(value)
+        date = parse_date(value) if timestamp is None else None
+    except ValueError:
+        return None
+    if timestamp is None:
+        if date is None:
+            return None
+        timestamp = datetime.combine(date, time.min)
+    return make_aware(timestamp) if is_naive(timestamp) else timestamp
+
+
+class IssueFilterBackend(BaseFilterBackend):
+    """
+    ?status=, ?priority=, ?flag=    comma separated choices
+    ?author=, ?attribution=         a username or 'me', and 'none' for
+                                    unassigned issues
+    ?created_after=, ?created_before=, ?updated_after=, ?updated_before=
+                                    ISO 8601 dates or datetimes, after is
+                                    inclusive and before exclusive
+    Invalid values are answered with 400 Bad Request.
+    """
+    choice_filters = {
+        'status': Issue.STATUS_CHOICES,
+        'priority': Issue.PRIORITY_CHOICES,
+        'flag': Issue.FLAG_CHOICES,
+    }
+    range_filters = {
+        'created_after': 'created_at__gte',
+        'created_before': 'created_at__lt',
+        'updated_after': 'updated_at__gte',
+        'updated_before': 'updated_at__lt',
+    }
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        filters = {}
+        errors = {}
+        for name, choices in self.choice_filters.items():
+            if name not in params:
+                continue
+            values = [value.strip() for value in params[name].split(',')
+                      if value.strip()]
+            allowed = [choice for choice, _ in choices]
+            invalid = [value for value in values if value not in allowed]
+            if invalid or not values:
+                errors[name] = [f"Expected one of: {', '.join(allowed)}."]
+            else:
+                filters[f'{name}__in'] = values
+        for name, lookup in self.range_filters.items():
+            if name not in params:
+                continue
+            timestamp = parse_timestamp(params[name])
+            if timestamp is None:
+                errors[name] = ['Expected an ISO 8601 date or datetime.']
+            else:
+                filters[lookup] = timestamp
+        if 'author' in params:
+            filters.update(self.author_filter(request, params['author']))
+        if 'attribution' in params:
+            filters.update(self.attribution_filter(
+                request, view, params['attribution']))
+        if errors:
+            raise ValidationError(errors)
+        return queryset.filter(**filters)
+
+    def author_filter(self, request, value):
+        if value == CURRENT_USER:
+            return {'author_id': request.user.pk}
+        return {'author_id__in':
+                User.objects.filter(username=value).values('pk')}
+
+    def attribution_filter(self, request, view, value):
+        if value == NOBODY:
+            return {'attribution__isnull': True}
+        members = Contributor.objects.filter(
+            project_id=view.kwargs['project_pk'])
+        if value == CURRENT_USER:
+            members = members.filter(user_id=request.user.pk)
+        else:
+            members = members.filter(user__username=value)
+        return {'attribution_id__in': members.values('pk')}
@@ -0,0 +1,434 @@
+"""
+Per-request database and serializer instrumentation.
+
+QueryMetricsMiddleware records, for every request, the number of queries,
+the total SQL time, the slowest statements and (through
+InstrumentedViewMixin) the time spent serializing. Requests are tagged with
+the viewset action that handled them, e.g. 'IssueViewset.list'.
+
+The figures are sent back in a Server-Timing header (under DEBUG or to
+staff users only, since they tell about the server), aggregated per
+endpoint for the Prometheus-text metrics_view, and checked against
+SOFT_DESK_QUERY_BUDGETS ({endpoint: max queries}). An exceeded budget is
+logged, or raises QueryBudgetExceeded when SOFT_DESK_QUERY_BUDGET_MODE is
+'raise', which makes N+1 regressions fail the test suite.
+
+Under ASGI the queries of a request run in the threads sync_to_async
+hands them to, so instead of wrapping the connections of the current
+thread the middleware publishes the request's metrics in a context
+variable, which forward_to_current_metrics(), installed on every new
+connection, records into.
+
+The body of a streaming response (the exports) runs its queries while
+it is consumed, after the view returned: its iterator is wrapped so that
+they are counted until the stream closes, when the request is recorded
+and checked against its budget. Its Server-Timing header, sent before
+the body, is left out.
+"""
+import hmac
+import logging
+import threading
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.functional import LazyObject
+
+from custom_auth import hashing, user_cache
+from soft_desk_api import deletion, events, jobs, response_cache
+
+logger = logging.getLogger(__name__)
+
+SLOWEST_STATEMENTS = 5
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+REQUEST_ATTRIBUTE = 'soft_desk_metrics'
+
+current_metrics = ContextVar('soft_desk_metrics', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.endpoint = None
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.duration = 0.0
+        self.statements = []
+        self.start = time.perf_counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.sql_time += elapsed
+            self.statements.append((elapsed, sql))
+            if len(self.statements) > SLOWEST_STATEMENTS:
+                self.statements.sort(key=lambda item: -item[0])
+                del self.statements[SLOWEST_STATEMENTS:]
+
+    @property
+    def slowest(self):
+        return sorted(self.statements, key=lambda item: -item[0])
+
+    def server_timing(self):
+        return ', '.join([
+            f'db;dur={self.sql_time * 1000:.2f};'
+            f'desc="{self.queries} queries"',
+            f'serializer;dur={self.serializer_time * 1000:.2f}',
+            f'total;dur={self.duration * 1000:.2f}',
+        ])
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.duration_sum = 0.0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.budget_exceeded = 0
+
+
+class Registry:
+    """ Thread-safe per-endpoint aggregate of RequestMetrics """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def record(self, metrics, budget_exceeded=False):
+        with self.lock:
+            stats = self.endpoints.setdefault(metrics.endpoint,
+                                              EndpointStats())
+            stats.requests += 1
+            stats.queries += metrics.queries
+            stats.sql_time += metrics.sql_time
+            stats.serializer_time += metrics.serializer_time
+            stats.duration_sum += metrics.duration
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if metrics.duration <= bound:
+                    stats.buckets[index] += 1
+            stats.budget_exceeded += int(budget_exceeded)
+
+    def reset(self):
+        with self.lock:
+            self.endpoints = {}
+
+
+registry = Registry()
+
+
+def get_endpoint(request):
+    """ Viewset action ('IssueViewset.list'), url name or path """
+    match = request.resolver_match
+    if match is None:
+        return 'unresolved'
+    cls = getattr(match.func, 'cls', None)
+    actions = getattr(match.func, 'actions', None)
+    if cls is not None and actions:
+        action = actions.get(request.method.lower(), request.method.lower())
+        return f'{cls.__name__}.{action}'
+    if cls is not None:
+        return f'{cls.__name__}.{request.method.lower()}'
+    return match.view_name or request.path
+
+
+def get_budget(endpoint):
+    return getattr(settings, 'SOFT_DESK_QUERY_BUDGETS', {}).get(endpoint)
+
+
+def check_budget(metrics):
+    budget = get_budget(metrics.endpoint)
+    if budget is None or metrics.queries <= budget:
+        return False
+    message = (
+        f'{metrics.endpoint} ran {metrics.queries} queries '
+        f'(budget {budget}). Slowest: '
+        + ' | '.join(f'{elapsed * 1000:.1f}ms {sql[:200]}'
+                     for elapsed, sql in metrics.slowest)
+    )
+    if getattr(settings, 'SOFT_DESK_QUERY_BUDGET_MODE', 'log') == 'raise':
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+    return True
+
+
+def shows_server_timing(request):
+    """ Under DEBUG, or for staff users authenticated by the api """
+    if settings.DEBUG:
+        return True
+    user = getattr(request, 'user', None)
+    # Still lazy when no api view authenticated the request: resolving it
+    # would query the session, which the async path cannot do here.
+    if user is None or isinstance(user, LazyObject):
+        return False
+    return user.is_staff
+
+
+def forward_to_current_metrics(execute, sql, params, many, context):
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def install_metrics_wrapper(sender, connection, **kwargs):
+    # First in the list: execute_wrapper() pops the last one on exit.
+    if forward_to_current_metrics not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, forward_to_current_metrics)
+
+
+class QueryMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            connection_created.connect(install_metrics_wrapper)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = self.start(request)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(metrics))
+            response = self.get_response(request)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = self.start(request)
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    def start(self, request):
+        metrics = RequestMetrics()
+        setattr(request, REQUEST_ATTRIBUTE, metrics)
+        return metrics
+
+    def finish(self, request, response, metrics):
+        if metrics.endpoint is None:
+            metrics.endpoint = get_endpoint(request)
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self.acount_stream(
+                    response.streaming_content, metrics)
+            else:
+                response.streaming_content = self.count_stream(
+                    response.streaming_content, metrics)
+            return response
+        metrics.duration = time.perf_counter() - metrics.start
+        if shows_server_timing(request):
+            response['Server-Timing'] = metrics.server_timing()
+        self.record(metrics)
+        return response
+
+    def count_stream(self, content, metrics):
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                yield from content
+        finally:
+            metrics.duration = time.perf_counter() - metrics.start
+            self.record(metrics)
+
+    async def acount_stream(self, content, metrics):
+        # The body is iterated by the task of the request, where
+        # forward_to_current_metrics() reads the context variable.
+        current_metrics.set(metrics)
+        try:
+            async for chunk in content:
+                yield chunk
+        finally:
+            if hasattr(content, 'aclose'):
+                await content.aclose()
+            current_metrics.set(None)
+            metrics.duration = time.perf_counter() - metrics.start
+            self.record(metrics)
+
+    def record(self, metrics):
+        exceeded = False
+        try:
+            exceeded = check_budget(metrics)
+        finally:
+            registry.record(metrics, budget_exceeded=exceeded)
+
+
+class InstrumentedViewMixin:
+    """
+    Tags the request with the viewset action and times serialization.
+    """
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        metrics = getattr(request._request, REQUEST_ATTRIBUTE, None)
+        if metrics is not None:
+            metrics.endpoint = f'{type(self).__name__}.{self.action}'
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        metrics = getattr(self.request._request, REQUEST_ATTRIBUTE, None)
+        if metrics is not None:
+            to_representation = serializer.to_representation
+
+            def timed_to_representation(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return to_representation(*args, **kwargs)
+                finally:
+                    metrics.serializer_time += time.perf_counter() - start
+
+            serializer.to_representation = timed_to_representation
+        return serializer
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def render_metrics():
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in samples:
+            label_text = ','.join(f'{key}="{escape_label(val)}"'
+                                  for key, val in labels.items())
+            if label_text:
+                lines.append(f'{name}{{{label_text}}} {value}')
+            else:
+                lines.append(f'{name} {value}')
+
+    with registry.lock:
+        endpoints = sorted(registry.endpoints.items())
+        per_endpoint = [({'endpoint': name}, stats)
+                        for name, stats in endpoints]
+        metric('soft_desk_requests_total', 'counter', 'Requests handled.',
+               [(labels, s.requests) for labels, s in per_endpoint])
+        metric('soft_desk_db_queries_total', 'counter', 'SQL queries run.',
+               [(labels, s.queries) for labels, s in per_endpoint])
+        metric('soft_desk_db_seconds_total', 'counter',
+               'Time spent running SQL.',
+               [(labels, f'{s.sql_time:.6f}') for labels, s in per_endpoint])
+        metric('soft_desk_serializer_seconds_total', 'counter',
+               'Time spent serializing.',
+               [(labels, f'{s.serializer_time:.6f}')
+                for labels, s in per_endpoint])
+        metric('soft_desk_query_budget_exceeded_total', 'counter',
+               'Requests that exceeded their query budget.',
+               [(labels, s.budget_exceeded) for labels, s in per_endpoint])
+        name = 'soft_desk_request_duration_seconds'
+        lines.append(f'# HELP {name} Request duration.')
+        lines.append(f'# TYPE {name} histogram')
+        for labels, stats in per_endpoint:
+            endpoint = escape_label(labels['endpoint'])
+            for bound, count in zip(DURATION_BUCKETS, stats.buckets):
+                lines.append(f'{name}_bucket{{endpoint="{endpoint}",'
+                             f'le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{endpoint="{endpoint}",'
+                         f'le="+Inf"}} {stats.requests}')
+            lines.append(f'{name}_sum{{endpoint="{endpoint}"}} '
+                         f'{stats.duration_sum:.6f}')
+            lines.append(f'{name}_count{{endpoint="{endpoint}"}} '
+                         f'{stats.requests}')
+    metric('soft_desk_response_cache_total', 'counter',
+           'Response cache lookups.',
+           [({'result': result}, count)
+            for result, count in sorted(response_cache.stats.items())])
+    metric('soft_desk_auth_cache_total', 'counter',
+           'Authenticated user cache lookups, evictions and invalidations.',
+           [({'result': result}, count)
+            for result, count in sorted(user_cache.stats.items())])
+    metric('soft_desk_auth_cache_users', 'gauge',
+           'Users held by the authenticated user cache.',
+           [({}, len(user_cache.user_cache))])
+    metric('soft_desk_deletions_total', 'counter',
+           'User and project deletions requested, finished and failed.',
+           [({'result': result}, count)
+            for result, count in sorted(deletion.stats.items())])
+    metric('soft_desk_purged_rows_total', 'counter',
+           'Rows deleted by the background purges.',
+           [({'table': table}, count)
+            for table, count in sorted(deletion.purged_rows.items())])
+    metric('soft_desk_events_total', 'counter',
+           'Events published to and delivered by the event streams, and '
+           'streams closed for overflowing.',
+           [({'result': result}, events.stats[result])
+            for result in ('published', 'delivered', 'overflowed')])
+    metric('soft_desk_event_streams', 'gauge', 'Event streams open.',
+           [({}, events.stats['opened'] - events.stats['closed'])])
+    counts, lag, throughput = jobs.queue_stats()
+    metric('soft_desk_jobs', 'gauge', 'Jobs of the queue per status.',
+           [({'status': status}, count)
+            for status, count in sorted(counts.items())])
+    metric('soft_desk_job_lag_seconds', 'gauge',
+           'Seconds the oldest due job has been waiting.',
+           [({}, f'{lag:.3f}')])
+    metric('soft_desk_jobs_per_second', 'gauge',
+           f'Jobs done per second over the last '
+           f'{jobs.THROUGHPUT_WINDOW} seconds.',
+           [({}, f'{throughput:.3f}')])
+    metric('soft_desk_jobs_enqueued_total', 'counter',
+           'Jobs enqueued by this process, per task.',
+           [({'task': task}, count)
+            for task, count in sorted(jobs.stats.items())])
+    metric('soft_desk_password_hashes_total', 'counter',
+           'Password hashes admitted to or rejected by the worker pool, '
+           'run inline and rehashed.',
+           [({'result': result}, count)
+            for result, count in sorted(hashing.stats.items())])
+    metric('soft_desk_password_hashes_pending', 'gauge',
+           'Password hashes queued or running in the worker pool.',
+           [({}, hashing.pool.pending)])
+    return '\n'.join(lines) + '\n'
+
+
+def can_read_metrics(request):
+    """
+    Staff users logged in to the admin, scrapers sending
+    "Authorization: Bearer <SOFT_DESK_METRICS_TOKEN>", and the addresses
+    of SOFT_DESK_METRICS_ALLOWED_IPS. Behind a reverse proxy REMOTE_ADDR
+    is the proxy's: the addresses let every client in.
+    """
+    token = getattr(settings, 'SOFT_DESK_METRICS_TOKEN', None)
+    if token:
+        scheme, _, credentials = request.headers.get(
+            'Authorization', '').partition(' ')
+        if scheme.lower() == 'bearer' and hmac.compare_digest(
+                credentials.encode(), token.encode()):
+            return True
+    allowed = getattr(settings, 'SOFT_DESK_METRICS_ALLOWED_IPS', [])
+    if request.META.get('REMOTE_ADDR') in allowed:
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_active and user.is_staff)
+
+
+def metrics_view(request):
+    """
+    Prometheus text exposition of the collected metrics, served to the
+    requests can_read_metrics() lets in only.
+    """
+    if not can_read_metrics(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(),
+                        content_type='text/plain; version=0.0.4')
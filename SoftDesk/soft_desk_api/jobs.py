@@ -0,0 +1,252 @@
+"""
+Database-backed queue of the work done outside of the requests.
+
+Tasks are functions registered with @task, taking and returning JSON
+values. enqueue() writes a Job row in the current transaction, so a job
+is only seen by the workers once the change that asked for it commits,
+and vanishes with it when it rolls back. Passing a key queues the job at
+most once: enqueuing a key already queued returns the queued job.
+
+Workers (`python manage.py run_jobs`) run jobs in threads, optionally
+in several processes, and need no broker: a job is claimed by moving it
+from queued to running with a conditional UPDATE (with SELECT ... FOR
+UPDATE SKIP LOCKED first, where the database has it), so each job runs
+once however many workers poll the table. A job that raises is queued
+again after RETRY_DELAY * 2 ** (attempts - 1) seconds, until it used
+its max_attempts; a job still running after TIMEOUT seconds, its worker
+gone, is queued again. Done jobs are deleted after RETENTION seconds.
+
+queue_stats() measures the queue for the metrics: jobs per status, the
+lag of the oldest job due and the jobs done per second over the last
+minute.
+
+Configured through the SOFT_DESK_JOBS setting:
+    MAX_ATTEMPTS  - runs of a job before it is failed, unless given
+    RETRY_DELAY   - seconds before the first retry, doubled each retry
+    TIMEOUT       - seconds before a running job is considered lost
+    POLL_INTERVAL - seconds an idle worker waits before polling again
+    RETENTION     - seconds done jobs are kept
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import (
+    IntegrityError, close_old_connections, connection, transaction
+)
+from django.db.models import Count, F, Min
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from soft_desk_api.models import Job
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'MAX_ATTEMPTS': 3,
+    'RETRY_DELAY': 10,
+    'TIMEOUT': 3600,
+    'POLL_INTERVAL': 1,
+    'RETENTION': 7 * 24 * 3600,
+}
+THROUGHPUT_WINDOW = 60
+CLEAR_BATCH_SIZE = 1000
+
+registry = {}
+stats = Counter()
+
+
+def get_setting(name):
+    return getattr(settings, 'SOFT_DESK_JOBS', {}).get(name, DEFAULTS[name])
+
+
+def task(function=None, name=None, max_attempts=None):
+    """
+    Registers function as a task, under name or its own name. Used as
+    @task or @task(max_attempts=1).
+    """
+    def register(function):
+        function.task_name = name or function.__name__
+        function.max_attempts = max_attempts
+        registry[function.task_name] = function
+        return function
+
+    if function is not None:
+        return register(function)
+    return register
+
+
+def enqueue(name, *args, key=None, delay=0, user=None):
+    """ Queues a call of the task name with args, returns its Job """
+    function = registry[name]
+    job = Job(task=name, args=list(args), key=key,
+              max_attempts=(function.max_attempts
+                            or get_setting('MAX_ATTEMPTS')),
+              requested_by=user,
+              run_after=timezone.now() + timedelta(seconds=delay))
+    if key is None:
+        job.save()
+    else:
+        try:
+            with transaction.atomic():
+                job.save()
+        except IntegrityError:
+            queued = Job.objects.filter(key=key, status=Job.QUEUED).first()
+            if queued is not None:
+                return queued
+            # Claimed in between: a new run is queued.
+            job.save()
+    stats[name] += 1
+    return job
+
+
+def claim(limit=1):
+    """ Moves up to limit due jobs to running, returns them """
+    token = uuid.uuid4().hex
+    due = (Job.objects.filter(status=Job.QUEUED,
+                              run_after__lte=timezone.now())
+           .order_by('run_after', 'pk'))
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            pks = list(due.select_for_update(skip_locked=True)
+                       .values_list('pk', flat=True)[:limit])
+            if not pks:
+                return []
+        else:
+            # One UPDATE: on SQLite a SELECT followed by an UPDATE in the
+            # same transaction fails when another worker writes between.
+            pks = due.values('pk')[:limit]
+        claimed = Job.objects.filter(pk__in=pks, status=Job.QUEUED).update(
+            status=Job.RUNNING, claimed_by=token, started_at=Now(),
+            attempts=F('attempts') + 1)
+    if not claimed:
+        return []
+    return list(Job.objects.filter(claimed_by=token, status=Job.RUNNING))
+
+
+def run_job(job):
+    """ Runs a claimed job and records its outcome """
+    function = registry.get(job.task)
+    try:
+        if function is None:
+            raise LookupError(f'Unknown task {job.task!r}')
+        result = function(*job.args)
+    except Exception as e:
+        logger.exception('Job %s failed (attempt %d of %d)',
+                         job, job.attempts, job.max_attempts)
+        if function is not None and job.attempts < job.max_attempts:
+            delay = get_setting('RETRY_DELAY') * 2 ** (job.attempts - 1)
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.QUEUED, claimed_by='', error=repr(e),
+                run_after=timezone.now() + timedelta(seconds=delay))
+        else:
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.FAILED, error=repr(e), finished_at=Now())
+        return False
+    Job.objects.filter(pk=job.pk).update(
+        status=Job.DONE, result=result, error='', finished_at=Now())
+    return True
+
+
+def requeue_lost():
+    """ Queues again, or fails, the jobs running for too long """
+    lost = Job.objects.filter(
+        status=Job.RUNNING,
+        started_at__lt=timezone.now() - timedelta(
+            seconds=get_setting('TIMEOUT')))
+    lost.filter(attempts__lt=F('max_attempts')).update(
+        status=Job.QUEUED, claimed_by='', run_after=Now())
+    lost.update(status=Job.FAILED, error='Lost by its worker',
+                finished_at=Now())
+
+
+def clear_finished():
+    """ Deletes a batch of the done jobs older than RETENTION """
+    pks = list(Job.objects.filter(
+        status=Job.DONE,
+        finished_at__lt=timezone.now() - timedelta(
+            seconds=get_setting('RETENTION')),
+    ).values_list('pk', flat=True)[:CLEAR_BATCH_SIZE])
+    if pks:
+        Job.objects.filter(pk__in=pks).delete()
+    return len(pks)
+
+
+def queue_stats():
+    """
+    ({status: jobs}, seconds the oldest due job waited, jobs done per
+    second over the last THROUGHPUT_WINDOW seconds)
+    """
+    now = timezone.now()
+    counts = dict.fromkeys(dict(Job.STATUS_CHOICES), 0)
+    counts.update(Job.objects.order_by().values_list('status').annotate(
+        Count('pk')))
+    oldest = Job.objects.filter(
+        status=Job.QUEUED, run_after__lte=now).aggregate(
+        oldest=Min('run_after'))['oldest']
+    done = Job.objects.filter(
+        status=Job.DONE,
+        finished_at__gte=now - timedelta(seconds=THROUGHPUT_WINDOW)).count()
+    lag = (now - oldest).total_seconds() if oldest is not None else 0
+    return counts, lag, done / THROUGHPUT_WINDOW
+
+
+class Worker:
+    """
+    threads threads claiming and running jobs until stopped, or with
+    once, until no job is due.
+    """
+    def __init__(self, threads=1, once=False):
+        self.threads = threads
+        self.once = once
+        self.stopping = threading.Event()
+        self.done = Counter()
+
+    def run(self):
+        threads = [threading.Thread(target=self.loop, name=f'jobs-{index}')
+                   for index in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            # Running jobs end, no other is claimed.
+            self.stop()
+            for thread in threads:
+                thread.join()
+        return self.done
+
+    def stop(self):
+        self.stopping.set()
+
+    def loop(self):
+        try:
+            while not self.stopping.is_set():
+                close_old_connections()
+                try:
+                    jobs = claim()
+                    if not jobs:
+                        requeue_lost()
+                        clear_finished()
+                except Exception:
+                    logger.exception('Polling the jobs failed')
+                    jobs = []
+                if not jobs:
+                    if self.once:
+                        return
+                    self.stopping.wait(get_setting('POLL_INTERVAL'))
+                    continue
+                for job in jobs:
+                    start = time.perf_counter()
+                    succeeded = run_job(job)
+                    self.done['done' if succeeded else 'failed'] += 1
+                    logger.info('Job %s ran in %.3fs', job,
+                                time.perf_counter() - start)
+        finally:
+            connection.close()
@@ -0,0 +1,390 @@
+"""
+Benchmarks every api endpoint routed in SoftDesk/urls.py.
+
+A throw-away test database is created and seeded (see soft_desk_api.seeding),
+then each endpoint is called through the test client with a real JWT.
+For every endpoint the command reports p50/p95/p99 latency, queries per
+request and peak memory allocated per request, and writes the results as
+JSON so that two runs can be compared:
+
+    python manage.py benchmark --output before.json
+    python manage.py benchmark --output after.json --compare before.json
+
+Without --output the results go to SOFT_DESK_BENCHMARK_OUTPUT.
+
+With --explain, the query plans of the read endpoints are printed and
+stored in the results as well, to check which indexes they use.
+"""
+import itertools
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.runner import DiscoverRunner
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_test_environment,
+    teardown_test_environment
+)
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from custom_auth.models import User
+from soft_desk_api.models import Project, Contributor, Issue, Comment
+from soft_desk_api.seeding import seed, BENCHMARK_PASSWORD
+from soft_desk_api.management.commands.seed_data import (
+    add_dataset_arguments, dataset_from_options
+)
+
+
+class Target:
+    """ The objects the endpoints are called on """
+    def __init__(self, project):
+        self.project = project
+        self.user = project.author
+        self.issue = (Issue.objects.filter(project=project)
+                      .order_by('-comment_count', 'pk').first())
+        self.comment = (Comment.objects.filter(issue=self.issue)
+                        .order_by('pk').first())
+        self.other_username = (project.contributors.exclude(user=self.user)
+                               .values_list('user__username', flat=True)
+                               .first() or self.user.username)
+
+
+names = itertools.count()
+
+
+def new_user():
+    return User.objects.create(username=f'benchmark_user_{next(names)}',
+                               age=30)
+
+
+def client_for(user):
+    """ An api client authenticated as user with a JWT """
+    client = APIClient()
+    token = RefreshToken.for_user(user).access_token
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+    return client
+
+
+def get_endpoints(target):
+    """
+    Returns (name, method, url, data, format) for every routed endpoint,
+    plus a prepare function for the endpoints using an object up: called
+    with (client, url, data) before each (untimed) call, it creates the
+    object and returns the (client, url, data) of the call. Other write
+    endpoints are chosen so that repeating them is harmless.
+    """
+    project = f'/api/projects/{target.project.pk}'
+    issue = f'{project}/issues/{target.issue.pk}' if target.issue else None
+    comment = (f'{issue}/comments/{target.comment.pk}'
+               if target.comment else None)
+
+    def new_project(client, url, data):
+        project = Project.objects.create(author=target.user,
+                                         name='Benchmark project',
+                                         project_type='back-end')
+        Contributor.objects.create(user=target.user, project=project)
+        return client, f'/api/projects/{project.pk}/', data
+
+    def new_issue(client, url, data):
+        new = Issue.objects.create(author=target.user,
+                                   project=target.project,
+                                   name='Benchmark issue')
+        return client, f'{project}/issues/{new.pk}/', data
+
+    def new_comment(client, url, data):
+        new = Comment.objects.create(author=target.user, issue=target.issue,
+                                     description='Benchmark comment')
+        return client, f'{issue}/comments/{new.pk}/', data
+
+    def new_contributor(client, url, data):
+        user = new_user()
+        Contributor.objects.create(user=user, project=target.project)
+        return client, url, {'usernames': [user.username]}
+
+    def new_registration(client, url, data):
+        return client, url, {**data,
+                             'username': f'benchmark_user_{next(names)}'}
+
+    def new_account(client, url, data):
+        return client_for(new_user()), url, data
+
+    endpoints = [
+        ('ProjectViewset.list', 'get', '/api/projects/', None, None),
+        ('ProjectViewset.list (stats)', 'get', '/api/projects/',
+         {'with_stats': 'true'}, None),
+        ('ProjectViewset.retrieve', 'get', f'{project}/', None, None),
+        ('ProjectViewset.partial_update', 'patch', f'{project}/',
+         {'name': target.project.name}, 'json'),
+        ('ProjectViewset.changes', 'get', f'{project}/changes/', None, None),
+        ('ProjectViewset.export', 'get', f'{project}/export/', None, None),
+        ('ProjectViewset.stats', 'get', f'{project}/stats/', None, None),
+        ('ProjectViewset.search', 'get', f'{project}/search/',
+         {'q': 'issue 42'}, None),
+        ('SearchViewset.list', 'get', '/api/search/',
+         {'q': 'synthetic comment'}, None),
+        ('ProjectViewset.add_contributors', 'patch',
+         f'{project}/add_contributors/',
+         {'usernames': target.other_username}, 'json'),
+        ('ProjectViewset.remove_contributors', 'patch',
+         f'{project}/remove_contributors/',
+         {'usernames': 'unknown-user'}, 'json'),
+        ('ProjectViewset.bulk_contributors', 'post',
+         f'{project}/contributors/',
+         {'usernames': [target.other_username]}, 'json'),
+        ('IssueViewset.list', 'get', f'{project}/issues/', None, None),
+        ('IssueViewset.list (cursor)', 'get',
+         f'{project}/issues/?pagination=cursor', None, None),
+        ('IssueViewset.list (triage)', 'get', f'{project}/issues/',
+         {'status': 'in progress', 'priority': 'high', 'flag': 'bug',
+          'ordering': '-created_at'}, None),
+        ('IssueViewset.list (assigned)', 'get', f'{project}/issues/',
+         {'attribution': 'me', 'status': 'to do,in progress'}, None),
+        ('IssueViewset.list (authored)', 'get', f'{project}/issues/',
+         {'author': 'me', 'created_after': '2000-01-01'}, None),
+        ('IssueViewset.list (unassigned)', 'get', f'{project}/issues/',
+         {'attribution': 'none', 'flag': 'bug'}, None),
+        ('IssueViewset.create', 'post', f'{project}/issues/',
+         {'name': 'Benchmark issue'}, 'json'),
+        ('IssueViewset.bulk', 'post', f'{project}/issues/bulk/',
+         [{'name': f'Bulk issue {i}'} for i in range(50)], 'json'),
+        ('ProjectViewset.bulk_contributors (delete)', 'delete',
+         f'{project}/contributors/', None, 'json', new_contributor),
+        ('ProjectViewset.destroy', 'delete', '/api/projects/<new>/',
+         None, None, new_project),
+        ('IssueViewset.destroy', 'delete', f'{project}/issues/<new>/',
+         None, None, new_issue),
+        ('token_obtain_pair', 'post', '/api/token/',
+         {'username': target.user.username,
+          'password': BENCHMARK_PASSWORD}, 'json'),
+        ('register', 'post', '/register/',
+         {'password': BENCHMARK_PASSWORD, 'age': 30,
+          'can_be_contacted': False, 'can_data_be_shared': False},
+         'json', new_registration),
+        ('delete-account', 'delete', '/delete-account/', None, None,
+         new_account),
+    ]
+    if issue:
+        endpoints += [
+            ('IssueViewset.retrieve', 'get', f'{issue}/', None, None),
+            ('IssueViewset.partial_update', 'patch', f'{issue}/',
+             {'name': target.issue.name}, 'json'),
+            ('CommentViewset.list', 'get', f'{issue}/comments/',
+             None, None),
+            ('CommentViewset.create', 'post', f'{issue}/comments/',
+             {'description': 'Benchmark comment'}, 'json'),
+            ('CommentViewset.destroy', 'delete', f'{issue}/comments/<new>/',
+             None, None, new_comment),
+        ]
+    if comment:
+        endpoints += [
+            ('CommentViewset.retrieve', 'get', f'{comment}/', None, None),
+        ]
+    return endpoints
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def prepare(client, endpoint):
+    """ The client, method, url, data and format of one call """
+    name, method, url, data, data_format = endpoint[:5]
+    if len(endpoint) > 5:
+        client, url, data = endpoint[5](client, url, data)
+    return client, method, url, data, data_format
+
+
+def call(client, method, url, data, data_format):
+    response = getattr(client, method)(url, data=data, format=data_format)
+    if hasattr(response, 'streaming_content'):
+        for _ in response.streaming_content:
+            pass
+        response.close()
+    return response
+
+
+def measure(client, endpoint, iterations, warmup):
+    name, method, url = endpoint[:3]
+    for _ in range(warmup):
+        call(*prepare(client, endpoint))
+    timings = []
+    queries = []
+    status_codes = set()
+    for _ in range(iterations):
+        arguments = prepare(client, endpoint)
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = call(*arguments)
+            timings.append((time.perf_counter() - start) * 1000)
+        queries.append(len(captured.captured_queries))
+        status_codes.add(response.status_code)
+    peaks = []
+    for _ in range(max(1, iterations // 10)):
+        arguments = prepare(client, endpoint)
+        tracemalloc.start()
+        call(*arguments)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return {
+        'endpoint': name,
+        'method': method.upper(),
+        'url': url,
+        'status': sorted(status_codes),
+        'iterations': iterations,
+        'p50_ms': round(percentile(timings, 0.50), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'queries': round(statistics.fmean(queries), 2),
+        'peak_kib': round(max(peaks) / 1024, 1),
+    }
+
+
+def explain(client, endpoint):
+    """ The query plans of the SELECT statements run by a GET endpoint """
+    arguments = prepare(client, endpoint)
+    with CaptureQueriesContext(connection) as captured:
+        call(*arguments)
+    prefix = connection.ops.explain_query_prefix()
+    plans = []
+    with connection.cursor() as cursor:
+        for query in captured.captured_queries:
+            if not query['sql'].startswith('SELECT'):
+                continue
+            cursor.execute(f"{prefix} {query['sql']}")
+            plans.append({
+                'sql': query['sql'],
+                'plan': [' '.join(str(column) for column in row)
+                         for row in cursor.fetchall()],
+            })
+    return plans
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the api endpoints on a seeded test database.'
+
+    def add_arguments(self, parser):
+        add_dataset_arguments(parser)
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--endpoint', action='append', default=[],
+                            help='Only run endpoints whose name contains '
+                                 'this value. Can be repeated.')
+        parser.add_argument('--response-cache', action='store_true',
+                            help='Keep the response cache enabled.')
+        parser.add_argument('--output',
+                            default=settings.SOFT_DESK_BENCHMARK_OUTPUT,
+                            help='Results file, created with its folder.')
+        parser.add_argument('--compare',
+                            help='Previous results file to compare with.')
+        parser.add_argument('--explain', action='store_true',
+                            help='Print the query plans of GET endpoints.')
+
+    def handle(self, *args, **options):
+        dataset = dataset_from_options(options)
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0)
+        old_config = runner.setup_databases()
+        try:
+            with override_settings(
+                SOFT_DESK_RESPONSE_CACHE={
+                    'ENABLED': options['response_cache']
+                },
+                ALLOWED_HOSTS=['testserver'],
+            ):
+                results = self.run_benchmarks(dataset, options)
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+        report = {
+            'revision': git_revision(),
+            'date': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'dataset': dataset.as_dict(),
+            'results': results,
+        }
+        output = Path(options['output'])
+        output.parent.mkdir(parents=True, exist_ok=True)
+        with open(output, 'w') as file:
+            json.dump(report, file, indent=2)
+        previous = {}
+        if options['compare']:
+            with open(options['compare']) as file:
+                previous = {result['endpoint']: result
+                            for result in json.load(file)['results']}
+        self.print_results(results, previous)
+        self.stdout.write(self.style.SUCCESS(
+            f"Results written to {options['output']}"
+        ))
+
+    def run_benchmarks(self, dataset, options):
+        projects = seed(dataset)
+        if not projects:
+            return []
+        target = Target(projects[0])
+        client = client_for(target.user)
+        results = []
+        for endpoint in get_endpoints(target):
+            if options['endpoint'] and not any(
+                    part in endpoint[0] for part in options['endpoint']):
+                continue
+            result = measure(client, endpoint, options['iterations'],
+                             options['warmup'])
+            if options['explain'] and endpoint[1] == 'get':
+                result['plans'] = explain(client, endpoint)
+                self.print_plans(result)
+            results.append(result)
+        return results
+
+    def print_plans(self, result):
+        self.stdout.write(self.style.MIGRATE_HEADING(result['endpoint']))
+        for plan in result['plans']:
+            self.stdout.write(f"  {plan['sql'][:120]}")
+            for line in plan['plan']:
+                self.stdout.write(f'    {line}')
+
+    def print_results(self, results, previous):
+        self.stdout.write(
+            f"{'endpoint':<42} {'status':<9} {'p50 ms':>8} {'p95 ms':>8} "
+            f"{'p99 ms':>8} {'queries':>8} {'peak KiB':>9}"
+        )
+        for result in results:
+            line = (
+                f"{result['endpoint']:<42} "
+                f"{','.join(map(str, result['status'])):<9} "
+                f"{result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} "
+                f"{result['p99_ms']:>8.2f} {result['queries']:>8.1f} "
+                f"{result['peak_kib']:>9.1f}"
+            )
+            before = previous.get(result['endpoint'])
+            if before:
+                change = ((result['p50_ms'] - before['p50_ms'])
+                          / before['p50_ms'] * 100 if before['p50_ms'] else 0)
+                line += (f"  p50 {change:+.1f}%, queries "
+                         f"{result['queries'] - before['queries']:+.1f}")
+            self.stdout.write(line)
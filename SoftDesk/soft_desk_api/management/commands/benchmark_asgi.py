@@ -0,0 +1,231 @@
+"""
+Load benchmark of the read endpoints under WSGI and under ASGI.
+
+Both modes are driven in-process, on the same seeded test database and the
+same hardware, through the handlers a deployment runs:
+    wsgi - WSGIHandler called from --threads worker threads, as a threaded
+           WSGI server (gunicorn's gthread workers) would
+    asgi - ASGIHandler with --concurrency requests in flight on a single
+           event loop, as one uvicorn worker would, and the routes of
+           SOFT_DESK_ASYNC_READS (see soft_desk_api.async_views)
+Each mode is sent --requests GET requests spread over the list and detail
+endpoints of projects, issues and comments, and the command reports the
+requests per second, the p50/p95/p99 latency and the non-200 answers.
+
+--db-latency delays every query by that many milliseconds, to compare the
+modes when the database is a network round trip away rather than an
+in-process SQLite file.
+
+    python manage.py benchmark_asgi --requests 2000 --db-latency 2
+"""
+import asyncio
+import importlib
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.db.backends.signals import connection_created
+from django.test.runner import DiscoverRunner
+from django.test.utils import (
+    override_settings, setup_test_environment, teardown_test_environment
+)
+from django.urls import clear_url_caches
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from soft_desk_api.seeding import seed
+from soft_desk_api.management.commands.benchmark import (
+    Target, get_endpoints, percentile
+)
+from soft_desk_api.management.commands.seed_data import (
+    add_dataset_arguments, dataset_from_options
+)
+
+READ_ENDPOINTS = [
+    'ProjectViewset.list', 'ProjectViewset.retrieve',
+    'IssueViewset.list', 'IssueViewset.retrieve',
+    'CommentViewset.list', 'CommentViewset.retrieve',
+]
+HOST = 'testserver'
+
+
+def read_requests(target, count):
+    """ count (path, query string) of the read endpoints, round robin """
+    endpoints = [(url, urlencode(data or {}))
+                 for name, method, url, data, data_format
+                 in get_endpoints(target) if name in READ_ENDPOINTS]
+    return [endpoints[index % len(endpoints)] for index in range(count)]
+
+
+def use_urlconf(async_reads):
+    """ Reloads the url configuration with or without the async reads """
+    with override_settings(SOFT_DESK_ASYNC_READS=async_reads):
+        clear_url_caches()
+        importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+
+
+def add_db_latency(seconds):
+    def delay(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def install(sender, connection, **kwargs):
+        connection.execute_wrappers.insert(0, delay)
+
+    connection_created.connect(install, weak=False)
+
+
+def call_wsgi(application, path, query='', authorization='',
+              method='GET', body=b'', content_type=''):
+    """ (latency, status) of one request made to a WSGI application """
+    environ = {
+        'REQUEST_METHOD': method, 'PATH_INFO': path,
+        'QUERY_STRING': query, 'SCRIPT_NAME': '',
+        'SERVER_NAME': HOST, 'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1', 'HTTP_HOST': HOST,
+        'HTTP_AUTHORIZATION': authorization,
+        'CONTENT_TYPE': content_type, 'CONTENT_LENGTH': str(len(body)),
+        'REMOTE_ADDR': '127.0.0.1', 'wsgi.input': BytesIO(body),
+        'wsgi.url_scheme': 'http', 'wsgi.errors': BytesIO(),
+        'wsgi.multithread': True, 'wsgi.multiprocess': False,
+        'wsgi.run_once': False, 'wsgi.version': (1, 0),
+    }
+    statuses = []
+    start = time.perf_counter()
+    response = application(
+        environ, lambda status, headers, exc_info=None:
+        statuses.append(status))
+    try:
+        b''.join(response)
+    finally:
+        response.close()
+    return time.perf_counter() - start, int(statuses[0].split()[0])
+
+
+def run_wsgi(requests, authorization, threads):
+    """ (seconds, [(latency, status)]) of requests served by threads """
+    application = get_wsgi_application()
+
+    def call(request):
+        path, query = request
+        return call_wsgi(application, path, query, authorization)
+
+    with ThreadPoolExecutor(threads) as pool:
+        start = time.perf_counter()
+        results = list(pool.map(call, requests))
+        return time.perf_counter() - start, results
+
+
+async def run_asgi(requests, authorization, concurrency):
+    """ (seconds, [(latency, status)]) of requests served concurrently """
+    application = get_asgi_application()
+    slots = asyncio.Semaphore(concurrency)
+
+    async def call(request):
+        path, query = request
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'},
+            'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(),
+            'query_string': query.encode(), 'root_path': '',
+            'headers': [(b'host', HOST.encode()),
+                        (b'authorization', authorization.encode())],
+            'client': ('127.0.0.1', 0), 'server': (HOST, 80),
+        }
+        messages = [{'type': 'http.request', 'body': b'',
+                     'more_body': False}]
+        statuses = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            # The client stays connected until the handler is done.
+            await asyncio.get_running_loop().create_future()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+
+        async with slots:
+            start = time.perf_counter()
+            await application(scope, receive, send)
+            return time.perf_counter() - start, statuses[0]
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*[call(request) for request in requests])
+    return time.perf_counter() - start, results
+
+
+class Command(BaseCommand):
+    help = 'Compares the read throughput of the api under WSGI and ASGI.'
+
+    def add_arguments(self, parser):
+        add_dataset_arguments(parser)
+        parser.add_argument('--requests', type=int, default=2000,
+                            help='Requests sent to each mode.')
+        parser.add_argument('--threads', type=int, default=8,
+                            help='Worker threads of the WSGI mode.')
+        parser.add_argument('--concurrency', type=int, default=64,
+                            help='Requests in flight in the ASGI mode.')
+        parser.add_argument('--db-latency', type=float, default=0,
+                            help='Milliseconds added to every query.')
+        parser.add_argument('--response-cache', action='store_true',
+                            help='Keep the response cache enabled.')
+
+    def handle(self, *args, **options):
+        dataset = dataset_from_options(options)
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0)
+        old_config = runner.setup_databases()
+        try:
+            with override_settings(
+                SOFT_DESK_RESPONSE_CACHE={
+                    'ENABLED': options['response_cache']
+                },
+                ALLOWED_HOSTS=[HOST],
+            ):
+                self.run_benchmarks(dataset, options)
+        finally:
+            use_urlconf(settings.SOFT_DESK_ASYNC_READS)
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+    def run_benchmarks(self, dataset, options):
+        projects = seed(dataset)
+        if not projects:
+            return
+        target = Target(projects[0])
+        token = RefreshToken.for_user(target.user).access_token
+        authorization = f'Bearer {token}'
+        requests = read_requests(target, options['requests'])
+        warmup = requests[:len(READ_ENDPOINTS) * 2]
+        if options['db_latency']:
+            add_db_latency(options['db_latency'] / 1000)
+
+        self.stdout.write(
+            f"{'mode':<6} {'in flight':>9} {'req/s':>9} {'p50 ms':>8} "
+            f"{'p95 ms':>8} {'p99 ms':>8} {'non-200':>8}"
+        )
+        use_urlconf(False)
+        run_wsgi(warmup, authorization, options['threads'])
+        self.report('wsgi', options['threads'],
+                    *run_wsgi(requests, authorization, options['threads']))
+        use_urlconf(True)
+        asyncio.run(run_asgi(warmup, authorization, options['concurrency']))
+        self.report('asgi', options['concurrency'], *asyncio.run(
+            run_asgi(requests, authorization, options['concurrency'])))
+
+    def report(self, mode, in_flight, seconds, results):
+        latencies = [latency * 1000 for latency, status in results]
+        failed = sum(1 for latency, status in results if status != 200)
+        self.stdout.write(
+            f'{mode:<6} {in_flight:>9} {len(results) / seconds:>9.1f} '
+            f'{statistics.median(latencies):>8.2f} '
+            f'{percentile(latencies, 0.95):>8.2f} '
+            f'{percentile(latencies, 0.99):>8.2f} {failed:>8}'
+        )
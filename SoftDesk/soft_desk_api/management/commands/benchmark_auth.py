@@ -0,0 +1,161 @@
+"""
+Load benchmark of the read endpoints during a burst of logins.
+
+The api is driven in-process through WSGIHandler, on a seeded test
+database: --readers threads keep sending GET requests to the list and
+detail endpoints of projects, issues and comments while --logins threads
+keep posting credentials to /api/token/, for --duration seconds per mode:
+    reads  - no logins, the baseline
+    inline - logins hash the password on the request thread
+             (SOFT_DESK_PASSWORD_HASHING['ENABLED'] = False)
+    pool   - logins hash on the worker pool of custom_auth.hashing, with
+             --workers processes and at most --max-pending hashes admitted
+Login threads refused with a 503 wait for its Retry-After, as a client
+would. For each mode the command reports the reads per second, their
+p50/p95/p99 latency, the logins per second and the logins refused.
+
+    python manage.py benchmark_auth --duration 20 --logins 8
+"""
+import json
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.test.runner import DiscoverRunner
+from django.test.utils import (
+    override_settings, setup_test_environment, teardown_test_environment
+)
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from custom_auth import hashing
+from soft_desk_api.seeding import seed, BENCHMARK_PASSWORD
+from soft_desk_api.management.commands.benchmark import Target, percentile
+from soft_desk_api.management.commands.benchmark_asgi import (
+    HOST, call_wsgi, read_requests
+)
+from soft_desk_api.management.commands.seed_data import (
+    add_dataset_arguments, dataset_from_options
+)
+
+MODES = ['reads', 'inline', 'pool']
+
+
+def run_load(application, reads, authorization, credentials, options,
+             logins):
+    """
+    ([(latency, status)] of the reads, [(latency, status)] of the
+    logins) sent for options['duration'] seconds
+    """
+    deadline = time.perf_counter() + options['duration']
+    read_results, login_results = [], []
+    body = json.dumps(credentials).encode()
+
+    def read(offset):
+        index = offset
+        while time.perf_counter() < deadline:
+            path, query = reads[index % len(reads)]
+            read_results.append(
+                call_wsgi(application, path, query, authorization))
+            index += 1
+
+    def login():
+        while time.perf_counter() < deadline:
+            latency, status = call_wsgi(
+                application, '/api/token/', method='POST', body=body,
+                content_type='application/json')
+            login_results.append((latency, status))
+            if status == 503:
+                time.sleep(hashing.get_setting('RETRY_AFTER'))
+
+    threads = [threading.Thread(target=read, args=(offset,))
+               for offset in range(options['readers'])]
+    threads += [threading.Thread(target=login) for _ in range(logins)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return read_results, login_results
+
+
+class Command(BaseCommand):
+    help = 'Measures the read latency of the api during a login burst.'
+
+    def add_arguments(self, parser):
+        add_dataset_arguments(parser)
+        parser.add_argument('--duration', type=float, default=10,
+                            help='Seconds each mode runs.')
+        parser.add_argument('--readers', type=int, default=4,
+                            help='Threads sending reads.')
+        parser.add_argument('--logins', type=int, default=4,
+                            help='Threads sending logins.')
+        parser.add_argument('--workers', type=int,
+                            default=hashing.get_setting('WORKERS'),
+                            help='Processes of the hashing pool.')
+        parser.add_argument('--max-pending', type=int,
+                            default=hashing.get_setting('MAX_PENDING'),
+                            help='Hashes admitted to the pool.')
+
+    def handle(self, *args, **options):
+        dataset = dataset_from_options(options)
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0)
+        old_config = runner.setup_databases()
+        try:
+            with override_settings(
+                SOFT_DESK_RESPONSE_CACHE={'ENABLED': False},
+                ALLOWED_HOSTS=[HOST],
+            ):
+                self.run_benchmarks(dataset, options)
+        finally:
+            hashing.pool.shutdown()
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+    def run_benchmarks(self, dataset, options):
+        projects = seed(dataset)
+        if not projects:
+            return
+        target = Target(projects[0])
+        token = RefreshToken.for_user(target.user).access_token
+        authorization = f'Bearer {token}'
+        credentials = {'username': target.user.username,
+                       'password': BENCHMARK_PASSWORD}
+        reads = read_requests(target, 64)
+        application = get_wsgi_application()
+
+        self.stdout.write(
+            f"{'mode':<7} {'reads/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+            f"{'p99 ms':>8} {'logins/s':>9} {'refused':>8}"
+        )
+        for mode in MODES:
+            hashing_settings = {
+                'ENABLED': mode == 'pool',
+                'WORKERS': options['workers'],
+                'MAX_PENDING': options['max_pending'],
+            }
+            with override_settings(
+                    SOFT_DESK_PASSWORD_HASHING=hashing_settings):
+                if mode == 'pool':
+                    # Starts the workers outside of the measure.
+                    hashing.make_password(BENCHMARK_PASSWORD)
+                for path, query in reads:
+                    call_wsgi(application, path, query, authorization)
+                self.report(mode, options['duration'], *run_load(
+                    application, reads, authorization, credentials,
+                    options, options['logins'] if mode != 'reads' else 0))
+
+    def report(self, mode, seconds, read_results, login_results):
+        latencies = [latency * 1000 for latency, status in read_results]
+        logins = sum(1 for latency, status in login_results
+                     if status == 200)
+        refused = sum(1 for latency, status in login_results
+                      if status == 503)
+        self.stdout.write(
+            f'{mode:<7} {len(read_results) / seconds:>8.1f} '
+            f'{statistics.median(latencies):>8.2f} '
+            f'{percentile(latencies, 0.95):>8.2f} '
+            f'{percentile(latencies, 0.99):>8.2f} '
+            f'{logins / seconds:>9.1f} {refused:>8}'
+        )
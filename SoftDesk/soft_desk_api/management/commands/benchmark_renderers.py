@@ -0,0 +1,112 @@
+"""
+Compares DRF's JSONRenderer with FastJSONRenderer on a list payload of
+--issues serialized issues and as many comments: CPU time per render,
+whether both produce the same bytes, and the bytes sent under every
+encoding CompressionMiddleware can negotiate.
+
+The dataset is written inside a transaction that is rolled back at the
+end, so the command can be pointed at a development database.
+
+    python manage.py benchmark_renderers --issues 10000
+"""
+import time
+import statistics
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from custom_auth.models import User
+from soft_desk_api.compression import compress, supported_encodings
+from soft_desk_api.models import Project, Issue, Comment
+from soft_desk_api.renderers import FastJSONRenderer, orjson
+from soft_desk_api.serializers import (
+    IssueDetailSerializer, CommentDetailSerializer
+)
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the JSON renderers and the response compression.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--issues', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                payload = build_payload(options['issues'])
+                raise Rollback
+        except Rollback:
+            pass
+        repeat = options['repeat']
+        if orjson is None:
+            self.stdout.write(self.style.WARNING(
+                'orjson is not installed, FastJSONRenderer falls back to '
+                'the stdlib encoder.'))
+        self.stdout.write(f"{'renderer':<18} {'cpu ms':>9} {'bytes':>11}")
+        contents = []
+        for renderer in (JSONRenderer(), FastJSONRenderer()):
+            content, cpu = measure(lambda: renderer.render(payload), repeat)
+            contents.append(content)
+            self.stdout.write(f'{type(renderer).__name__:<18} '
+                              f'{cpu * 1000:>9.1f} {len(content):>11,}')
+        self.stdout.write(
+            f"same bytes: {'yes' if contents[0] == contents[1] else 'NO'}")
+
+        content = contents[1]
+        self.stdout.write(
+            f"\n{'encoding':<18} {'cpu ms':>9} {'bytes':>11} {'ratio':>7}")
+        self.stdout.write(f"{'identity':<18} {0:>9.1f} "
+                          f"{len(content):>11,} {1:>7.2f}")
+        for encoding in supported_encodings():
+            compressed, cpu = measure(lambda: compress(content, encoding),
+                                      repeat)
+            self.stdout.write(
+                f'{encoding:<18} {cpu * 1000:>9.1f} {len(compressed):>11,} '
+                f'{len(content) / len(compressed):>7.2f}'
+            )
+
+
+def build_payload(issue_count):
+    """ A paginated-list shaped payload of serialized issues and comments """
+    author = User.objects.create(username='bench_author', age=20)
+    project = Project.objects.create(author=author, name='benchmark',
+                                     project_type='back-end')
+    issues = Issue.objects.bulk_create(
+        [Issue(author=author, project=project, name=f'issue {i}',
+               description=f'description of issue {i}')
+         for i in range(issue_count)],
+        batch_size=5000,
+    )
+    Comment.objects.bulk_create(
+        [Comment(author=author, issue=issues[i], project=project,
+                 description=f'comment on issue {i}')
+         for i in range(issue_count)],
+        batch_size=5000,
+    )
+    issues = Issue.objects.filter(project=project).select_related(
+        'author', 'attribution__user', 'attribution__project')
+    comments = Comment.objects.filter(issue__project=project).select_related(
+        'author')
+    return {
+        'count': issue_count,
+        'next': None,
+        'previous': None,
+        'results': IssueDetailSerializer(issues, many=True).data,
+        'comments': CommentDetailSerializer(comments, many=True).data,
+    }
+
+
+def measure(render, repeat):
+    """ (output, median CPU seconds) of render() """
+    timings = []
+    for _ in range(repeat):
+        start = time.process_time()
+        output = render()
+        timings.append(time.process_time() - start)
+    return output, statistics.median(timings)
@@ -0,0 +1,157 @@
+"""
+Compares the ModelSerializers of the list endpoints with their values()
+row serializers (see soft_desk_api.rows): rows serialized per second by
+each, and whether both render the same JSON bytes.
+
+The dataset is written inside a transaction that is rolled back at the
+end, so the command can be pointed at a development database.
+
+    python manage.py benchmark_serializers --rows 10000
+"""
+import time
+import statistics
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from custom_auth.models import User
+from soft_desk_api.models import Project, Contributor, Issue, Comment
+from soft_desk_api.serializers import (
+    ProjectSerializer, ProjectRowSerializer,
+    IssueSerializer, IssueRowSerializer,
+    IssueLightSerializer, IssueLightRowSerializer,
+    CommentSerializer, CommentRowSerializer,
+    ContributorSerializer, ContributorRowSerializer,
+)
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the model and row serializers of the list endpoints.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000,
+                            help='Rows serialized per run.')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'serializer':<14} {'model rows/s':>13} {'row rows/s':>11} "
+            f"{'speedup':>8} {'same JSON':>10}"
+        )
+        try:
+            with transaction.atomic():
+                project = seed(options['rows'])
+                for name, model_serializer, queryset, row_serializer \
+                        in cases(project):
+                    self.report(name, model_serializer, queryset,
+                                row_serializer, options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def report(self, name, model_serializer, queryset, row_serializer,
+               options):
+        model_json, model_time = measure(
+            lambda: model_serializer(queryset, many=True).data,
+            options['repeat'])
+        row_json, row_time = measure(
+            lambda: row_serializer().serialize_queryset(queryset),
+            options['repeat'])
+        count = queryset.count()
+        self.stdout.write(
+            f'{name:<14} {count / model_time:>13,.0f} '
+            f'{count / row_time:>11,.0f} {model_time / row_time:>7.1f}x '
+            f"{'yes' if model_json == row_json else 'NO':>10}"
+        )
+
+
+def seed(row_count):
+    """
+    One project holding row_count issues, row_count comments and
+    contributors, plus row_count projects of its author.
+    """
+    users = User.objects.bulk_create(
+        [User(username=f'bench_{i}', age=20) for i in range(row_count)],
+        batch_size=5000,
+    )
+    author = users[0]
+    projects = Project.objects.bulk_create(
+        [Project(author=author, name=f'project {i}',
+                 project_type='back-end') for i in range(row_count)],
+        batch_size=5000,
+    )
+    project = projects[0]
+    contributors = Contributor.objects.bulk_create(
+        [Contributor(user=user, project=project) for user in users],
+        batch_size=5000,
+    )
+    issues = Issue.objects.bulk_create(
+        [Issue(author=author, name=f'issue {i}', project=project,
+               attribution=contributors[i] if i % 2 else None)
+         for i in range(row_count)],
+        batch_size=5000,
+    )
+    Comment.objects.bulk_create(
+        [Comment(author=author, description=f'comment {i}',
+                 issue=issues[i % len(issues)], project=project)
+         for i in range(row_count)],
+        batch_size=5000,
+    )
+    return project
+
+
+def cases(project):
+    """ (name, ModelSerializer, planned queryset, RowSerializer) """
+    yield (
+        'project', ProjectSerializer,
+        Project.objects.filter(author_id=project.author_id).order_by('pk')
+        .select_related('author')
+        .only('id', 'name', 'author__id', 'author__username'),
+        ProjectRowSerializer,
+    )
+    yield (
+        'issue', IssueSerializer,
+        Issue.objects.filter(project=project).order_by('pk')
+        .select_related('attribution__user', 'attribution__project')
+        .only('id', 'name', 'status', 'comment_count', 'attribution__id',
+              'attribution__user__id', 'attribution__user__username',
+              'attribution__project__id', 'attribution__project__name'),
+        IssueRowSerializer,
+    )
+    yield (
+        'issue (light)', IssueLightSerializer,
+        Issue.objects.filter(project=project).order_by('pk')
+        .only('id', 'name', 'status'),
+        IssueLightRowSerializer,
+    )
+    yield (
+        'comment', CommentSerializer,
+        Comment.objects.filter(issue__project=project).order_by('pk')
+        .select_related('author')
+        .only('id', 'uuid', 'description', 'created_at',
+              'author__id', 'author__username'),
+        CommentRowSerializer,
+    )
+    yield (
+        'contributor', ContributorSerializer,
+        Contributor.objects.filter(project=project).order_by('pk')
+        .select_related('user')
+        .only('id', 'user__id', 'user__username'),
+        ContributorRowSerializer,
+    )
+
+
+def measure(serialize, repeat):
+    """ (rendered JSON, median seconds) of query + serialize + render """
+    renderer = JSONRenderer()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        content = renderer.render(serialize())
+        timings.append(time.perf_counter() - start)
+    return content, statistics.median(timings)
@@ -0,0 +1,136 @@
+"""
+Compares the legacy OR-join + distinct() visibility filters with the
+visible_to() scopes while the tables grow.
+
+Every dataset is written inside a transaction that is rolled back at the
+end, so the command can be pointed at a development database.
+
+    python manage.py benchmark_visibility --sizes 10000,100000,1000000
+"""
+import random
+import time
+import statistics
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from custom_auth.models import User
+from soft_desk_api.models import Project, Contributor, Issue, Comment
+
+PAGE_SIZE = 100
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks project/issue/comment visibility filters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000',
+                            help='Comma separated comment counts.')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        self.stdout.write(
+            f"{'comments':>10} {'query':<16} "
+            f"{'legacy ms':>10} {'scope ms':>10}"
+        )
+        for size in sizes:
+            try:
+                with transaction.atomic():
+                    viewer, issue = seed(size)
+                    for name, legacy, scope in queries(viewer, issue):
+                        self.stdout.write(
+                            f'{size:>10} {name:<16} '
+                            f"{measure(legacy, options['repeat']):>10.2f} "
+                            f"{measure(scope, options['repeat']):>10.2f}"
+                        )
+                    raise Rollback
+            except Rollback:
+                pass
+
+
+def seed(comment_count):
+    """
+    Writes comment_count comments spread over comment_count / 10 issues,
+    comment_count / 100 projects and their contributors. The returned
+    viewer contributes to ten projects only.
+    """
+    project_count = max(comment_count // 100, 10)
+    issue_count = max(comment_count // 10, 1)
+    user_count = max(project_count // 2, 10)
+
+    users = User.objects.bulk_create(
+        [User(username=f'bench_{i}', age=20) for i in range(user_count)],
+        batch_size=5000,
+    )
+    viewer = users[0]
+    projects = Project.objects.bulk_create(
+        [Project(author=random.choice(users[1:]), name=f'project {i}',
+                 project_type='back-end') for i in range(project_count)],
+        batch_size=5000,
+    )
+    contributors = []
+    for index, project in enumerate(projects):
+        members = {project.author}
+        members.update(random.sample(users[1:], min(5, len(users) - 1)))
+        if index < 10:
+            members.add(viewer)
+        contributors += [Contributor(user=user, project=project)
+                         for user in members]
+    Contributor.objects.bulk_create(contributors, batch_size=5000)
+    issues = Issue.objects.bulk_create(
+        [Issue(author=viewer, name=f'issue {i}',
+               project=projects[i % project_count])
+         for i in range(issue_count)],
+        batch_size=5000,
+    )
+    Comment.objects.bulk_create(
+        [Comment(author=viewer, description='benchmark',
+                 issue=issues[i % issue_count],
+                 project_id=issues[i % issue_count].project_id)
+         for i in range(comment_count)],
+        batch_size=5000,
+    )
+    return viewer, issues[0]
+
+
+def queries(user, issue):
+    yield (
+        'projects',
+        Project.objects.filter(
+            Q(author=user) | Q(contributors__user=user)).distinct(),
+        Project.objects.visible_to(user),
+    )
+    yield (
+        'issues',
+        Issue.objects.filter(
+            Q(project__author=user) | Q(project__contributors__user=user),
+            project_id=issue.project_id).distinct(),
+        Issue.objects.visible_to(user).filter(project_id=issue.project_id),
+    )
+    yield (
+        'comments',
+        Comment.objects.filter(
+            Q(issue__project__author=user)
+            | Q(issue__project__contributors__user=user),
+            issue_id=issue.pk).distinct(),
+        Comment.objects.visible_to(user).filter(issue_id=issue.pk),
+    )
+
+
+def measure(queryset, repeat):
+    """ Median time in ms of a paginated list: count + first page """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        queryset.count()
+        list(queryset.order_by('pk')[:PAGE_SIZE])
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
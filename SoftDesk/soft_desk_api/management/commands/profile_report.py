@@ -0,0 +1,105 @@
+"""
+Aggregates the profiles written by ProfilingMiddleware (see
+soft_desk_api.profiling) into collapsed stacks, ready for flamegraph.pl
+or speedscope, and summarizes their SQL traces.
+
+    python manage.py profile_report --endpoint ProjectViewset.retrieve \
+        --output retrieve.folded
+    flamegraph.pl retrieve.folded > retrieve.svg
+"""
+import json
+import os
+import re
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from soft_desk_api.profiling import get_setting, safe_name
+
+MIDDLEWARE_FRAME = 'soft_desk_api.profiling:__call__'
+NUMBERS = re.compile(r"\b\d+\b|'[^']*'")
+
+
+def trim(stack, root):
+    """ Drops the frames above the first frame starting with root """
+    frames = stack.split(';')
+    for index, frame in enumerate(frames):
+        if frame.startswith(root):
+            return ';'.join(frames[index + 1:])
+    return stack
+
+
+class Command(BaseCommand):
+    help = 'Aggregates recorded request profiles into collapsed stacks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', default=None,
+                            help='Defaults to SOFT_DESK_PROFILING DIRECTORY.')
+        parser.add_argument('--endpoint', action='append', default=[],
+                            help='Only aggregate this endpoint, repeatable.')
+        parser.add_argument('--output', default=None,
+                            help='Write the stacks to a file, not stdout.')
+        parser.add_argument('--split-endpoints', action='store_true',
+                            help='Root every stack at its endpoint.')
+        parser.add_argument('--keep-outer-frames', action='store_true',
+                            help='Keep the server and middleware frames.')
+        parser.add_argument('--sql', type=int, default=10,
+                            help='Number of SQL statements to summarize.')
+
+    def handle(self, *args, **options):
+        directory = Path(options['directory']
+                         or str(get_setting('DIRECTORY')))
+        if not directory.is_dir():
+            raise CommandError(f'No profiles in {directory}.')
+        endpoints = ([safe_name(name) for name in options['endpoint']]
+                     or sorted(path.name for path in directory.iterdir()
+                               if path.is_dir()))
+        stacks = Counter()
+        statements = defaultdict(lambda: [0, 0.0])
+        profiles = 0
+        for endpoint in endpoints:
+            for folded in sorted((directory / endpoint).glob('*.folded')):
+                profiles += 1
+                self.read_stacks(folded, endpoint, stacks, options)
+                self.read_statements(folded.with_suffix('.json'), statements)
+        if not profiles:
+            raise CommandError('No profile matches these endpoints.')
+
+        lines = [f'{stack} {count}' for stack, count in sorted(stacks.items())]
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write('\n'.join(lines) + '\n')
+        else:
+            self.stdout.write('\n'.join(lines))
+        self.stderr.write(f'{profiles} profiles, '
+                          f'{sum(stacks.values())} samples.')
+        self.write_statements(statements, options['sql'])
+
+    def read_stacks(self, path, endpoint, stacks, options):
+        with open(path) as folded:
+            for line in folded:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if not options['keep_outer_frames']:
+                    stack = trim(stack, MIDDLEWARE_FRAME)
+                if options['split_endpoints']:
+                    stack = f'{endpoint};{stack}' if stack else endpoint
+                if stack:
+                    stacks[stack] += int(count)
+
+    def read_statements(self, path, statements):
+        if not os.path.exists(path):
+            return
+        with open(path) as trace:
+            for statement in json.load(trace)['statements']:
+                entry = statements[NUMBERS.sub('?', statement['sql'])]
+                entry[0] += 1
+                entry[1] += statement['duration_ms']
+
+    def write_statements(self, statements, limit):
+        if not statements or limit <= 0:
+            return
+        self.stderr.write(f"{'count':>7} {'total ms':>10}  statement")
+        ranked = sorted(statements.items(), key=lambda item: -item[1][1])
+        for sql, (count, total) in ranked[:limit]:
+            self.stderr.write(f'{count:>7} {total:>10.2f}  {sql[:200]}')
@@ -0,0 +1,34 @@
+"""
+Deletes the tombstones of the change feed (see soft_desk_api.changes)
+older than their retention, e.g. daily from cron.
+
+    python manage.py prune_tombstones
+    python manage.py prune_tombstones --enqueue
+
+With --enqueue the pruning is left to the job queue (see
+soft_desk_api.jobs), for a scheduler that should not wait for it.
+"""
+from django.core.management.base import BaseCommand
+
+from soft_desk_api import jobs
+from soft_desk_api.changes import prune_tombstones, PRUNE_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Deletes the tombstones older than their retention.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=PRUNE_BATCH_SIZE,
+                            help='Tombstones deleted per query.')
+        parser.add_argument('--enqueue', action='store_true',
+                            help='Queue a prune_tombstones job instead.')
+
+    def handle(self, *args, **options):
+        if options['enqueue']:
+            job = jobs.enqueue('prune_tombstones', key='prune_tombstones')
+            self.stdout.write(self.style.SUCCESS(f'Queued job {job.uuid}.'))
+            return
+        pruned = prune_tombstones(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Pruned {pruned} tombstone(s).'))
@@ -0,0 +1,36 @@
+"""
+Purges the users and projects pending deletion (see
+soft_desk_api.deletion) right away, without waiting for their
+purge_deletion jobs, e.g. to finish the purges whose jobs failed.
+
+    python manage.py purge_deletions
+    python manage.py purge_deletions --batch-size 200 --claim-timeout 60
+"""
+from django.core.management.base import BaseCommand
+
+from soft_desk_api.deletion import get_setting, purge_pending
+from soft_desk_api.models import Deletion
+
+
+class Command(BaseCommand):
+    help = 'Purges the users and projects pending deletion.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=get_setting('BATCH_SIZE'),
+                            help='Rows deleted per transaction.')
+        parser.add_argument('--claim-timeout', type=int,
+                            default=get_setting('CLAIM_TIMEOUT'),
+                            help='Seconds without a batch before a purge '
+                                 'held by another worker is taken over.')
+
+    def handle(self, *args, **options):
+        purged = purge_pending(options['batch_size'],
+                               options['claim_timeout'])
+        left = Deletion.objects.filter(finished_at=None).count()
+        if left:
+            self.stdout.write(self.style.WARNING(
+                f'Purged {purged} deletion(s), {left} still pending.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Purged {purged} deletion(s).'))
@@ -0,0 +1,36 @@
+"""
+Rebuilds the search index (see soft_desk_api.search) from the issue and
+comment tables, for rows written without signals.
+
+    python manage.py rebuild_search_index
+    python manage.py rebuild_search_index --project 12 --project 14
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from soft_desk_api.models import Project
+from soft_desk_api.search import get_backend
+
+BATCH_SIZE = 100
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index of issues and comments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, action='append',
+                            help='Only reindex this project, repeatable.')
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        queryset = Project.objects.order_by('pk')
+        if options['project']:
+            queryset = queryset.filter(pk__in=options['project'])
+        ids = list(queryset.values_list('pk', flat=True))
+        for start in range(0, len(ids), BATCH_SIZE):
+            with transaction.atomic():
+                backend.rebuild(ids[start:start + BATCH_SIZE])
+        self.stdout.write(self.style.SUCCESS(
+            f'Reindexed {len(ids)} project(s) with '
+            f'{type(backend).__name__}.'
+        ))
@@ -0,0 +1,47 @@
+"""
+Rebuilds the project counters (see soft_desk_api.stats) from the issue
+and comment tables, and reports the projects whose counters had drifted.
+
+    python manage.py reconcile_stats
+    python manage.py reconcile_stats --project 12 --project 14
+    python manage.py reconcile_stats --enqueue
+
+With --enqueue the reconciliation is left to the job queue (see
+soft_desk_api.jobs), for a scheduler that should not wait for it.
+"""
+from django.core.management.base import BaseCommand
+
+from soft_desk_api import jobs
+from soft_desk_api.stats import reconcile, RECONCILE_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the denormalized project and issue counters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, action='append',
+                            help='Only reconcile this project, repeatable.')
+        parser.add_argument('--batch-size', type=int,
+                            default=RECONCILE_BATCH_SIZE)
+        parser.add_argument('--enqueue', action='store_true',
+                            help='Queue a reconcile_stats job instead.')
+
+    def handle(self, *args, **options):
+        if options['enqueue']:
+            # A full reconciliation is queued once.
+            key = None if options['project'] else 'reconcile_stats'
+            job = jobs.enqueue('reconcile_stats', options['project'],
+                               key=key)
+            self.stdout.write(self.style.SUCCESS(
+                f'Queued job {job.uuid}.'))
+            return
+        drifted = reconcile(options['project'],
+                            batch_size=options['batch_size'])
+        if drifted:
+            self.stdout.write(self.style.WARNING(
+                f'Rebuilt the stats of {len(drifted)} project(s): '
+                + ', '.join(str(pk) for pk in drifted[:50])
+                + (' ...' if len(drifted) > 50 else '')
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS('All stats up to date.'))
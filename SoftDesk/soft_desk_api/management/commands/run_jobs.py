@@ -0,0 +1,52 @@
+"""
+Runs the jobs of the queue (see soft_desk_api.jobs) until interrupted.
+
+    python manage.py run_jobs
+    python manage.py run_jobs --threads 4 --processes 2
+    python manage.py run_jobs --once
+
+Threads suit the jobs waiting on the database, the storage or the mail
+server; --processes starts that many worker processes, each with its own
+--threads threads, for the jobs bound by the CPU. With --once the
+workers stop as soon as no job is due, e.g. to drain the queue from cron.
+"""
+import multiprocessing
+from collections import Counter
+
+import django
+from django.core.management.base import BaseCommand
+
+
+def run_worker(threads, once):
+    """ Entry point of the worker processes, started with spawn """
+    # Imported once the apps are set up: spawned processes import this
+    # module before.
+    django.setup()
+    from soft_desk_api.jobs import Worker
+    return Worker(threads, once).run()
+
+
+class Command(BaseCommand):
+    help = 'Runs the jobs of the queue.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=1,
+                            help='Threads claiming jobs, per process.')
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Worker processes.')
+        parser.add_argument('--once', action='store_true',
+                            help='Stop once no job is due.')
+
+    def handle(self, *args, **options):
+        threads, once = options['threads'], options['once']
+        if options['processes'] <= 1:
+            from soft_desk_api.jobs import Worker
+            done = Worker(threads, once).run()
+        else:
+            context = multiprocessing.get_context('spawn')
+            with context.Pool(options['processes']) as pool:
+                results = pool.starmap(
+                    run_worker, [(threads, once)] * options['processes'])
+            done = sum(results, Counter())
+        self.stdout.write(self.style.SUCCESS(
+            f"Ran {done['done']} job(s), {done['failed']} failed."))
@@ -0,0 +1,51 @@
+"""
+Seeds the database with a synthetic dataset (see soft_desk_api.seeding).
+
+    python manage.py seed_data --users 1000 --projects 200 --issues 50000
+"""
+from django.core.management.base import BaseCommand
+
+from soft_desk_api.seeding import Dataset, seed, BENCHMARK_PASSWORD
+
+
+def add_dataset_arguments(parser):
+    defaults = Dataset()
+    parser.add_argument('--users', type=int, default=defaults.users)
+    parser.add_argument('--projects', type=int, default=defaults.projects)
+    parser.add_argument('--issues', type=int, default=defaults.issues)
+    parser.add_argument('--comments', type=int, default=defaults.comments)
+    parser.add_argument('--max-contributors', type=int,
+                        default=defaults.max_contributors)
+    parser.add_argument('--alpha', type=float, default=defaults.alpha,
+                        help='Power law exponent, lower is more skewed.')
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    parser.add_argument('--batch-size', type=int,
+                        default=defaults.batch_size)
+
+
+def dataset_from_options(options):
+    return Dataset(
+        users=options['users'],
+        projects=options['projects'],
+        issues=options['issues'],
+        comments=options['comments'],
+        max_contributors=options['max_contributors'],
+        alpha=options['alpha'],
+        seed=options['seed'],
+        batch_size=options['batch_size'],
+    )
+
+
+class Command(BaseCommand):
+    help = 'Seeds the database with synthetic users, projects and issues.'
+
+    def add_arguments(self, parser):
+        add_dataset_arguments(parser)
+
+    def handle(self, *args, **options):
+        projects = seed(dataset_from_options(options), stdout=self.stdout)
+        if projects:
+            self.stdout.write(self.style.SUCCESS(
+                f'Largest project: {projects[0].pk}. '
+                f"Every user's password is '{BENCHMARK_PASSWORD}'."
+            ))
@@ -0,0 +1,135 @@
+"""
+This module resolves the projects a user belongs to.
+
+Memberships are loaded with a single query, kept on the request for its
+whole lifetime and shared between requests through Django's cache for
+SOFT_DESK_MEMBERSHIP_CACHE_TIMEOUT seconds. The signal handlers in
+soft_desk_api.signals drop the cached entry whenever a Contributor or
+Project row of the user changes, once the transaction commits.
+
+aget_membership() resolves it through the async ORM and the async cache
+api; once on the request, get_membership() returns it without any I/O,
+so the permission classes run unchanged on the async read path.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Value, BooleanField
+
+from soft_desk_api.models import Contributor, Project
+
+MEMBERSHIP_CACHE_TIMEOUT = getattr(
+    settings, 'SOFT_DESK_MEMBERSHIP_CACHE_TIMEOUT', 60
+)
+REQUEST_ATTRIBUTE = '_soft_desk_membership'
+
+
+class Membership:
+    """
+    Project ids a user contributes to and project ids the user authored.
+    """
+    def __init__(self, contributor_of=(), author_of=()):
+        self.contributor_of = frozenset(contributor_of)
+        self.author_of = frozenset(author_of)
+        self.visible = self.contributor_of | self.author_of
+
+    def is_contributor(self, project_id):
+        return to_project_id(project_id) in self.contributor_of
+
+    def is_author(self, project_id):
+        return to_project_id(project_id) in self.author_of
+
+    def can_view(self, project_id):
+        return to_project_id(project_id) in self.visible
+
+
+def to_project_id(value):
+    """ Normalizes url kwargs and model pks to an int, or None """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def membership_cache_key(user_id):
+    return f'soft_desk:membership:{user_id}'
+
+
+def membership_rows(user):
+    """
+    (project_id, is_author) of every project of user not pending
+    deletion, in one query
+    """
+    contributor_of = Contributor.objects.filter(
+        user=user, project__deletion_requested_at=None
+    ).values_list(
+        'project_id', Value(False, output_field=BooleanField())
+    )
+    author_of = Project.objects.active().filter(author=user).values_list(
+        'id', Value(True, output_field=BooleanField())
+    )
+    return contributor_of.union(author_of, all=True)
+
+
+def membership_from_rows(rows):
+    return Membership(
+        contributor_of=[pk for pk, is_author in rows if not is_author],
+        author_of=[pk for pk, is_author in rows if is_author],
+    )
+
+
+def load_membership(user):
+    return membership_from_rows(list(membership_rows(user)))
+
+
+async def aload_membership(user):
+    # values_list() querysets cannot aiterator(): their iterable runs
+    # the query as soon as it is created.
+    return membership_from_rows(
+        [row async for row in membership_rows(user)])
+
+
+def get_membership(request):
+    """
+    Returns the Membership of request.user, resolving it at most once
+    per request and reading the shared cache before the database.
+    """
+    membership = getattr(request, REQUEST_ATTRIBUTE, None)
+    if membership is not None:
+        return membership
+    user = request.user
+    if not user.is_authenticated:
+        membership = Membership()
+    else:
+        key = membership_cache_key(user.pk)
+        membership = cache.get(key)
+        if membership is None:
+            membership = load_membership(user)
+            cache.set(key, membership, MEMBERSHIP_CACHE_TIMEOUT)
+    setattr(request, REQUEST_ATTRIBUTE, membership)
+    return membership
+
+
+async def aget_membership(request):
+    """ get_membership() through the async ORM and cache api """
+    membership = getattr(request, REQUEST_ATTRIBUTE, None)
+    if membership is not None:
+        return membership
+    user = request.user
+    if not user.is_authenticated:
+        membership = Membership()
+    else:
+        key = membership_cache_key(user.pk)
+        membership = await cache.aget(key)
+        if membership is None:
+            membership = await aload_membership(user)
+            await cache.aset(key, membership, MEMBERSHIP_CACHE_TIMEOUT)
+    setattr(request, REQUEST_ATTRIBUTE, membership)
+    return membership
+
+
+def invalidate_membership(*user_ids):
+    # Evicted once committed: evicted earlier, a concurrent request
+    # would cache the membership the transaction is changing again.
+    keys = [membership_cache_key(pk) for pk in user_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
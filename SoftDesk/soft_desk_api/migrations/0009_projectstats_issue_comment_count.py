@@ -0,0 +1,76 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    Project = apps.get_model('soft_desk_api', 'Project')
+    Issue = apps.get_model('soft_desk_api', 'Issue')
+    Comment = apps.get_model('soft_desk_api', 'Comment')
+    ProjectStats = apps.get_model('soft_desk_api', 'ProjectStats')
+    counters = {
+        'issues_to_do': Q(issues__status='to do'),
+        'issues_in_progress': Q(issues__status='in progress'),
+        'issues_finished': Q(issues__status='finished'),
+        'priority_low': Q(issues__priority='low'),
+        'priority_medium': Q(issues__priority='medium'),
+        'priority_high': Q(issues__priority='high'),
+        'flag_bug': Q(issues__flag='bug'),
+        'flag_feature': Q(issues__flag='feature'),
+        'flag_task': Q(issues__flag='task'),
+    }
+    comments = dict(
+        Comment.objects.order_by().values('issue__project_id')
+        .annotate(total=Count('pk')).values_list('issue__project_id', 'total')
+    )
+    rows = Project.objects.annotate(**{
+        column: Count('issues', filter=condition)
+        for column, condition in counters.items()
+    }).values('pk', *counters)
+    stats = []
+    for row in rows:
+        project_id = row.pop('pk')
+        stats.append(ProjectStats(project_id=project_id,
+                                  comments=comments.get(project_id, 0),
+                                  **row))
+    ProjectStats.objects.bulk_create(stats, batch_size=500)
+    Issue.objects.update(comment_count=Coalesce(Subquery(
+        Comment.objects.filter(issue=OuterRef('pk')).order_by()
+        .values('issue').annotate(total=Count('pk')).values('total')
+    ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('soft_desk_api', '0008_tombstone_contributor_created_at_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectStats',
+            fields=[
+                ('project', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='soft_desk_api.project')),
+                ('issues_to_do', models.IntegerField(default=0)),
+                ('issues_in_progress', models.IntegerField(default=0)),
+                ('issues_finished', models.IntegerField(default=0)),
+                ('priority_low', models.IntegerField(default=0)),
+                ('priority_medium', models.IntegerField(default=0)),
+                ('priority_high', models.IntegerField(default=0)),
+                ('flag_bug', models.IntegerField(default=0)),
+                ('flag_feature', models.IntegerField(default=0)),
+                ('flag_task', models.IntegerField(default=0)),
+                ('comments', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='issue',
+            name='comment_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,103 @@
+from django.db import migrations
+
+SQLITE_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE soft_desk_search USING fts5(
+        kind UNINDEXED, object_id UNINDEXED, project_id UNINDEXED,
+        issue_id UNINDEXED, title, body,
+        tokenize = 'porter unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    INSERT INTO soft_desk_search (rowid, kind, object_id, project_id,
+                                  issue_id, title, body)
+    SELECT id * 2, 'issue', id, project_id, id, name,
+           COALESCE(description, '')
+    FROM soft_desk_api_issue
+    """,
+    """
+    INSERT INTO soft_desk_search (rowid, kind, object_id, project_id,
+                                  issue_id, title, body)
+    SELECT c.id * 2 + 1, 'comment', c.id, i.project_id, c.issue_id, '',
+           c.description
+    FROM soft_desk_api_comment c
+    JOIN soft_desk_api_issue i ON i.id = c.issue_id
+    """,
+]
+
+POSTGRESQL_SCHEMA = [
+    """
+    CREATE TABLE soft_desk_search (
+        kind varchar(16) NOT NULL,
+        object_id bigint NOT NULL,
+        project_id bigint NOT NULL,
+        issue_id bigint NOT NULL,
+        title text NOT NULL,
+        body text NOT NULL,
+        document tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', title), 'A')
+            || setweight(to_tsvector('english', body), 'B')
+        ) STORED,
+        PRIMARY KEY (kind, object_id)
+    )
+    """,
+    """
+    CREATE INDEX soft_desk_search_document_idx
+    ON soft_desk_search USING GIN (document)
+    """,
+    """
+    CREATE INDEX soft_desk_search_project_idx
+    ON soft_desk_search (project_id)
+    """,
+    """
+    INSERT INTO soft_desk_search (kind, object_id, project_id, issue_id,
+                                  title, body)
+    SELECT 'issue', id, project_id, id, name, COALESCE(description, '')
+    FROM soft_desk_api_issue
+    """,
+    """
+    INSERT INTO soft_desk_search (kind, object_id, project_id, issue_id,
+                                  title, body)
+    SELECT 'comment', c.id, i.project_id, c.issue_id, '', c.description
+    FROM soft_desk_api_comment c
+    JOIN soft_desk_api_issue i ON i.id = c.issue_id
+    """,
+]
+
+
+class RunSQLOn(migrations.RunSQL):
+    """ RunSQL applied on the databases of vendor only """
+    def __init__(self, vendor, *args, **kwargs):
+        self.vendor = vendor
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, args, kwargs = super().deconstruct()
+        return name, [self.vendor, *args], kwargs
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if schema_editor.connection.vendor == self.vendor:
+            super().database_forwards(app_label, schema_editor,
+                                      from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if schema_editor.connection.vendor == self.vendor:
+            super().database_backwards(app_label, schema_editor,
+                                       from_state, to_state)
+
+
+DROP_SCHEMA = 'DROP TABLE soft_desk_search'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('soft_desk_api', '0009_projectstats_issue_comment_count'),
+    ]
+
+    operations = [
+        RunSQLOn('sqlite', SQLITE_SCHEMA, DROP_SCHEMA),
+        RunSQLOn('postgresql', POSTGRESQL_SCHEMA, DROP_SCHEMA),
+    ]
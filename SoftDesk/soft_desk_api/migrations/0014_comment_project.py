@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def populate_project(apps, schema_editor):
+    Issue = apps.get_model('soft_desk_api', 'Issue')
+    Comment = apps.get_model('soft_desk_api', 'Comment')
+    Comment.objects.update(project_id=Subquery(
+        Issue.objects.filter(pk=OuterRef('issue_id')).values('project_id')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('soft_desk_api', '0013_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='project',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='soft_desk_api.project'),
+        ),
+        migrations.RunPython(populate_project, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='comment',
+            name='project',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='soft_desk_api.project'),
+        ),
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='comment_updated_idx',
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['project', 'updated_at', 'id'], name='comment_project_updated_idx'),
+        ),
+    ]
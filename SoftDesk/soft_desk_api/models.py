@@ -1,16 +1,62 @@
 from django.db import models
+from django.db.models import Q, Exists, OuterRef
+from django.utils import timezone
 from custom_auth.models import User
 import uuid
 
 
+class ProjectQuerySet(models.QuerySet):
+    def active(self):
+        """ Projects not pending deletion """
+        return self.filter(deletion_requested_at=None)
+
+    def visible_to(self, user):
+        """
+        Projects authored by user or having user as a contributor.
+        Both branches are index lookups, so the cost follows the number
+        of projects of the user rather than the size of the tables.
+        Projects pending deletion are left out.
+        """
+        member_of = Contributor.objects.filter(user=user).values('project_id')
+        return self.active().filter(Q(author=user) | Q(pk__in=member_of))
+
+
+class IssueQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """
+        Issues of the projects Project.objects.visible_to() returns:
+        those of the projects pending deletion are left out.
+        """
+        is_member = Exists(Contributor.objects.filter(
+            project_id=OuterRef('project_id'), user=user
+        ))
+        return self.filter(Q(project__author=user) | is_member,
+                           project__deletion_requested_at=None)
+
+
+class CommentQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """ Comments of the issues IssueQuerySet.visible_to() returns """
+        is_member = Exists(Contributor.objects.filter(
+            project_id=OuterRef('issue__project_id'), user=user
+        ))
+        return self.filter(Q(issue__project__author=user) | is_member,
+                           issue__project__deletion_requested_at=None)
+
+
 class Contributor(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE,
                              related_name='contributors')
     project = models.ForeignKey('Project', on_delete=models.CASCADE,
                                 related_name='contributors')
+    created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         unique_together = ('user', 'project')
+        indexes = [
+            models.Index(fields=['project', 'created_at', 'id'],
+                         name='contrib_project_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.project.name}"
@@ -32,6 +78,10 @@ class Project(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     project_type = models.CharField(choices=TYPE_CHOICES)
+    deletion_requested_at = models.DateTimeField(null=True, blank=True,
+                                                 editable=False)
+
+    objects = ProjectQuerySet.as_manager()
 
     def __str__(self):
         return self.name
@@ -71,22 +121,226 @@ class Issue(models.Model):
                                     related_name='issues')
     flag = models.CharField(choices=FLAG_CHOICES,
                             default='task')
+    comment_count = models.IntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = IssueQuerySet.as_manager()
+
+    COUNTED_FIELDS = ('project_id', 'status', 'priority', 'flag')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['project', 'created_at', 'id'],
+                         name='issue_project_created_idx'),
+            models.Index(fields=['project', 'updated_at', 'id'],
+                         name='issue_project_updated_idx'),
+            # Filter combinations of IssueFilterBackend
+            models.Index(fields=['project', 'status', 'priority',
+                                 'created_at'],
+                         name='issue_proj_status_prio_idx'),
+            models.Index(fields=['project', 'flag', 'status', 'created_at'],
+                         name='issue_proj_flag_status_idx'),
+            models.Index(fields=['attribution', 'status', 'created_at'],
+                         name='issue_attrib_status_idx'),
+            models.Index(fields=['author', 'project', 'created_at'],
+                         name='issue_author_project_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} - {self.status} - {self.priority}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remembers the loaded values of COUNTED_FIELDS, so that the
+        ProjectStats deltas of an update need no extra query.
+        """
+        instance = super().from_db(db, field_names, values)
+        if all(field not in instance.get_deferred_fields()
+               for field in cls.COUNTED_FIELDS):
+            instance._counted_values = tuple(
+                getattr(instance, field) for field in cls.COUNTED_FIELDS)
+        return instance
+
 
 class Comment(models.Model):
+    """
+    project is the project of the issue, denormalized so that the change
+    feed reads the comments of a project through an index starting with
+    it. save() fills it in; bulk_create() callers set it themselves.
+    """
     uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     issue = models.ForeignKey(Issue, on_delete=models.CASCADE,
                               related_name='comments')
+    project = models.ForeignKey(Project, on_delete=models.CASCADE,
+                                related_name='+', db_index=False,
+                                editable=False)
     author = models.ForeignKey(User, on_delete=models.CASCADE,
                                related_name='comment_author')
     description = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CommentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['issue', 'created_at', 'id'],
+                         name='comment_issue_created_idx'),
+            models.Index(fields=['issue', 'updated_at', 'id'],
+                         name='comment_issue_updated_idx'),
+            models.Index(fields=['project', 'updated_at', 'id'],
+                         name='comment_project_updated_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.project_id is None:
+            self.project_id = self.issue.project_id
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"Comment by {self.author.username} on {self.issue}"
+
+
+class ProjectStats(models.Model):
+    """
+    Issue and comment counters of a project, kept up to date with F()
+    deltas by the signal handlers of soft_desk_api.signals and rebuilt by
+    the reconcile_stats command (see soft_desk_api.stats).
+    """
+    project = models.OneToOneField(Project, on_delete=models.CASCADE,
+                                   primary_key=True, related_name='stats')
+    issues_to_do = models.IntegerField(default=0)
+    issues_in_progress = models.IntegerField(default=0)
+    issues_finished = models.IntegerField(default=0)
+    priority_low = models.IntegerField(default=0)
+    priority_medium = models.IntegerField(default=0)
+    priority_high = models.IntegerField(default=0)
+    flag_bug = models.IntegerField(default=0)
+    flag_feature = models.IntegerField(default=0)
+    flag_task = models.IntegerField(default=0)
+    comments = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Stats of project {self.project_id}"
+
+
+class Tombstone(models.Model):
+    """
+    Trace of a deleted issue, comment or contributor, read by the change
+    feed. project_id is not a foreign key so that tombstones written while
+    a project is being deleted do not block the deletion.
+    """
+    KIND_CHOICES = [
+        ('issue', 'Issue'),
+        ('comment', 'Comment'),
+        ('contributor', 'Contributor')
+    ]
+
+    project_id = models.BigIntegerField()
+    kind = models.CharField(choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    data = models.JSONField(default=dict, blank=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['project_id', 'deleted_at', 'id'],
+                         name='tombstone_project_deleted_idx'),
+            models.Index(fields=['deleted_at'],
+                         name='tombstone_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} deleted at {self.deleted_at}"
+
+
+class Deletion(models.Model):
+    """
+    A user or project pending deletion, purged in the background by
+    soft_desk_api.deletion. object_id is not a foreign key since the row
+    outlives the object; uuid names the deletion in its status url.
+    """
+    KIND_CHOICES = [
+        ('user', 'User'),
+        ('project', 'Project')
+    ]
+
+    uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    kind = models.CharField(choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    progress = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    requested_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['finished_at', 'requested_at'],
+                         name='deletion_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"Deletion of {self.kind} {self.object_id}"
+
+    @property
+    def status(self):
+        if self.finished_at is not None:
+            return 'done'
+        if self.claimed_at is not None:
+            return 'running'
+        return 'pending'
+
+
+class Job(models.Model):
+    """
+    A call of a registered task, run by the workers of soft_desk_api.jobs.
+    Jobs sharing a key are queued once at a time.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed')
+    ]
+
+    uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    task = models.CharField(max_length=100)
+    args = models.JSONField(default=list, blank=True)
+    key = models.CharField(max_length=255, null=True, blank=True)
+    status = models.CharField(choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL,
+                                     null=True, blank=True,
+                                     related_name='jobs')
+    claimed_by = models.CharField(max_length=64, blank=True)
+    enqueued_at = models.DateTimeField(auto_now_add=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'],
+                         name='job_status_due_idx'),
+            models.Index(fields=['status', 'finished_at'],
+                         name='job_status_finished_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['key'],
+                                    condition=Q(status='queued'),
+                                    name='job_queued_key_unique'),
+        ]
+
     def __str__(self):
-        return f"Comment by {self.author.user.username} on {self.issue}"
+        return f"{self.task} job {self.uuid} ({self.status})"
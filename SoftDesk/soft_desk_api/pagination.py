@@ -0,0 +1,106 @@
+"""
+Pagination classes used by the api.
+
+Issues and comments keep the project-wide LimitOffsetPagination by default.
+Clients opt into keyset pagination with ?pagination=cursor (or by following
+a link holding a cursor): pages are then ordered by (created_at, id), or
+by an ?ordering= of these columns, no COUNT(*) is run and page N costs the
+same index range scan as page 1.
+
+apaginate_queryset() serves limit/offset pages to the async read path
+(see soft_desk_api.async_views).
+"""
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import LimitOffsetPagination, CursorPagination
+
+
+class CreatedAtCursorPagination(CursorPagination):
+    """
+    Cursor positions are only reliable on columns that never change, so
+    ?ordering= may only name cursor_fields, and the ordering always ends
+    with id, which breaks the ties of created_at.
+    """
+    ordering = ('created_at', 'id')
+    cursor_fields = ('created_at', 'id')
+    page_size_query_param = 'limit'
+    max_page_size = 1000
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        fields = [field.lstrip('-') for field in ordering]
+        if not set(fields) <= set(self.cursor_fields):
+            raise ValidationError({'ordering': [
+                'Cursor pagination can only order by '
+                + ', '.join(self.cursor_fields) + '.']})
+        if 'id' not in fields:
+            descending = ordering[-1].startswith('-')
+            ordering += ('-id' if descending else 'id',)
+        return ordering
+
+
+class OptionalCursorPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination that hands over to cursor_pagination_class
+    when the request asks for it.
+    """
+    cursor_pagination_class = CreatedAtCursorPagination
+    mode_query_param = 'pagination'
+    delegate = None
+
+    def use_cursor(self, request):
+        cursor_param = self.cursor_pagination_class.cursor_query_param
+        return (request.query_params.get(self.mode_query_param) == 'cursor'
+                or cursor_param in request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request):
+            self.delegate = self.cursor_pagination_class()
+            return self.delegate.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_row_fields(self, queryset, request, view):
+        """ The fields read from the rows of a page: the cursor position """
+        if not self.use_cursor(request):
+            return []
+        ordering = self.cursor_pagination_class().get_ordering(
+            request, queryset, view)
+        return [field.lstrip('-') for field in ordering]
+
+    def get_paginated_response(self, data):
+        if self.delegate is not None:
+            return self.delegate.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        if self.delegate is not None:
+            return self.delegate.get_paginated_response_schema(schema)
+        return super().get_paginated_response_schema(schema)
+
+
+def is_async_paginator(paginator, request):
+    """ Whether apaginate_queryset() can serve the page of the request """
+    if paginator is None:
+        return True
+    if not isinstance(paginator, LimitOffsetPagination):
+        return False
+    use_cursor = getattr(paginator, 'use_cursor', None)
+    return use_cursor is None or not use_cursor(request)
+
+
+async def apaginate_queryset(paginator, queryset, request):
+    """
+    LimitOffsetPagination.paginate_queryset through the async ORM,
+    leaving the paginator ready for get_paginated_response().
+    """
+    paginator.request = request
+    paginator.limit = paginator.get_limit(request)
+    if paginator.limit is None:
+        return None
+    paginator.count = await queryset.acount()
+    paginator.offset = paginator.get_offset(request)
+    if paginator.count > paginator.limit and paginator.template is not None:
+        paginator.display_page_controls = True
+    if paginator.count == 0 or paginator.offset > paginator.count:
+        return []
+    page = queryset[paginator.offset:paginator.offset + paginator.limit]
+    return [row async for row in page.aiterator()]
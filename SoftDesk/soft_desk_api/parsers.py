@@ -0,0 +1,57 @@
+"""
+Parsers used by the api on top of the REST_FRAMEWORK defaults.
+"""
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+
+from soft_desk_api.renderers import FastJSONRenderer, loads
+
+
+class FastJSONParser(JSONParser):
+    """ JSONParser decoding through orjson when it is installed """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if not self.strict:
+            return super().parse(stream, media_type, parser_context)
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            data = stream.read()
+            if encoding.lower().replace('-', '') != 'utf8':
+                data = data.decode(encoding)
+            return loads(data)
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+class NDJSONParser(BaseParser):
+    """
+    Parses newline delimited JSON lazily: request.data is a generator
+    yielding one decoded object per non-empty line, so large uploads are
+    never held in memory at once. A line that is not valid JSON is
+    yielded as a ValueError instance for the caller to report; a body
+    that does not decode with its charset raises ParseError.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', 'utf-8')
+        return self.iter_objects(stream, encoding)
+
+    def iter_objects(self, stream, encoding):
+        if stream is None:
+            return
+        for line in stream:
+            try:
+                line = line.decode(encoding).strip()
+            except UnicodeDecodeError as exc:
+                raise ParseError('NDJSON parse error - %s' % str(exc))
+            if not line:
+                continue
+            try:
+                yield loads(line)
+            except ValueError as error:
+                yield error
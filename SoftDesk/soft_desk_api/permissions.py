@@ -1,22 +1,27 @@
 """
 This module defines permission classes for the api.
+
+Membership checks read from soft_desk_api.membership, which resolves the
+projects of the requesting user once per request. The async read path
+resolves it beforehand with aget_membership(), so the same checks run on
+the event loop without any I/O.
 """
 from rest_framework.permissions import (
     IsAuthenticated, BasePermission, SAFE_METHODS
     )
-from soft_desk_api.models import Contributor, Project, Issue, Comment
+from soft_desk_api.models import Project, Issue, Comment
+from soft_desk_api.membership import get_membership
 
 
 class IsAuthor(IsAuthenticated):
     def has_object_permission(self, request, view, obj):
-        return bool(obj.author == request.user)
+        return bool(obj.author_id == request.user.pk)
 
 
 class IsContributor(BasePermission):
     def has_object_permission(self, request, view, obj):
-        user = request.user
-        project = get_project(obj)
-        if is_contributor_verifier(user, project):
+        project_id = get_project_id(obj)
+        if get_membership(request).is_contributor(project_id):
             if request.method in SAFE_METHODS:
                 return True
             elif request.method in ['PATCH']:
@@ -27,16 +32,12 @@ class IsContributor(BasePermission):
             return False
 
 
-def get_project(obj):
+def get_project_id(obj):
     if isinstance(obj, Project):
-        return obj
+        return obj.pk
     elif isinstance(obj, Issue):
-        return obj.project
+        return obj.project_id
     elif isinstance(obj, Comment):
-        return obj.issue.project
+        return obj.issue.project_id
     else:
         return None
-
-
-def is_contributor_verifier(user, project):
-    return Contributor.objects.filter(user=user, project=project).exists()
@@ -0,0 +1,237 @@
+"""
+Opt-in sampling profiler for slow or randomly chosen requests.
+
+ProfilingMiddleware registers the thread handling a profiled request with
+a single background Sampler, which reads the thread's Python stack every
+INTERVAL seconds through sys._current_frames(). The request thread itself
+only pays for a dict insertion and an execute_wrapper recording the SQL
+trace.
+
+A request is profiled when it is picked with probability SAMPLE_RATE, or
+when SLOW_THRESHOLD is set, in which case every request is sampled and the
+profile kept only if the request took at least that many seconds. Kept
+profiles are written to DIRECTORY/<endpoint>/<profile id>.folded (collapsed
+stacks, one 'frame;frame;frame count' line per distinct stack) and
+<profile id>.json (request details and SQL trace). The profile id is made
+by the server, from the time and a random part, and sent back in the
+X-Profile-ID header; the X-Request-ID of the client is only recorded in
+the .json. Past MAX_PROFILES profiles of an endpoint, the oldest are
+deleted. The profile_report command aggregates them into flamegraph-ready
+output.
+
+Configured through the SOFT_DESK_PROFILING setting:
+    ENABLED        - the middleware removes itself when False
+    SAMPLE_RATE    - fraction of requests always profiled, 0 to 1
+    SLOW_THRESHOLD - seconds after which a request is kept, None to disable
+    INTERVAL       - seconds between two stack samples
+    DIRECTORY      - where profiles are written
+    MAX_PROFILES   - profiles kept per endpoint
+"""
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from soft_desk_api.instrumentation import REQUEST_ATTRIBUTE, get_endpoint
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'SAMPLE_RATE': 0.0,
+    'SLOW_THRESHOLD': None,
+    'INTERVAL': 0.005,
+    'DIRECTORY': 'profiles',
+    'MAX_PROFILES': 500,
+}
+REQUEST_ID_HEADER = 'X-Request-ID'
+PROFILE_ID_HEADER = 'X-Profile-ID'
+UNSAFE_CHARACTERS = re.compile(r'[^\w.-]')
+
+
+def get_setting(name):
+    return getattr(settings, 'SOFT_DESK_PROFILING', {}).get(
+        name, DEFAULTS[name])
+
+
+def frame_label(frame):
+    code = frame.f_code
+    module = frame.f_globals.get('__name__', code.co_filename)
+    return f'{module}:{code.co_name}:{code.co_firstlineno}'
+
+
+def collapse(frame):
+    """ Root-first 'frame;frame;frame' representation of a stack """
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+def new_profile_id():
+    """ Sorts in the order the profiles were recorded """
+    now = time.time()
+    return (f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(now))}"
+            f"{int(now % 1 * 1_000_000):06d}-{uuid.uuid4().hex[:8]}")
+
+
+class Profile:
+    """ Stacks and SQL statements collected for one request """
+    def __init__(self, request_id=None):
+        self.profile_id = new_profile_id()
+        self.request_id = request_id
+        self.start = time.perf_counter()
+        self.stacks = Counter()
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.statements.append({
+                'offset_ms': round((start - self.start) * 1000, 3),
+                'duration_ms': round(
+                    (time.perf_counter() - start) * 1000, 3),
+                'sql': sql,
+                'many': many,
+            })
+
+
+class Sampler(threading.Thread):
+    """
+    Samples the stacks of the registered threads. The thread sleeps on an
+    event while no request is being profiled.
+    """
+    def __init__(self, interval):
+        super().__init__(name='soft-desk-sampler', daemon=True)
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.active = {}
+        self.wakeup = threading.Event()
+
+    def register(self, thread_id, profile):
+        with self.lock:
+            self.active[thread_id] = profile
+        self.wakeup.set()
+
+    def unregister(self, thread_id):
+        with self.lock:
+            self.active.pop(thread_id, None)
+            if not self.active:
+                self.wakeup.clear()
+
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            time.sleep(self.interval)
+            with self.lock:
+                active = list(self.active.items())
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for thread_id, profile in active:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    profile.stacks[collapse(frame)] += 1
+
+
+def safe_name(value):
+    return UNSAFE_CHARACTERS.sub('_', str(value))[:100] or '_'
+
+
+def write_profile(directory, endpoint, profile, details):
+    """ Writes the .folded and .json files of a profile, returns the base """
+    folder = os.path.join(directory, safe_name(endpoint))
+    os.makedirs(folder, exist_ok=True)
+    base = os.path.join(folder, profile.profile_id)
+    with open(f'{base}.folded', 'w') as folded:
+        for stack, count in profile.stacks.most_common():
+            folded.write(f'{stack} {count}\n')
+    with open(f'{base}.json', 'w') as trace:
+        json.dump(dict(details, endpoint=endpoint,
+                       profile_id=profile.profile_id,
+                       request_id=profile.request_id,
+                       samples=sum(profile.stacks.values()),
+                       statements=profile.statements),
+                  trace, indent=2)
+    prune_profiles(folder, get_setting('MAX_PROFILES'))
+    return base
+
+
+def prune_profiles(folder, keep):
+    """ Deletes the oldest profiles of folder past the keep latest """
+    profile_ids = sorted({name.rsplit('.', 1)[0]
+                          for name in os.listdir(folder)
+                          if name.endswith(('.folded', '.json'))})
+    for profile_id in profile_ids[:max(len(profile_ids) - keep, 0)]:
+        for suffix in ('.folded', '.json'):
+            try:
+                os.remove(os.path.join(folder, profile_id + suffix))
+            except FileNotFoundError:
+                pass
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not get_setting('ENABLED'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = get_setting('SAMPLE_RATE')
+        self.slow_threshold = get_setting('SLOW_THRESHOLD')
+        self.directory = str(get_setting('DIRECTORY'))
+        self.sampler = Sampler(get_setting('INTERVAL'))
+        self.sampler.start()
+
+    def __call__(self, request):
+        sampled = random.random() < self.sample_rate
+        if not sampled and self.slow_threshold is None:
+            return self.get_response(request)
+        request_id = request.headers.get(REQUEST_ID_HEADER)
+        profile = Profile(request_id and safe_name(request_id))
+        thread_id = threading.get_ident()
+        self.sampler.register(thread_id, profile)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            self.sampler.unregister(thread_id)
+        duration = time.perf_counter() - profile.start
+        slow = (self.slow_threshold is not None
+                and duration >= self.slow_threshold)
+        if sampled or slow:
+            self.save(request, response, profile, duration,
+                      'slow' if slow else 'sampled')
+        return response
+
+    def save(self, request, response, profile, duration, reason):
+        metrics = getattr(request, REQUEST_ATTRIBUTE, None)
+        endpoint = getattr(metrics, 'endpoint', None) or get_endpoint(request)
+        details = {
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 3),
+            'reason': reason,
+            'recorded_at': time.time(),
+        }
+        try:
+            write_profile(self.directory, endpoint, profile, details)
+        except OSError:
+            logger.exception('Could not write the profile of %s', endpoint)
+            return
+        response[PROFILE_ID_HEADER] = profile.profile_id
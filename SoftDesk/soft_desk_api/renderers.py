@@ -0,0 +1,68 @@
+"""
+JSON encoding through orjson, with the stdlib json module as fallback.
+
+orjson encodes datetimes (with the 'Z' suffix for UTC, as DRF does), UUIDs,
+dates and times natively; anything else it cannot encode (lazy strings,
+Decimals, timedeltas, querysets...) goes through DRF's JSONEncoder.default,
+so the output is the bytes DRF's JSONRenderer would have produced. When
+orjson is not installed, or rejects a payload (integers over 64 bits),
+dumps() and the renderer fall back to the stdlib encoder.
+
+    pip install orjson
+"""
+import json
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS if orjson else None
+
+LINE_SEPARATORS = [('\u2028'.encode(), b'\\u2028'),
+                   ('\u2029'.encode(), b'\\u2029')]
+encoder_default = JSONEncoder().default
+
+
+def dumps(data):
+    """ Compact UTF-8 JSON bytes of data """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, default=encoder_default,
+                                option=OPTIONS)
+        except orjson.JSONEncodeError:
+            pass
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False,
+                      allow_nan=False, separators=(',', ':')).encode()
+
+
+def loads(data):
+    """ Decodes JSON bytes or str, raising ValueError when invalid """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer encoding through dumps(). Indented output (asked for with
+    'application/json; indent=4', or by the browsable api) and non-default
+    JSON settings go through JSONRenderer.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if (orjson is None or indent is not None or self.ensure_ascii
+                or not self.compact or not self.strict):
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        content = dumps(data)
+        # Kept escaped, like JSONRenderer does, for JavaScript parsers.
+        if b'\xe2\x80' in content:
+            for character, escaped in LINE_SEPARATORS:
+                content = content.replace(character, escaped)
+        return content
@@ -0,0 +1,191 @@
+"""
+Read-through cache for the GET responses of the api viewsets.
+
+Entries are keyed by the requesting user, the generation of that user's
+memberships and the generation of the project the resource belongs to
+(or of the project list). Writes never scan or delete entries: the signal
+handlers in soft_desk_api.signals bump one generation counter, which makes
+every key built from it unreachable until it expires.
+
+Configured through the SOFT_DESK_RESPONSE_CACHE setting:
+    ALIAS   - the CACHES alias to store entries in, 'default' by default
+    TIMEOUT - lifetime of an entry in seconds
+    ENABLED - set to False to bypass the cache entirely
+"""
+import hashlib
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+DEFAULTS = {
+    'ALIAS': 'default',
+    'TIMEOUT': 300,
+    'ENABLED': True,
+}
+PROJECT_LIST = 'list'
+
+stats = Counter()
+
+
+def get_setting(name):
+    return getattr(settings, 'SOFT_DESK_RESPONSE_CACHE', {}).get(
+        name, DEFAULTS[name])
+
+
+def get_cache():
+    return caches[get_setting('ALIAS')]
+
+
+def user_generation_key(user_id):
+    return f'soft_desk:gen:user:{user_id}'
+
+
+def project_generation_key(project_id):
+    return f'soft_desk:gen:project:{project_id}'
+
+
+def get_generations(*keys):
+    """
+    Reads generation counters, creating the missing ones. A new counter
+    starts from the current time so that a counter evicted from the cache
+    never comes back with a value an older entry was stored under.
+    """
+    cache = get_cache()
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, time.time_ns(), None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+async def aget_generations(*keys):
+    """ get_generations() through the async cache api """
+    cache = get_cache()
+    generations = await cache.aget_many(keys)
+    for key in keys:
+        if key not in generations:
+            await cache.aadd(key, time.time_ns(), None)
+            generations[key] = await cache.aget(key)
+    return [generations[key] for key in keys]
+
+
+def bump(*keys):
+    cache = get_cache()
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), None)
+
+
+def invalidate_projects(*project_ids):
+    keys = [project_generation_key(pk) for pk in project_ids]
+    transaction.on_commit(lambda: bump(*keys))
+
+
+def invalidate_users(*user_ids):
+    keys = [user_generation_key(pk) for pk in user_ids]
+    transaction.on_commit(lambda: bump(*keys))
+
+
+def response_key(request, scope, user_generation, scope_generation):
+    url = hashlib.md5(
+        request.build_absolute_uri().encode()
+    ).hexdigest()
+    return (f'soft_desk:resp:{request.user.pk}:{user_generation}:'
+            f'{scope}:{scope_generation}:{url}')
+
+
+def get_response_key(request, scope):
+    """
+    Builds the cache key of a GET request for the given scope, which is
+    a project id or PROJECT_LIST.
+    """
+    return response_key(request, scope, *get_generations(
+        user_generation_key(request.user.pk), project_generation_key(scope)
+    ))
+
+
+async def aget_response_key(request, scope):
+    return response_key(request, scope, *await aget_generations(
+        user_generation_key(request.user.pk), project_generation_key(scope)
+    ))
+
+
+class CachedResponseMixin:
+    """
+    Caches the data of list and retrieve responses.
+    `cache_scope_kwarg` names the url kwarg holding the project id;
+    None caches against the project list generation, and for detail
+    routes 'pk' is used. Viewsets return False from is_cacheable() for
+    requests whose response depends on more than that generation.
+    alist() and aretrieve() do the same on the async read path.
+    """
+    cache_scope_kwarg = None
+
+    def is_cacheable(self):
+        return True
+
+    def get_cache_scope(self):
+        kwarg = self.cache_scope_kwarg
+        if kwarg is None:
+            return self.kwargs['pk'] if self.detail else PROJECT_LIST
+        return self.kwargs[kwarg]
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request,
+                                    *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if not get_setting('ENABLED') or not self.is_cacheable():
+            return handler(request, *args, **kwargs)
+        cache = get_cache()
+        key = get_response_key(request, self.get_cache_scope())
+        data = cache.get(key)
+        if data is not None:
+            stats['hit'] += 1
+            response = Response(data, status=status.HTTP_200_OK)
+            response['X-Cache'] = 'HIT'
+            return response
+        stats['miss'] += 1
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, get_setting('TIMEOUT'))
+        response['X-Cache'] = 'MISS'
+        return response
+
+    async def alist(self, request, *args, **kwargs):
+        return await self.acached_response(super().alist, request,
+                                           *args, **kwargs)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        return await self.acached_response(super().aretrieve, request,
+                                           *args, **kwargs)
+
+    async def acached_response(self, handler, request, *args, **kwargs):
+        """ cached_response() of the async read path """
+        if not get_setting('ENABLED') or not self.is_cacheable():
+            return await handler(request, *args, **kwargs)
+        cache = get_cache()
+        key = await aget_response_key(request, self.get_cache_scope())
+        data = await cache.aget(key)
+        if data is not None:
+            stats['hit'] += 1
+            response = Response(data, status=status.HTTP_200_OK)
+            response['X-Cache'] = 'HIT'
+            return response
+        stats['miss'] += 1
+        response = await handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            await cache.aset(key, response.data, get_setting('TIMEOUT'))
+        response['X-Cache'] = 'MISS'
+        return response
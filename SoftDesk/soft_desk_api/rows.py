@@ -0,0 +1,141 @@
+"""
+Read-only serializers working on values() rows.
+
+Serializing a list page through a ModelSerializer builds a model instance
+per row and walks the DRF field machinery for every field of every row.
+A RowSerializer declares, for each output field, the values() lookups it
+reads and the conversion DRF would apply, compiles them to itemgetters
+once, and turns every row into its dict with a single loop. The output
+is the same JSON as the ModelSerializer it mirrors, which keeps handling
+writes, validation and anything nested.
+"""
+from operator import itemgetter
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import ISO_8601
+from rest_framework.fields import DateTimeField
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from soft_desk_api.pagination import apaginate_queryset
+
+DATETIME = 'datetime'
+
+
+def datetime_converter():
+    """
+    DateTimeField.to_representation with the current timezone resolved
+    once, instead of once per value.
+    """
+    if api_settings.DATETIME_FORMAT != ISO_8601:
+        return DateTimeField().to_representation
+    current = timezone.get_current_timezone() if settings.USE_TZ else None
+
+    def convert(value):
+        if current is not None:
+            if timezone.is_aware(value):
+                value = value.astimezone(current)
+            else:
+                value = timezone.make_aware(value, current)
+        value = value.isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return convert
+
+
+CONVERTERS = {DATETIME: datetime_converter}
+
+
+class RowSerializer:
+    """
+    `fields` lists (name, lookup, convert) in output order. convert is
+    applied to non-null values, or None to output the value as read, and
+    names one of CONVERTERS for those built per serializer. A tuple of
+    lookups passes the tuple of their values to convert, which then also
+    handles nulls.
+    """
+    fields = []
+
+    def __init__(self, fieldset=None):
+        self.accessors = []
+        self.lookups = []
+        for name, lookup, convert in self.fields:
+            if fieldset is not None and name not in fieldset:
+                continue
+            if isinstance(convert, str):
+                convert = CONVERTERS[convert]()
+            lookups = lookup if isinstance(lookup, tuple) else (lookup,)
+            self.lookups += [item for item in lookups
+                             if item not in self.lookups]
+            self.accessors.append((name, itemgetter(*lookups), convert,
+                                   isinstance(lookup, tuple)))
+
+    def to_representation(self, row):
+        data = {}
+        for name, get, convert, composite in self.accessors:
+            value = get(row)
+            if convert is not None and (composite or value is not None):
+                value = convert(value)
+            data[name] = value
+        return data
+
+    def rows(self, queryset, *extra):
+        """ The values() queryset the serializer reads, plus extra fields """
+        return queryset.values(*self.lookups,
+                               *[name for name in extra
+                                 if name not in self.lookups])
+
+    def serialize(self, rows):
+        return [self.to_representation(row) for row in rows]
+
+    def serialize_queryset(self, queryset):
+        return self.serialize(self.rows(queryset))
+
+
+class RowListMixin:
+    """
+    Answers list() from values() rows through `row_serializer_class` when
+    the request is served by the viewset's default serializer_class and
+    nests nothing. Needs SparseFieldsetsMixin and get_scoped_queryset().
+    alist() serves the same rows on the async read path, for limit/offset
+    pages only.
+    """
+    row_serializer_class = None
+
+    def use_rows(self):
+        return (self.row_serializer_class is not None
+                and self.get_sparse_request()[1] is None
+                and self.get_serializer_class() is self.serializer_class)
+
+    def get_row_serializer(self):
+        fieldsets = self.get_sparse_request()[0]
+        return self.row_serializer_class(fieldsets.get(self.resource_type))
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_rows():
+            return super().list(request, *args, **kwargs)
+        serializer = self.get_row_serializer()
+        queryset = self.filter_queryset(self.get_scoped_queryset())
+        extra = []
+        get_row_fields = getattr(self.paginator, 'get_row_fields', None)
+        if get_row_fields is not None:
+            extra = get_row_fields(queryset, request, self)
+        rows = serializer.rows(queryset, *extra)
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(serializer.serialize(rows))
+        return self.get_paginated_response(serializer.serialize(page))
+
+    async def alist(self, request, *args, **kwargs):
+        serializer = self.get_row_serializer()
+        rows = serializer.rows(
+            self.filter_queryset(self.get_scoped_queryset()))
+        page = None
+        if self.paginator is not None:
+            page = await apaginate_queryset(self.paginator, rows, request)
+        if page is None:
+            return Response(serializer.serialize(
+                [row async for row in rows.aiterator()]))
+        return self.get_paginated_response(serializer.serialize(page))
@@ -0,0 +1,444 @@
+"""
+Full-text search over issue names and descriptions and comment
+descriptions.
+
+Every issue and comment is a document of a search index stored in the
+database, written by the signal handlers of soft_desk_api.signals in the
+transaction of the change (and by signals.issues_changed for bulk
+writes). The backend is picked from the database vendor:
+    sqlite     - an FTS5 virtual table, ranked with bm25() and highlighted
+                 with snippet()
+    postgresql - a table with a weighted, generated tsvector column and a
+                 GIN index, ranked with ts_rank_cd() and highlighted with
+                 ts_headline()
+    others     - icontains filters on the tables, unranked
+Both index tables are created by migration 0010.
+
+The backends put MATCH_START and MATCH_STOP, two private-use
+characters, around the matched terms. markup() then turns their titles
+and snippets into HTML: the text escaped, the terms between the
+HIGHLIGHT markers, so nothing a user wrote reaches the client
+unescaped.
+
+Configured through the SOFT_DESK_SEARCH setting:
+    BACKEND   - dotted path of a SearchBackend subclass, overriding the
+                vendor default
+    HIGHLIGHT - (start, stop) HTML put around the matched terms
+"""
+import json
+import re
+from abc import ABC, abstractmethod
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+
+from soft_desk_api.models import Issue, Comment
+
+DEFAULTS = {
+    'BACKEND': None,
+    'HIGHLIGHT': ('<mark>', '</mark>'),
+}
+TABLE = 'soft_desk_search'
+KINDS = ('issue', 'comment')
+MAX_TERMS = 16
+SNIPPET_WORDS = 16
+TERMS = re.compile(r'\w+')
+MATCH_START = '\ue000'
+MATCH_STOP = '\ue001'
+MATCHES = re.compile(f'([{MATCH_START}{MATCH_STOP}])')
+
+Document = namedtuple(
+    'Document', 'kind object_id project_id issue_id title body')
+
+
+def get_setting(name):
+    return getattr(settings, 'SOFT_DESK_SEARCH', {}).get(
+        name, DEFAULTS[name])
+
+
+def get_terms(query):
+    """ The words of a user query, stripped of any search syntax """
+    return TERMS.findall(query or '')[:MAX_TERMS]
+
+
+def issue_document(issue):
+    # Views may set project_id from a url kwarg: FTS5 columns have no
+    # type affinity, so ids are normalized before being stored.
+    return Document('issue', issue.pk, int(issue.project_id), issue.pk,
+                    issue.name, issue.description or '')
+
+
+def comment_document(comment, project_id):
+    return Document('comment', comment.pk, int(project_id),
+                    int(comment.issue_id), '', comment.description)
+
+
+class SearchBackend(ABC):
+    """
+    Keeps the index in sync and runs the queries. project_ids always
+    restricts a search to the projects the user can see.
+    """
+    @abstractmethod
+    def index(self, documents):
+        """ Adds or replaces the documents """
+
+    @abstractmethod
+    def remove(self, kind, object_ids):
+        """ Drops the documents of kind object_ids """
+
+    @abstractmethod
+    def rebuild(self, project_ids):
+        """ Reindexes the issues and comments of project_ids """
+
+    @abstractmethod
+    def count(self, terms, project_ids, kind=None):
+        """ The number of documents matching terms """
+
+    @abstractmethod
+    def search(self, terms, project_ids, kind, offset, limit):
+        """ A page of result dicts, best match first """
+
+
+class SQLiteBackend(SearchBackend):
+    """
+    The FTS5 table is addressed by rowid: 2 * id for issues and
+    2 * id + 1 for comments, which makes updates and deletes point
+    lookups. Only title and body are indexed.
+    """
+    @staticmethod
+    def rowid(kind, object_id):
+        return object_id * 2 + (kind == 'comment')
+
+    @staticmethod
+    def match(terms):
+        """ Quoted terms, ANDed, the last one a prefix """
+        quoted = [f'"{term}"' for term in terms]
+        quoted[-1] += '*'
+        return ' '.join(quoted)
+
+    def index(self, documents):
+        rows = [(self.rowid(doc.kind, doc.object_id), *doc)
+                for doc in documents]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s',
+                               [(row[0],) for row in rows])
+            cursor.executemany(
+                f'INSERT INTO {TABLE} (rowid, kind, object_id, project_id, '
+                f'issue_id, title, body) VALUES (%s, %s, %s, %s, %s, %s, %s)',
+                rows)
+
+    def remove(self, kind, object_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s',
+                               [(self.rowid(kind, pk),) for pk in object_ids])
+
+    def rebuild(self, project_ids):
+        issues = Issue._meta.db_table
+        comments = Comment._meta.db_table
+        ids = json.dumps(list(project_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {TABLE} WHERE project_id IN '
+                f'(SELECT value FROM json_each(%s))', [ids])
+            cursor.execute(
+                f"INSERT INTO {TABLE} (rowid, kind, object_id, project_id, "
+                f"issue_id, title, body) "
+                f"SELECT id * 2, 'issue', id, project_id, id, name, "
+                f"COALESCE(description, '') FROM {issues} "
+                f"WHERE project_id IN (SELECT value FROM json_each(%s))",
+                [ids])
+            cursor.execute(
+                f"INSERT INTO {TABLE} (rowid, kind, object_id, project_id, "
+                f"issue_id, title, body) "
+                f"SELECT c.id * 2 + 1, 'comment', c.id, i.project_id, "
+                f"c.issue_id, '', c.description FROM {comments} c "
+                f"JOIN {issues} i ON i.id = c.issue_id "
+                f"WHERE i.project_id IN (SELECT value FROM json_each(%s))",
+                [ids])
+
+    def where(self, terms, project_ids, kind):
+        sql = (f'{TABLE} MATCH %s AND project_id IN '
+               f'(SELECT value FROM json_each(%s))')
+        params = [self.match(terms), json.dumps(list(project_ids))]
+        if kind is not None:
+            sql += ' AND kind = %s'
+            params.append(kind)
+        return sql, params
+
+    def count(self, terms, project_ids, kind=None):
+        where, params = self.where(terms, project_ids, kind)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {TABLE} WHERE {where}',
+                           params)
+            return cursor.fetchone()[0]
+
+    def search(self, terms, project_ids, kind, offset, limit):
+        where, params = self.where(terms, project_ids, kind)
+        sql = (
+            f"SELECT kind, object_id, project_id, issue_id, "
+            f"highlight({TABLE}, 4, %s, %s), "
+            f"snippet({TABLE}, 5, %s, %s, '…', {SNIPPET_WORDS}), "
+            f"bm25({TABLE}, 0, 0, 0, 0, 10.0, 1.0) AS score "
+            f"FROM {TABLE} WHERE {where} ORDER BY score LIMIT %s OFFSET %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [MATCH_START, MATCH_STOP, MATCH_START,
+                                 MATCH_STOP, *params, limit, offset])
+            return [result(*row[:6], -row[6]) for row in cursor.fetchall()]
+
+
+class PostgreSQLBackend(SearchBackend):
+    """
+    Issue names weigh more than descriptions (weights A and B of the
+    generated tsvector). Highlighting only runs on the returned page.
+    """
+    config = 'english'
+
+    @staticmethod
+    def tsquery(terms):
+        """ to_tsquery() input: the terms ANDed, the last one a prefix """
+        return ' & '.join(terms) + ':*'
+
+    def index(self, documents):
+        if not documents:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {TABLE} (kind, object_id, project_id, '
+                f'issue_id, title, body) VALUES (%s, %s, %s, %s, %s, %s) '
+                f'ON CONFLICT (kind, object_id) DO UPDATE SET '
+                f'project_id = EXCLUDED.project_id, '
+                f'issue_id = EXCLUDED.issue_id, title = EXCLUDED.title, '
+                f'body = EXCLUDED.body', list(documents))
+
+    def remove(self, kind, object_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {TABLE} WHERE kind = %s AND '
+                f'object_id = ANY(%s)', [kind, list(object_ids)])
+
+    def rebuild(self, project_ids):
+        issues = Issue._meta.db_table
+        comments = Comment._meta.db_table
+        ids = list(project_ids)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {TABLE} WHERE project_id = ANY(%s)', [ids])
+            cursor.execute(
+                f"INSERT INTO {TABLE} (kind, object_id, project_id, "
+                f"issue_id, title, body) "
+                f"SELECT 'issue', id, project_id, id, name, "
+                f"COALESCE(description, '') FROM {issues} "
+                f"WHERE project_id = ANY(%s)", [ids])
+            cursor.execute(
+                f"INSERT INTO {TABLE} (kind, object_id, project_id, "
+                f"issue_id, title, body) "
+                f"SELECT 'comment', c.id, i.project_id, c.issue_id, '', "
+                f"c.description FROM {comments} c "
+                f"JOIN {issues} i ON i.id = c.issue_id "
+                f"WHERE i.project_id = ANY(%s)", [ids])
+
+    def where(self, terms, project_ids, kind):
+        sql = 'document @@ query AND project_id = ANY(%s)'
+        params = [list(project_ids)]
+        if kind is not None:
+            sql += ' AND kind = %s'
+            params.append(kind)
+        return sql, params
+
+    def count(self, terms, project_ids, kind=None):
+        where, params = self.where(terms, project_ids, kind)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT COUNT(*) FROM {TABLE}, '
+                f'to_tsquery(%s::regconfig, %s) query WHERE {where}',
+                [self.config, self.tsquery(terms), *params])
+            return cursor.fetchone()[0]
+
+    def search(self, terms, project_ids, kind, offset, limit):
+        options = (f'StartSel="{MATCH_START}", StopSel="{MATCH_STOP}", '
+                   f'MaxWords={SNIPPET_WORDS}, MinWords=5')
+        where, params = self.where(terms, project_ids, kind)
+        sql = (
+            f"SELECT kind, object_id, project_id, issue_id, "
+            f"ts_headline(%s::regconfig, title, query, %s), "
+            f"ts_headline(%s::regconfig, body, query, %s), score "
+            f"FROM (SELECT kind, object_id, project_id, issue_id, title, "
+            f"body, query, ts_rank_cd(document, query) AS score "
+            f"FROM {TABLE}, to_tsquery(%s::regconfig, %s) query "
+            f"WHERE {where} ORDER BY score DESC, kind, object_id "
+            f"LIMIT %s OFFSET %s) page ORDER BY score DESC, kind, object_id"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [self.config, options, self.config, options,
+                                 self.config, self.tsquery(terms), *params,
+                                 limit, offset])
+            return [result(*row) for row in cursor.fetchall()]
+
+
+class ScanBackend(SearchBackend):
+    """
+    No index: icontains filters on the tables, issues before comments.
+    Only meant for databases without a full-text backend.
+    """
+    def index(self, documents):
+        pass
+
+    def remove(self, kind, object_ids):
+        pass
+
+    def rebuild(self, project_ids):
+        pass
+
+    def querysets(self, terms, project_ids, kind):
+        issues = Issue.objects.filter(project_id__in=project_ids)
+        comments = Comment.objects.filter(issue__project_id__in=project_ids)
+        for term in terms:
+            issues = issues.filter(Q(name__icontains=term)
+                                   | Q(description__icontains=term))
+            comments = comments.filter(description__icontains=term)
+        return [
+            ('issue', issues.order_by('pk').values_list(
+                'pk', 'project_id', 'pk', 'name', 'description')),
+            ('comment', comments.order_by('pk').values_list(
+                'pk', 'issue__project_id', 'issue_id', 'description',
+                'description')),
+        ]
+
+    def count(self, terms, project_ids, kind=None):
+        return sum(queryset.count() for name, queryset
+                   in self.querysets(terms, project_ids, kind)
+                   if kind in (None, name))
+
+    def search(self, terms, project_ids, kind, offset, limit):
+        results = []
+        for name, queryset in self.querysets(terms, project_ids, kind):
+            if kind not in (None, name) or len(results) >= limit:
+                continue
+            total = queryset.count()
+            if offset >= total:
+                offset -= total
+                continue
+            for pk, project_id, issue_id, title, body in queryset[
+                    offset:offset + limit - len(results)]:
+                results.append(result(
+                    name, pk, project_id, issue_id,
+                    title if name == 'issue' else '',
+                    (body or '')[:200], 0.0))
+            offset = 0
+        return results
+
+
+BACKENDS = {
+    'sqlite': SQLiteBackend,
+    'postgresql': PostgreSQLBackend,
+}
+
+
+def markup(text):
+    """
+    text as HTML: escaped, with the terms between MATCH_START and
+    MATCH_STOP put between the HIGHLIGHT markers. The markers are
+    balanced whatever text holds: the characters typed in by a user can
+    at most highlight some of their own text.
+    """
+    start, stop = get_setting('HIGHLIGHT')
+    parts = []
+    highlighting = False
+    for part in MATCHES.split(text):
+        if part == MATCH_START:
+            if not highlighting:
+                parts.append(start)
+                highlighting = True
+        elif part == MATCH_STOP:
+            if highlighting:
+                parts.append(stop)
+                highlighting = False
+        else:
+            parts.append(escape(part))
+    if highlighting:
+        parts.append(stop)
+    return ''.join(parts)
+
+
+def result(kind, object_id, project_id, issue_id, title, snippet, rank):
+    return {'kind': kind, 'id': object_id, 'project': project_id,
+            'issue': issue_id, 'title': markup(title),
+            'snippet': markup(snippet), 'rank': rank}
+
+
+def get_backend():
+    path = get_setting('BACKEND')
+    if path:
+        return import_string(path)()
+    return BACKENDS.get(connection.vendor, ScanBackend)()
+
+
+class SearchResults:
+    """
+    Lazy results of a search, counted and sliced the way the DRF
+    paginators count and slice a queryset.
+    """
+    def __init__(self, query, project_ids, kind=None, backend=None):
+        self.terms = get_terms(query)
+        self.project_ids = sorted(project_ids)
+        self.kind = kind
+        self.backend = backend or get_backend()
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            if not self.terms or not self.project_ids:
+                self._count = 0
+            else:
+                self._count = self.backend.count(
+                    self.terms, self.project_ids, self.kind)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError('SearchResults only support slicing.')
+        start = key.start or 0
+        if not self.terms or not self.project_ids or key.stop <= start:
+            return []
+        return self.backend.search(self.terms, self.project_ids, self.kind,
+                                   start, key.stop - start)
+
+
+def index_issues(issues):
+    get_backend().index([issue_document(issue) for issue in issues])
+
+
+def index_comments(comments, project_id):
+    get_backend().index([comment_document(comment, project_id)
+                         for comment in comments])
+
+
+def reindex_issue(issue, with_comments=False):
+    """
+    Indexes issue, and its comments when the issue changed project.
+    """
+    documents = [issue_document(issue)]
+    if with_comments:
+        documents += [comment_document(comment, issue.project_id)
+                      for comment in Comment.objects.filter(
+                          issue_id=issue.pk).only('id', 'issue_id',
+                                                  'description')]
+    get_backend().index(documents)
+
+
+def remove(kind, object_ids):
+    get_backend().remove(kind, object_ids)
+
+
+def rebuild(project_ids):
+    get_backend().rebuild(project_ids)
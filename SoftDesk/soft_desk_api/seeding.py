@@ -0,0 +1,136 @@
+"""
+Synthetic dataset generator used by the seed_data and benchmark commands.
+
+Sizes follow power laws, as in real trackers: a few projects hold most
+of the issues, a few issues most of the comments, and contributor counts
+are skewed the same way. Everything is written with bulk_create, then
+the project counters and the search index are rebuilt. All users share
+the password BENCHMARK_PASSWORD.
+"""
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from custom_auth.models import User
+from soft_desk_api.models import Project, Contributor, Issue, Comment
+from soft_desk_api import search, stats
+
+BENCHMARK_PASSWORD = 'benchmark-password'
+USERNAME_PREFIX = 'seed_user_'
+
+
+class Dataset:
+    def __init__(self, users=200, projects=50, issues=5000, comments=20000,
+                 max_contributors=100, alpha=1.2, seed=0, batch_size=2000):
+        self.users = users
+        self.projects = projects
+        self.issues = issues
+        self.comments = comments
+        self.max_contributors = max_contributors
+        self.alpha = alpha
+        self.seed = seed
+        self.batch_size = batch_size
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def power_law_weights(count, alpha, rng):
+    return [rng.paretovariate(alpha) for _ in range(count)]
+
+
+def distribute(items, buckets, alpha, rng):
+    """ Assigns each of items to one of buckets, power-law skewed """
+    weights = power_law_weights(len(buckets), alpha, rng)
+    return rng.choices(buckets, weights=weights, k=items)
+
+
+def seed(dataset, stdout=None):
+    """
+    Writes dataset and returns the created projects, largest first.
+    """
+    rng = random.Random(dataset.seed)
+    batch_size = dataset.batch_size
+
+    def log(message):
+        if stdout is not None:
+            stdout.write(message)
+
+    with transaction.atomic():
+        password = make_password(BENCHMARK_PASSWORD)
+        offset = User.objects.filter(
+            username__startswith=USERNAME_PREFIX).count()
+        users = User.objects.bulk_create(
+            [User(username=f'{USERNAME_PREFIX}{offset + i}',
+                  password=password, age=rng.randint(15, 70))
+             for i in range(dataset.users)],
+            batch_size=batch_size,
+        )
+        log(f'{len(users)} users')
+
+        projects = Project.objects.bulk_create(
+            [Project(author=author, name=f'Project {i}',
+                     description=f'Synthetic project {i}',
+                     project_type=rng.choice(Project.TYPE_CHOICES)[0])
+             for i, author in enumerate(
+                 distribute(dataset.projects, users, dataset.alpha, rng))],
+            batch_size=batch_size,
+        )
+        log(f'{len(projects)} projects')
+
+        contributors = []
+        members = {}
+        for project in projects:
+            size = min(int(rng.paretovariate(dataset.alpha)),
+                       dataset.max_contributors, len(users))
+            group = {project.author} | set(rng.sample(users, size))
+            members[project.pk] = list(group)
+            contributors += [Contributor(user=user, project=project)
+                             for user in group]
+        contributors = Contributor.objects.bulk_create(
+            contributors, batch_size=batch_size)
+        log(f'{len(contributors)} contributors')
+        by_project = {}
+        for contributor in contributors:
+            by_project.setdefault(contributor.project_id, []).append(
+                contributor)
+
+        issues = []
+        for project in distribute(dataset.issues, projects,
+                                  dataset.alpha, rng):
+            issues.append(Issue(
+                project=project,
+                author=rng.choice(members[project.pk]),
+                name=f'Issue {len(issues)}',
+                description='Synthetic issue ' * rng.randint(1, 20),
+                status=rng.choice(Issue.STATUS_CHOICES)[0],
+                priority=rng.choice(Issue.PRIORITY_CHOICES)[0],
+                flag=rng.choice(Issue.FLAG_CHOICES)[0],
+                attribution=(rng.choice(by_project[project.pk])
+                             if rng.random() < 0.7 else None),
+            ))
+        issues = Issue.objects.bulk_create(issues, batch_size=batch_size)
+        log(f'{len(issues)} issues')
+
+        if issues:
+            comments = [
+                Comment(issue=issue, project_id=issue.project_id,
+                        author=rng.choice(members[issue.project_id]),
+                        description='Synthetic comment ' * rng.randint(1, 30))
+                for issue in distribute(dataset.comments, issues,
+                                        dataset.alpha, rng)
+            ]
+            Comment.objects.bulk_create(comments, batch_size=batch_size)
+            log(f'{len(comments)} comments')
+
+        project_ids = [project.pk for project in projects]
+        stats.reconcile(project_ids)
+        search.rebuild(project_ids)
+
+    issue_counts = {}
+    for issue in issues:
+        issue_counts[issue.project_id] = (
+            issue_counts.get(issue.project_id, 0) + 1)
+    return sorted(projects, key=lambda project: -issue_counts.get(
+        project.pk, 0))
@@ -2,15 +2,24 @@
 File containing serializers used by the soft_desk_api app.
 """
 from rest_framework.serializers import (
-    ModelSerializer, CharField, SlugRelatedField, SerializerMethodField
+    ModelSerializer, Serializer, CharField, SlugRelatedField,
+    SerializerMethodField, ListField, IntegerField, FloatField
     )
 from rest_framework.exceptions import ValidationError
 
-from soft_desk_api.models import Project, Contributor, Issue, Comment
+from soft_desk_api.models import (
+    Project, Contributor, Issue, Comment, Tombstone, ProjectStats, Deletion,
+    Job
+    )
+from soft_desk_api.fieldsets import SparseFieldsMixin
+from soft_desk_api.rows import RowSerializer, DATETIME
 from custom_auth.models import User
 
+OPEN_ISSUE_STATUSES = ['to do', 'in progress']
+
 
-class ContributorSerializer(ModelSerializer):
+class ContributorSerializer(SparseFieldsMixin, ModelSerializer):
+    resource_type = 'contributor'
     username = CharField(source='user.username', read_only=True)
 
     class Meta:
@@ -19,8 +28,62 @@ class ContributorSerializer(ModelSerializer):
         read_only_fields = ['username']
 
 
-class CommentSerializer(ModelSerializer):
-    author = CharField(source='author.user.username', read_only=True)
+class ContributorRowSerializer(RowSerializer):
+    fields = [('username', 'user__username', None)]
+
+
+class ContributorChangeSerializer(ModelSerializer):
+    username = CharField(source='user.username', read_only=True)
+
+    class Meta:
+        model = Contributor
+        fields = ['id', 'username', 'created_at']
+        read_only_fields = fields
+
+
+class TombstoneSerializer(ModelSerializer):
+
+    class Meta:
+        model = Tombstone
+        fields = ['kind', 'object_id', 'data', 'deleted_at']
+        read_only_fields = fields
+
+
+class DeletionSerializer(ModelSerializer):
+
+    class Meta:
+        model = Deletion
+        fields = ['uuid', 'kind', 'object_id', 'status', 'progress',
+                  'requested_at', 'finished_at']
+        read_only_fields = fields
+
+
+class JobSerializer(ModelSerializer):
+
+    class Meta:
+        model = Job
+        fields = ['uuid', 'task', 'status', 'attempts', 'result',
+                  'enqueued_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
+
+class ContributorBulkSerializer(Serializer):
+    usernames = ListField(child=CharField(), max_length=1000)
+
+
+class SearchResultSerializer(Serializer):
+    kind = CharField(read_only=True)
+    id = IntegerField(read_only=True)
+    project = IntegerField(read_only=True)
+    issue = IntegerField(read_only=True)
+    title = CharField(read_only=True)
+    snippet = CharField(read_only=True)
+    rank = FloatField(read_only=True)
+
+
+class CommentSerializer(SparseFieldsMixin, ModelSerializer):
+    resource_type = 'comment'
+    author = CharField(source='author.username', read_only=True)
 
     class Meta:
         model = Comment
@@ -28,8 +91,19 @@ class CommentSerializer(ModelSerializer):
         read_only_fields = ['id', 'uuid', 'author', 'created_at']
 
 
-class CommentDetailSerializer(ModelSerializer):
-    author = CharField(source='author.user.username', read_only=True)
+class CommentRowSerializer(RowSerializer):
+    fields = [
+        ('id', 'id', None),
+        ('uuid', 'uuid', str),
+        ('author', 'author__username', None),
+        ('description', 'description', None),
+        ('created_at', 'created_at', DATETIME),
+    ]
+
+
+class CommentDetailSerializer(SparseFieldsMixin, ModelSerializer):
+    resource_type = 'comment'
+    author = CharField(source='author.username', read_only=True)
 
     class Meta:
         model = Comment
@@ -39,7 +113,23 @@ class CommentDetailSerializer(ModelSerializer):
                             'created_at', 'updated_at']
 
 
-class IssueSerializer(ModelSerializer):
+def included_comments():
+    return CommentSerializer(source='latest_comments', many=True,
+                             read_only=True)
+
+
+def included_contributors():
+    return ContributorSerializer(many=True, read_only=True)
+
+
+def included_issues():
+    return IssueIncludeSerializer(source='open_issues', many=True,
+                                  read_only=True)
+
+
+class IssueSerializer(SparseFieldsMixin, ModelSerializer):
+    resource_type = 'issue'
+    includes = {'comments': included_comments}
     attribution = CharField(
         required=False,
         allow_null=True,
@@ -51,14 +141,46 @@ class IssueSerializer(ModelSerializer):
 
     class Meta:
         model = Issue
-        fields = ['id', 'name', 'status', 'attribution', 'description']
-        read_only_fields = ['id']
+        fields = ['id', 'name', 'status', 'attribution', 'description',
+                  'comment_count']
+        read_only_fields = ['id', 'comment_count']
 
     def validate_attribution(self, value):
-        contributor = check_contributor(self.context['project_id'], value)
+        contributor = check_contributor(self.context['project_id'], value,
+                                        self.context.get('contributors'))
         return contributor
 
 
+def attribution_name(values):
+    """ str() of the attributed Contributor, from its values() lookups """
+    contributor_id, username, project_name = values
+    if contributor_id is None:
+        return None
+    return f"{username} - {project_name}"
+
+
+class IssueRowSerializer(RowSerializer):
+    fields = [
+        ('id', 'id', None),
+        ('name', 'name', None),
+        ('status', 'status', None),
+        ('attribution', ('attribution', 'attribution__user__username',
+                         'attribution__project__name'), attribution_name),
+        ('comment_count', 'comment_count', None),
+    ]
+
+
+class IssueBulkSerializer(IssueSerializer):
+    description = CharField(allow_blank=True, allow_null=True,
+                            required=False)
+
+    class Meta:
+        model = Issue
+        fields = ['id', 'name', 'description', 'status', 'priority',
+                  'flag', 'attribution']
+        read_only_fields = ['id']
+
+
 class IssueLightSerializer(ModelSerializer):
 
     class Meta:
@@ -67,29 +189,55 @@ class IssueLightSerializer(ModelSerializer):
         read_only_fields = ['id']
 
     def validate_attribution(self, value):
-        contributor = check_contributor(self.context['project_id'], value)
+        contributor = check_contributor(self.context['project_id'], value,
+                                        self.context.get('contributors'))
         return contributor
 
 
-class IssueDetailSerializer(ModelSerializer):
+class IssueLightRowSerializer(RowSerializer):
+    fields = [
+        ('id', 'id', None),
+        ('name', 'name', None),
+        ('status', 'status', None),
+    ]
+
+
+class IssueIncludeSerializer(SparseFieldsMixin, ModelSerializer):
+    resource_type = 'issue'
+    includes = {'comments': included_comments}
+
+    class Meta:
+        model = Issue
+        fields = ['id', 'name', 'status']
+        read_only_fields = fields
+
+
+class IssueDetailSerializer(SparseFieldsMixin, ModelSerializer):
+    resource_type = 'issue'
+    includes = {'comments': included_comments}
     attribution = CharField(
         required=False,
         allow_null=True,
         allow_blank=True,
     )
-    author = CharField(source='author.user.username', read_only=True)
+    author = CharField(source='author.username', read_only=True)
 
     class Meta:
         model = Issue
         fields = '__all__'
-        read_only_fields = ['id', 'author', 'created_at', 'updated_at']
+        # Moving an issue would leave its attribution in the project it
+        # came from.
+        read_only_fields = ['id', 'author', 'project', 'comment_count',
+                            'created_at', 'updated_at']
 
     def validate_attribution(self, value):
-        contributor = check_contributor(self.context['project_id'], value)
+        contributor = check_contributor(self.context['project_id'], value,
+                                        self.context.get('contributors'))
         return contributor
 
 
-class ProjectSerializer(ModelSerializer):
+class ProjectSerializer(SparseFieldsMixin, ModelSerializer):
+    resource_type = 'project'
     author = SlugRelatedField(read_only=True, slug_field='username')
     description = CharField(
         allow_blank=True, allow_null=True, write_only=True, required=False
@@ -102,25 +250,97 @@ class ProjectSerializer(ModelSerializer):
         read_only_fields = ['author', 'id']
 
 
-class ProjectDetailSerializer(ModelSerializer):
+class ProjectRowSerializer(RowSerializer):
+    fields = [
+        ('name', 'name', None),
+        ('id', 'id', None),
+        ('author', 'author__username', None),
+    ]
+
+
+class ProjectStatsSerializer(ModelSerializer):
+    issues = SerializerMethodField()
+    status = SerializerMethodField()
+    priority = SerializerMethodField()
+    flag = SerializerMethodField()
+
+    class Meta:
+        model = ProjectStats
+        fields = ['issues', 'status', 'priority', 'flag', 'comments',
+                  'updated_at']
+        read_only_fields = fields
+
+    def get_issues(self, obj):
+        return sum(self.get_status(obj).values())
+
+    def get_status(self, obj):
+        return counts_of(obj, 'issues', Issue.STATUS_CHOICES)
+
+    def get_priority(self, obj):
+        return counts_of(obj, 'priority', Issue.PRIORITY_CHOICES)
+
+    def get_flag(self, obj):
+        return counts_of(obj, 'flag', Issue.FLAG_CHOICES)
+
+
+class ProjectListStatsSerializer(ProjectSerializer):
+    stats = ProjectStatsSerializer(read_only=True)
+
+    class Meta(ProjectSerializer.Meta):
+        fields = ProjectSerializer.Meta.fields + ['stats']
+
+
+class ProjectDetailSerializer(SparseFieldsMixin, ModelSerializer):
+    resource_type = 'project'
+    includes = {'issues': included_issues,
+                'contributors': included_contributors}
     author = SlugRelatedField(read_only=True, slug_field='username')
-    contributors = ContributorSerializer(many=True, read_only=True)
+    contributors = SerializerMethodField()
     issues = SerializerMethodField()
 
     class Meta:
         model = Project
-        fields = '__all__'
+        # Listed: deletion_requested_at is internal to soft_desk_api.deletion.
+        fields = ['id', 'author', 'contributors', 'issues', 'name',
+                  'description', 'created_at', 'updated_at', 'project_type']
         read_only_fields = ['author', 'id', 'created_at',
                             'updated_at', 'issues']
 
+    def get_contributors(self, obj):
+        serializer = ContributorRowSerializer(self.get_fieldset('contributor'))
+        return serializer.serialize_queryset(obj.contributors.all())
+
     def get_issues(self, obj):
-        queryset = obj.issues.filter(status__in=['to do', 'in progress'])
-        return IssueLightSerializer(queryset, many=True).data
+        serializer = IssueLightRowSerializer(self.get_fieldset('issue'))
+        return serializer.serialize_queryset(
+            obj.issues.filter(status__in=OPEN_ISSUE_STATUSES))
+
+
+def counts_of(stats, prefix, choices):
+    """ {choice: count} read from the '<prefix>_<choice>' columns """
+    return {value: getattr(stats, f"{prefix}_{value.replace(' ', '_')}")
+            for value, _ in choices}
 
 
-def check_contributor(project_id, value):
+def check_contributor(project_id, value, contributors=None):
+    """
+    Returns the Contributor of project_id named value. `contributors`
+    optionally maps usernames to their pre-loaded Contributor, or to None
+    for users that exist but do not contribute; usernames missing from it
+    are then treated as unknown users without querying the database.
+    """
     if not value:
         return None
+    if contributors is not None:
+        if value not in contributors:
+            raise ValidationError(
+                f"User with username '{value}' does not exist."
+                )
+        if contributors[value] is None:
+            raise ValidationError(
+                f"User '{value}' is not a contributor to this project."
+                )
+        return contributors[value]
     try:
         user = User.objects.get(username=value)
     except User.DoesNotExist:
@@ -0,0 +1,170 @@
+"""
+Signal handlers keeping the soft_desk_api caches in sync with the database,
+and publishing the changes to the event streams (soft_desk_api.events).
+"""
+from django.db.models.functions import Now
+from django.db.models.signals import (
+    pre_save, post_save, pre_delete, post_delete
+)
+from django.dispatch import receiver
+
+from soft_desk_api.models import (
+    Contributor, Project, Issue, Comment, Tombstone, ProjectStats
+)
+from soft_desk_api.membership import invalidate_membership
+from soft_desk_api import events, jobs, response_cache, search, stats
+
+
+def contributors_changed(project_id, user_ids):
+    """
+    Invalidates everything derived from the contributors of a project.
+    Also called by code writing Contributor rows without signals.
+    """
+    invalidate_membership(*user_ids)
+    response_cache.invalidate_users(*user_ids)
+    response_cache.invalidate_projects(project_id)
+    events.memberships_changed(user_ids)
+
+
+def issues_changed(project_id, issue_ids):
+    """
+    Invalidates everything derived from the given issues of a project.
+    Called by code writing Issue rows without signals. The counters are
+    rebuilt by a job, once for the writes queued meanwhile.
+    """
+    jobs.enqueue('rebuild_stats', project_id,
+                 key=f'rebuild_stats:{project_id}')
+    search.index_issues(Issue.objects.filter(pk__in=issue_ids).only(
+        'id', 'project_id', 'name', 'description'))
+    response_cache.invalidate_projects(project_id)
+    events.publish(project_id, 'issues',
+                   Issue.objects.filter(pk__in=issue_ids))
+
+
+@receiver([post_save, post_delete], sender=Contributor)
+def contributor_changed(sender, instance, **kwargs):
+    contributors_changed(instance.project_id, [instance.user_id])
+
+
+@receiver(post_save, sender=Contributor)
+def contributor_saved(sender, instance, created, **kwargs):
+    if created:
+        events.publish(instance.project_id, 'contributors', [instance])
+
+
+@receiver(pre_delete, sender=Contributor)
+def contributor_deleting(sender, instance, **kwargs):
+    """
+    Nulls the attributions to instance ahead of the SET_NULL of the
+    deletion, which leaves updated_at alone: the change feed and the
+    validators would miss them.
+    """
+    issue_ids = list(Issue.objects.filter(attribution=instance)
+                     .values_list('pk', flat=True))
+    if not issue_ids:
+        return
+    Issue.objects.filter(pk__in=issue_ids).update(attribution=None,
+                                                  updated_at=Now())
+    events.publish(instance.project_id, 'issues',
+                   Issue.objects.filter(pk__in=issue_ids))
+
+
+@receiver(post_delete, sender=Contributor)
+def contributor_deleted(sender, instance, **kwargs):
+    tombstone = Tombstone.objects.create(project_id=instance.project_id,
+                                         kind='contributor',
+                                         object_id=instance.pk,
+                                         data={'user': instance.user_id})
+    events.publish(instance.project_id, 'deleted', [tombstone])
+
+
+@receiver([post_save, post_delete], sender=Project)
+def project_changed(sender, instance, **kwargs):
+    invalidate_membership(instance.author_id)
+    response_cache.invalidate_users(instance.author_id)
+    events.memberships_changed([instance.author_id])
+    response_cache.invalidate_projects(instance.pk,
+                                       response_cache.PROJECT_LIST)
+
+
+@receiver(post_save, sender=Project)
+def project_created(sender, instance, created, **kwargs):
+    if created:
+        ProjectStats.objects.create(project=instance)
+
+
+@receiver(post_delete, sender=Project)
+def project_deleted(sender, instance, **kwargs):
+    Tombstone.objects.filter(project_id=instance.pk).delete()
+
+
+@receiver(pre_save, sender=Issue)
+def issue_saving(sender, instance, **kwargs):
+    if instance._state.adding or hasattr(instance, '_counted_values'):
+        return
+    instance._counted_values = Issue.objects.filter(
+        pk=instance.pk).values_list(*Issue.COUNTED_FIELDS).first()
+
+
+@receiver([post_save, post_delete], sender=Issue)
+def issue_changed(sender, instance, **kwargs):
+    response_cache.invalidate_projects(instance.project_id)
+
+
+def issue_moved(issue, previous_project_id):
+    """
+    Moves the comments of issue along with it. Their updated_at is bumped
+    so that the change feed of the new project returns them.
+    """
+    moved = Comment.objects.filter(issue_id=issue.pk).update(
+        project_id=issue.project_id, updated_at=Now())
+    stats.comments_moved(previous_project_id, issue.project_id, moved)
+    response_cache.invalidate_projects(previous_project_id)
+
+
+@receiver(post_save, sender=Issue)
+def issue_saved(sender, instance, created, **kwargs):
+    previous = None if created else instance._counted_values
+    moved = previous is not None and previous[0] != int(instance.project_id)
+    if moved:
+        issue_moved(instance, previous[0])
+    stats.issue_saved(instance, previous)
+    search.reindex_issue(instance, with_comments=moved)
+    instance._counted_values = tuple(
+        getattr(instance, field) for field in Issue.COUNTED_FIELDS)
+    events.publish(instance.project_id, 'issues', [instance])
+
+
+@receiver(post_delete, sender=Issue)
+def issue_deleted(sender, instance, **kwargs):
+    tombstone = Tombstone.objects.create(project_id=instance.project_id,
+                                         kind='issue', object_id=instance.pk)
+    events.publish(instance.project_id, 'deleted', [tombstone])
+    previous = getattr(instance, '_counted_values', None) or tuple(
+        getattr(instance, field) for field in Issue.COUNTED_FIELDS)
+    stats.issue_deleted(*previous)
+    search.remove('issue', [instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def comment_changed(sender, instance, **kwargs):
+    response_cache.invalidate_projects(instance.project_id)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        stats.comment_counted(instance.project_id, instance.issue_id, 1)
+    search.index_comments([instance], instance.project_id)
+    events.publish(instance.project_id, 'comments', [instance])
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    tombstone = Tombstone.objects.create(
+        project_id=instance.project_id, kind='comment',
+        object_id=instance.pk,
+        data={'issue': instance.issue_id, 'uuid': str(instance.uuid)})
+    stats.comment_counted(instance.project_id, instance.issue_id, -1)
+    events.publish(instance.project_id, 'deleted', [tombstone])
+    search.remove('comment', [instance.pk])
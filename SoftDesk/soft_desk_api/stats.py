@@ -0,0 +1,166 @@
+"""
+Denormalized issue and comment counters.
+
+Every project has a ProjectStats row counting its issues per status,
+priority and flag, and its comments; every issue counts its comments in
+Issue.comment_count. The signal handlers apply +1/-1 deltas with F()
+expressions, in the transaction of the write that caused them, so reading
+the counters of a project costs one row whatever its size.
+
+Code writing rows without signals calls signals.issues_changed, which
+rebuilds the counters of the project, and reconcile() (the reconcile_stats
+command) rebuilds the counters of any set of projects from the tables.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, Q, OuterRef
+from django.db.models.functions import Coalesce, Now
+from django.utils import timezone
+
+from soft_desk_api.models import Project, Issue, Comment, ProjectStats
+from soft_desk_api.conditional import count_subquery
+
+ISSUE_COUNTERS = [
+    (field, value, f"{prefix}_{value.replace(' ', '_')}")
+    for field, prefix, choices in [
+        ('status', 'issues', Issue.STATUS_CHOICES),
+        ('priority', 'priority', Issue.PRIORITY_CHOICES),
+        ('flag', 'flag', Issue.FLAG_CHOICES),
+    ]
+    for value, _ in choices
+]
+COLUMNS = [column for _, _, column in ISSUE_COUNTERS] + ['comments']
+RECONCILE_BATCH_SIZE = 500
+
+
+def issue_columns(status, priority, flag):
+    """ The ProjectStats columns counting an issue with these values """
+    values = {'status': status, 'priority': priority, 'flag': flag}
+    return [column for field, value, column in ISSUE_COUNTERS
+            if values[field] == value]
+
+
+def apply_deltas(project_id, deltas):
+    """
+    Adds the {column: delta} counts to the stats of project_id. A project
+    without stats is left alone: its counters are built on first read.
+    """
+    deltas = {column: delta for column, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    ProjectStats.objects.filter(project_id=project_id).update(
+        updated_at=timezone.now(),
+        **{column: F(column) + delta for column, delta in deltas.items()}
+    )
+
+
+def issue_saved(issue, previous):
+    """
+    previous holds the (project_id, status, priority, flag) the issue was
+    counted under, None for a new issue.
+    """
+    current = tuple(getattr(issue, field) for field in Issue.COUNTED_FIELDS)
+    if previous == current:
+        return
+    if previous is not None:
+        issue_deleted(*previous)
+    project_id, status, priority, flag = current
+    apply_deltas(project_id, Counter(issue_columns(status, priority, flag)))
+
+
+def issue_deleted(project_id, status, priority, flag):
+    apply_deltas(project_id, {
+        column: -1 for column in issue_columns(status, priority, flag)
+    })
+
+
+def comment_counted(project_id, issue_id, delta):
+    # updated_at goes with comment_count: the validators and the change
+    # feed of the issues read it.
+    Issue.objects.filter(pk=issue_id).update(
+        comment_count=F('comment_count') + delta, updated_at=Now())
+    apply_deltas(project_id, {'comments': delta})
+
+
+def comments_moved(from_project_id, to_project_id, count):
+    """ Counts count comments in to_project_id instead of from_project_id """
+    apply_deltas(from_project_id, {'comments': -count})
+    apply_deltas(to_project_id, {'comments': count})
+
+
+def compute_stats(project_ids):
+    """ {project_id: {column: count}} computed from the tables """
+    stats = {project_id: dict.fromkeys(COLUMNS, 0)
+             for project_id in project_ids}
+    issue_rows = (
+        Issue.objects.filter(project_id__in=project_ids).order_by()
+        .values('project_id')
+        .annotate(**{column: Count('pk', filter=Q(**{field: value}))
+                     for field, value, column in ISSUE_COUNTERS})
+    )
+    for row in issue_rows:
+        stats[row.pop('project_id')].update(row)
+    comment_rows = (
+        Comment.objects.filter(issue__project_id__in=project_ids).order_by()
+        .values('issue__project_id').annotate(total=Count('pk'))
+    )
+    for row in comment_rows:
+        stats[row['issue__project_id']]['comments'] = row['total']
+    return stats
+
+
+def rebuild(project_ids):
+    """
+    Rewrites the stats and issue comment counts of project_ids.
+    Returns the ids of the projects whose stats were missing or wrong.
+    """
+    project_ids = list(project_ids)
+    expected = compute_stats(project_ids)
+    current = {
+        row.pop('project_id'): row for row in
+        ProjectStats.objects.filter(project_id__in=project_ids)
+        .values('project_id', *COLUMNS)
+    }
+    drifted = [project_id for project_id, counts in expected.items()
+               if current.get(project_id) != counts]
+    if drifted:
+        now = timezone.now()
+        ProjectStats.objects.bulk_create(
+            [ProjectStats(project_id=project_id, updated_at=now,
+                          **expected[project_id])
+             for project_id in drifted],
+            update_conflicts=True, unique_fields=['project'],
+            update_fields=COLUMNS + ['updated_at'],
+        )
+    actual = Coalesce(count_subquery(
+        Comment.objects.filter(issue=OuterRef('pk')), 'issue'), 0)
+    Issue.objects.filter(project_id__in=project_ids).annotate(
+        actual=actual).exclude(comment_count=F('actual')).update(
+        comment_count=actual, updated_at=Now())
+    return drifted
+
+
+def reconcile(project_ids=None, batch_size=RECONCILE_BATCH_SIZE):
+    """
+    rebuild() over every project, or project_ids, one transaction per
+    batch of projects.
+    """
+    queryset = Project.objects.order_by('pk')
+    if project_ids is not None:
+        queryset = queryset.filter(pk__in=project_ids)
+    ids = list(queryset.values_list('pk', flat=True))
+    drifted = []
+    for start in range(0, len(ids), batch_size):
+        with transaction.atomic():
+            drifted += rebuild(ids[start:start + batch_size])
+    return drifted
+
+
+def get_stats(project):
+    """ The ProjectStats of project, built if it does not exist yet """
+    try:
+        return project.stats
+    except ProjectStats.DoesNotExist:
+        rebuild([project.pk])
+        return ProjectStats.objects.get(project=project)
@@ -0,0 +1,99 @@
+"""
+Tasks of the job queue (see soft_desk_api.jobs), enqueued by the views
+and by the other modules of the app:
+    purge_deletion     - request_user_deletion() / request_project_deletion()
+    rebuild_stats      - signals.issues_changed(), after bulk writes
+    reconcile_stats    - `python manage.py reconcile_stats --enqueue`
+    notify_assignee    - IssueViewset, when an issue gets assigned
+    notify_commented   - CommentViewset, when an issue is commented
+    export_project     - ProjectViewset.export with ?deferred=true
+    prune_tombstones   - `python manage.py prune_tombstones --enqueue`
+"""
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.mail import send_mail
+from django.db import transaction
+
+from soft_desk_api import changes, deletion, export, response_cache, stats
+from soft_desk_api.jobs import task
+from soft_desk_api.models import Comment, Deletion, Issue
+
+EXPORT_DIRECTORY = 'exports'
+
+
+@task
+def purge_deletion(deletion_id):
+    pending = Deletion.objects.filter(pk=deletion_id,
+                                      finished_at=None).first()
+    if pending is None:
+        return {'purged': False}
+    return {'purged': deletion.purge(pending)}
+
+
+@task
+def rebuild_stats(project_id):
+    with transaction.atomic():
+        drifted = stats.rebuild([project_id])
+    response_cache.invalidate_projects(project_id)
+    return {'drifted': drifted}
+
+
+@task(max_attempts=1)
+def reconcile_stats(project_ids=None):
+    drifted = stats.reconcile(project_ids)
+    response_cache.invalidate_projects(*drifted)
+    return {'drifted': drifted}
+
+
+def notify(user, subject, message):
+    """ Mails user if they agreed to be contacted """
+    if not user.can_be_contacted or not user.email:
+        return {'sent': 0}
+    return {'sent': send_mail(subject, message, None, [user.email])}
+
+
+@task
+def notify_assignee(issue_id):
+    issue = (Issue.objects.select_related('project', 'attribution__user')
+             .filter(pk=issue_id).first())
+    if issue is None or issue.attribution is None:
+        return {'sent': 0}
+    return notify(issue.attribution.user,
+                  f'[{issue.project.name}] {issue.name}',
+                  f'The issue "{issue.name}" ({issue.priority} priority) '
+                  f'of {issue.project.name} was assigned to you.')
+
+
+@task
+def notify_commented(comment_id):
+    comment = (Comment.objects
+               .select_related('author', 'issue__author', 'issue__project')
+               .filter(pk=comment_id).first())
+    if comment is None or comment.author_id == comment.issue.author_id:
+        return {'sent': 0}
+    issue = comment.issue
+    return notify(issue.author, f'[{issue.project.name}] {issue.name}',
+                  f'{comment.author.username} commented on your issue '
+                  f'"{issue.name}":\n\n{comment.description}')
+
+
+@task
+def export_project(project_id, output):
+    """ Writes the export to the default storage, returns its file """
+    name = f'{EXPORT_DIRECTORY}/{export.export_file_name(project_id, output)}'
+    with tempfile.TemporaryFile() as file:
+        for line in export.export_lines(project_id, output):
+            file.write(line.encode() if isinstance(line, str) else line)
+        file.seek(0)
+        # One file per project and format, replaced by the next export.
+        default_storage.delete(name)
+        name = default_storage.save(name, File(file))
+    return {'file': name, 'size': default_storage.size(name),
+            'content_type': export.CONTENT_TYPES[output]}
+
+
+@task(max_attempts=1)
+def prune_tombstones():
+    return {'pruned': changes.prune_tombstones()}
@@ -0,0 +1,67 @@
+"""
+The fixture shared by the tests of the api: a project with several
+contributors, issues and comments, so a relation loaded per row shows up
+as extra queries.
+"""
+from django.core.cache import cache
+from rest_framework.test import APITestCase
+
+from custom_auth.models import User
+from soft_desk_api.models import Project, Contributor, Issue, Comment
+
+ROWS = 6
+
+
+class SoftDeskTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author', age=30)
+        cls.project = Project.objects.create(
+            author=cls.author, name='Tracker', description='Issue tracker',
+            project_type='back-end')
+        # As ProjectViewset.perform_create does.
+        Contributor.objects.create(project=cls.project, user=cls.author)
+        contributors = [
+            Contributor.objects.create(
+                project=cls.project,
+                user=User.objects.create(username=f'member{i}', age=30))
+            for i in range(ROWS)
+        ]
+        for i in range(ROWS):
+            issue = Issue.objects.create(
+                author=cls.author, project=cls.project, name=f'issue {i}',
+                description='A synthetic issue',
+                attribution=contributors[i])
+            for contributor in contributors[:3]:
+                Comment.objects.create(author=contributor.user, issue=issue,
+                                       description='A synthetic comment')
+        cls.contributors = contributors
+        cls.members = [contributor.user for contributor in contributors]
+        cls.issue = issue
+        cls.comment = Comment.objects.filter(issue=issue).first()
+
+    def setUp(self):
+        # Memberships and responses are cached: every test starts cold.
+        cache.clear()
+        self.client.force_authenticate(self.author)
+
+    @property
+    def project_url(self):
+        return f'/api/projects/{self.project.pk}/'
+
+    @property
+    def issue_url(self):
+        return f'{self.project_url}issues/{self.issue.pk}/'
+
+    @property
+    def comment_url(self):
+        return f'{self.issue_url}comments/{self.comment.pk}/'
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        if response.streaming:
+            # Its queries run, and are budgeted, as the body is read.
+            b''.join(response.streaming_content)
+            response.close()
+        self.assertEqual(response.status_code, 200)
+        return response
@@ -0,0 +1,134 @@
+"""
+The async read path (soft_desk_api.async_views) against the synchronous
+viewsets: the same status, body and validators for every read it serves.
+"""
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.test import AsyncClient, override_settings
+from django.urls import include, path
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from custom_auth.models import User
+from SoftDesk.urls import router, projects_router, issues_router
+from soft_desk_api.async_views import async_urlpatterns
+from soft_desk_api.tests.base import SoftDeskTestCase
+from soft_desk_api.views import CommentViewset, IssueViewset, ProjectViewset
+
+# get_urls() builds new patterns: those of SoftDesk.urls stay synchronous.
+urlpatterns = [
+    path('api/', include(async_urlpatterns(router.get_urls()))),
+    path('api/', include(async_urlpatterns(projects_router.get_urls()))),
+    path('api/', include(async_urlpatterns(issues_router.get_urls()))),
+]
+HEADERS = ['ETag', 'Last-Modified', 'Content-Type']
+
+
+def refuse_sync(viewset):
+    """ Makes the synchronous list() and retrieve() of viewset fail """
+    error = AssertionError(f'{viewset.__name__} served synchronously')
+    return [mock.patch.object(viewset, name, side_effect=error)
+            for name in ('list', 'retrieve')]
+
+
+@override_settings(ROOT_URLCONF=__name__,
+                   SOFT_DESK_RESPONSE_CACHE={'ENABLED': False})
+class AsyncReadTests(SoftDeskTestCase):
+    def setUp(self):
+        super().setUp()
+        self.authorize(self.author)
+
+    def authorize(self, user):
+        token = f'Bearer {AccessToken.for_user(user)}'
+        self.client = APIClient(headers={'Authorization': token})
+        # AsyncClient sends no default headers.
+        self.async_headers = {'Authorization': token}
+        self.async_client = AsyncClient()
+
+    async def async_get(self, url, params=None, **headers):
+        return await self.async_client.get(
+            url, params, headers={**self.async_headers, **headers})
+
+    async def assertSameResponse(self, url, **params):
+        expected = await self.sync_get(url, **params)
+        patches = [patch for viewset in (ProjectViewset, IssueViewset,
+                                         CommentViewset)
+                   for patch in refuse_sync(viewset)]
+        for patch in patches:
+            patch.start()
+        try:
+            response = await self.async_get(url, params)
+        finally:
+            for patch in patches:
+                patch.stop()
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content, expected.content)
+        for header in HEADERS:
+            self.assertEqual(response.get(header), expected.get(header))
+        return response
+
+    async def sync_get(self, url, **params):
+        return await sync_to_async(self.client.get)(url, params)
+
+    async def test_lists(self):
+        for url in ['/api/projects/', f'{self.project_url}issues/',
+                    f'{self.issue_url}comments/']:
+            with self.subTest(url):
+                response = await self.assertSameResponse(url)
+                self.assertEqual(response.status_code, 200)
+                await self.assertSameResponse(url, limit=2, offset=3)
+
+    async def test_details(self):
+        for url in [self.project_url, self.issue_url, self.comment_url]:
+            with self.subTest(url):
+                response = await self.assertSameResponse(url)
+                self.assertEqual(response.status_code, 200)
+
+    async def test_fieldsets(self):
+        await self.assertSameResponse(f'{self.project_url}issues/',
+                                      **{'fields[issue]': 'id,status'})
+        await self.assertSameResponse(self.comment_url,
+                                      **{'fields[comment]': 'description'})
+
+    async def test_filters(self):
+        await self.assertSameResponse(f'{self.project_url}issues/',
+                                      status='to do')
+
+    async def test_not_modified(self):
+        etag = (await self.async_get(self.issue_url))['ETag']
+        response = await self.async_get(self.issue_url,
+                                        **{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_member(self):
+        self.authorize(self.members[0])
+        await self.assertSameResponse(self.issue_url)
+        # Projects are only retrieved by their author.
+        response = await self.assertSameResponse(self.project_url)
+        self.assertEqual(response.status_code, 403)
+
+    async def test_outsider(self):
+        outsider = await User.objects.acreate(username='outsider', age=30)
+        self.authorize(outsider)
+        response = await self.assertSameResponse(self.issue_url)
+        self.assertEqual(response.status_code, 404)
+        await self.assertSameResponse(f'{self.project_url}issues/')
+
+    async def test_anonymous(self):
+        self.client = APIClient()
+        self.async_headers = {}
+        response = await self.assertSameResponse(self.issue_url)
+        self.assertEqual(response.status_code, 401)
+
+    async def test_missing(self):
+        response = await self.assertSameResponse(
+            f'{self.project_url}issues/0/')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_writes_stay_synchronous(self):
+        response = await self.async_client.patch(
+            self.issue_url, {'name': 'renamed'},
+            content_type='application/json', headers=self.async_headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'renamed')
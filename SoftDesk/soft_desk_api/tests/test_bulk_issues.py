@@ -0,0 +1,89 @@
+"""
+Bulk issue creation and update, /api/projects/<id>/issues/bulk/.
+"""
+from custom_auth.models import User
+from soft_desk_api.models import Issue, Job, Project
+from soft_desk_api.tests.base import SoftDeskTestCase
+
+
+class BulkIssueTests(SoftDeskTestCase):
+    @property
+    def url(self):
+        return f'{self.project_url}issues/bulk/'
+
+    def bulk(self, method, data, status=200, **kwargs):
+        kwargs.setdefault('format', 'json')
+        response = getattr(self.client, method)(self.url, data, **kwargs)
+        self.assertEqual(response.status_code, status, response.content)
+        return response.json()
+
+    def test_create(self):
+        data = self.bulk('post', [
+            {'name': 'first', 'attribution': 'member0'},
+            {'name': 'second', 'priority': 'urgent'},
+            {'name': 'third', 'attribution': 'nobody'},
+            'not an object',
+            {'name': 'fourth', 'flag': 'bug'},
+        ])
+        self.assertEqual((data['succeeded'], data['failed']), (2, 3))
+        results = data['results']
+        self.assertEqual([result['index'] for result in results],
+                         [0, 1, 2, 3, 4])
+        self.assertEqual(set(results[1]['errors']), {'priority'})
+        self.assertEqual(set(results[2]['errors']), {'attribution'})
+        self.assertEqual(results[3]['errors'],
+                         {'non_field_errors': ['Expected an object.']})
+        first = Issue.objects.get(pk=results[0]['id'])
+        self.assertEqual((first.author, first.project_id,
+                          first.attribution.user),
+                         (self.author, self.project.pk, self.members[0]))
+        self.assertEqual(Issue.objects.get(pk=results[4]['id']).flag, 'bug')
+        # Counters are rebuilt by a job, the cached responses dropped.
+        self.assertTrue(Job.objects.filter(task='rebuild_stats').exists())
+
+    def test_create_ndjson(self):
+        body = (b'{"name": "first"}\n\n'
+                b'{"name": \n'
+                b'{"name": "second"}\n')
+        data = self.bulk('post', body, format=None,
+                         content_type='application/x-ndjson')
+        self.assertEqual((data['succeeded'], data['failed']), (2, 1))
+        self.assertIn('Invalid JSON',
+                      data['results'][1]['errors']['non_field_errors'][0])
+
+    def test_update(self):
+        project = Project.objects.create(author=self.author, name='Other',
+                                         project_type='iOS')
+        other = Issue.objects.create(author=self.author, project=project,
+                                     name='elsewhere')
+        data = self.bulk('patch', [
+            {'id': self.issue.pk, 'status': 'finished', 'attribution': ''},
+            {'id': other.pk, 'status': 'finished'},
+            {'id': self.issue.pk, 'status': 'unknown'},
+            {'status': 'finished'},
+        ])
+        self.assertEqual((data['succeeded'], data['failed']), (1, 3))
+        errors = [result.get('errors') for result in data['results']]
+        self.assertIsNone(errors[0])
+        self.assertEqual(errors[1], {'id': [f'Issue {other.pk} not found.']})
+        self.assertEqual(set(errors[2]), {'status'})
+        self.assertEqual(errors[3], {'id': ['Issue None not found.']})
+        self.issue.refresh_from_db()
+        self.assertEqual(self.issue.status, 'finished')
+        self.assertIsNone(self.issue.attribution)
+        other.refresh_from_db()
+        self.assertEqual(other.status, 'to do')
+
+    def test_not_a_list(self):
+        for body in ['5', 'null', '"ab"', '{"name": "one"}', 'true']:
+            with self.subTest(body=body):
+                data = self.bulk('post', body, status=400, format=None,
+                                 content_type='application/json')
+                self.assertEqual(data, {'non_field_errors': [
+                    'Expected a list of issues.']})
+        self.assertEqual(Issue.objects.count(), 6)
+
+    def test_outsider(self):
+        self.client.force_authenticate(
+            User.objects.create(username='outsider', age=30))
+        self.bulk('post', [{'name': 'first'}], status=403)
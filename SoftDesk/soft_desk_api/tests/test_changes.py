@@ -0,0 +1,179 @@
+"""
+The change feed of a project (soft_desk_api.changes), read through
+/api/projects/<id>/changes/.
+"""
+from datetime import timedelta
+
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from custom_auth.models import User
+from soft_desk_api import changes, stats
+from soft_desk_api.models import (
+    Comment, Contributor, Issue, Project, ProjectStats, Tombstone
+)
+from soft_desk_api.tests.base import SoftDeskTestCase
+
+
+class ChangeFeedTestCase(SoftDeskTestCase):
+    def changes(self, project=None, **params):
+        project = project or self.project
+        return self.get(f'/api/projects/{project.pk}/changes/',
+                        **params).json()
+
+
+class ChangeFeedTests(ChangeFeedTestCase):
+    def sync(self, cursor=None, **params):
+        """ The rows of every page of a sync, and its last cursor """
+        rows = {'issues': [], 'comments': [], 'contributors': [],
+                'deleted': []}
+        while True:
+            if cursor is not None:
+                params['cursor'] = cursor
+            data = self.changes(**params)
+            for name, page in rows.items():
+                page += data[name]
+            cursor = data['cursor']
+            if not data['has_more']:
+                return rows, cursor
+
+    def ids(self, rows):
+        return [row['id'] for row in rows]
+
+    def test_first_sync(self):
+        data = self.changes()
+        self.assertFalse(data['has_more'])
+        self.assertEqual(len(data['issues']), 6)
+        self.assertEqual(len(data['comments']), 18)
+        self.assertEqual(len(data['contributors']), 7)
+        self.assertEqual(data['deleted'], [])
+
+    def test_pages(self):
+        rows, cursor = self.sync(limit=4)
+        issue_ids = self.ids(rows['issues'])
+        self.assertEqual(sorted(issue_ids), sorted(
+            Issue.objects.values_list('pk', flat=True)))
+        self.assertEqual(len(set(self.ids(rows['comments']))), 18)
+        # Within a sync, no row is returned twice.
+        self.assertEqual(len(issue_ids), 6)
+
+    @override_settings(SOFT_DESK_CHANGES={'OVERLAP': 0})
+    def test_resume(self):
+        rows, cursor = self.sync()
+        rows, cursor = self.sync(cursor)
+        self.assertEqual(rows['issues'], [])
+        Issue.objects.get(pk=self.issue.pk).save()
+        rows, cursor = self.sync(cursor)
+        self.assertEqual(self.ids(rows['issues']), [self.issue.pk])
+
+    def test_overlap(self):
+        rows, cursor = self.sync()
+        # Written by a transaction that started before the sync and
+        # committed after it: its timestamp is behind the cursor.
+        Issue.objects.filter(pk=self.issue.pk).update(
+            name='late', updated_at=timezone.now() - timedelta(seconds=2))
+        rows, cursor = self.sync(cursor)
+        self.assertIn('late', [row['name'] for row in rows['issues']])
+        with override_settings(SOFT_DESK_CHANGES={'OVERLAP': 0}):
+            rows, cursor = self.sync()
+            Issue.objects.filter(pk=self.issue.pk).update(
+                name='later',
+                updated_at=timezone.now() - timedelta(seconds=2))
+            rows, cursor = self.sync(cursor)
+            self.assertEqual(rows['issues'], [])
+
+    def test_updated_since(self):
+        since = timezone.now()
+        Issue.objects.get(pk=self.issue.pk).save()
+        rows, cursor = self.sync(updated_since=since.isoformat())
+        self.assertEqual(self.ids(rows['issues']), [self.issue.pk])
+        self.assertEqual(rows['comments'], [])
+
+    def test_tombstones(self):
+        rows, cursor = self.sync()
+        comment_ids = set(Comment.objects.filter(
+            issue=self.issue).values_list('pk', flat=True))
+        Issue.objects.get(pk=self.issue.pk).delete()
+        Contributor.objects.get(user=self.members[0]).delete()
+        rows, cursor = self.sync(cursor)
+        deleted = {(row['kind'], row['object_id']) for row in rows['deleted']}
+        self.assertEqual(deleted, {
+            ('issue', self.issue.pk),
+            ('contributor', self.contributors[0].pk),
+            *(('comment', pk) for pk in comment_ids),
+        })
+
+    def test_invalid(self):
+        url = f'{self.project_url}changes/'
+        expired = timezone.now() - timedelta(days=31)
+        for params in [{'cursor': 'garbage'}, {'updated_since': 'today'},
+                       {'updated_since': expired.isoformat()}]:
+            with self.subTest(params=params):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 400)
+
+    def test_outsider(self):
+        outsider = User.objects.create(username='outsider', age=30)
+        self.client.force_authenticate(outsider)
+        response = self.client.get(f'{self.project_url}changes/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_prune_tombstones(self):
+        Issue.objects.get(pk=self.issue.pk).delete()
+        expired = Tombstone.objects.filter(kind='comment')
+        expired.update(deleted_at=timezone.now() - timedelta(days=31))
+        self.assertEqual(changes.prune_tombstones(batch_size=2), 3)
+        self.assertEqual(
+            list(Tombstone.objects.values_list('kind', flat=True)),
+            ['issue'])
+
+
+class MovedIssueTests(ChangeFeedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = Project.objects.create(author=self.author, name='Other',
+                                            project_type='iOS')
+        Contributor.objects.create(project=self.other, user=self.author)
+
+    def move(self):
+        issue = Issue.objects.get(pk=self.issue.pk)
+        issue.project = self.other
+        issue.attribution = None
+        issue.save()
+
+    def test_comments_follow_the_issue(self):
+        cursor = self.changes(self.other)['cursor']
+        self.move()
+        comments = Comment.objects.filter(issue=self.issue)
+        self.assertEqual(
+            set(comments.values_list('project_id', flat=True)),
+            {self.other.pk})
+        # Read by the syncs of the new project, gone from the old one.
+        data = self.changes(self.other, cursor=cursor)
+        self.assertEqual({row['id'] for row in data['comments']},
+                         set(comments.values_list('pk', flat=True)))
+        data = self.changes()
+        self.assertEqual(len(data['comments']), 15)
+
+    def test_comment_counters(self):
+        self.move()
+        counts = dict(ProjectStats.objects.values_list('project',
+                                                       'comments'))
+        self.assertEqual(counts, {self.project.pk: 15, self.other.pk: 3})
+        self.assertEqual(stats.rebuild([self.project.pk, self.other.pk]), [])
+
+
+class CommentSignalTests(ChangeFeedTestCase):
+    def test_project_read_from_the_comment(self):
+        comment = Comment.objects.get(pk=self.comment.pk)
+        with CaptureQueriesContext(connection) as captured:
+            comment.description = 'edited'
+            comment.save()
+            comment.delete()
+        self.assertFalse([query['sql'] for query in captured
+                          if query['sql'].startswith('SELECT')])
+        self.assertTrue(Tombstone.objects.filter(
+            project_id=self.project.pk, kind='comment',
+            object_id=self.comment.pk).exists())
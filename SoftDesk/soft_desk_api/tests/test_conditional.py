@@ -0,0 +1,117 @@
+"""
+Conditional requests (soft_desk_api.conditional): 304 Not Modified on
+If-None-Match / If-Modified-Since, 412 Precondition Failed on If-Match.
+"""
+from django.utils.http import http_date
+
+from soft_desk_api.models import Comment, Issue, Project
+from soft_desk_api.tests.base import SoftDeskTestCase
+
+
+class ConditionalGetTests(SoftDeskTestCase):
+    def test_detail_not_modified(self):
+        response = self.get(self.issue_url)
+        etag = response['ETag']
+        response = self.client.get(self.issue_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse(response.content)
+
+    def test_detail_modified(self):
+        etag = self.get(self.issue_url)['ETag']
+        Issue.objects.get(pk=self.issue.pk).save()
+        response = self.client.get(self.issue_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_if_modified_since(self):
+        response = self.get(self.comment_url)
+        last_modified = response['Last-Modified']
+        response = self.client.get(self.comment_url,
+                                   HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        earlier = http_date(self.comment.updated_at.timestamp() - 60)
+        response = self.client.get(self.comment_url,
+                                   HTTP_IF_MODIFIED_SINCE=earlier)
+        self.assertEqual(response.status_code, 200)
+
+    def test_collection_not_modified(self):
+        url = f'{self.project_url}issues/'
+        response = self.get(url)
+        self.assertNotIn('Last-Modified', response)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_collection_delete(self):
+        url = f'{self.project_url}issues/'
+        etag = self.get(url)['ETag']
+        Issue.objects.filter(name='issue 0').delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_collection_comment_counts(self):
+        # One issue gains a comment as another loses one: the total is
+        # unchanged, the rows are not.
+        url = f'{self.project_url}issues/'
+        etag = self.get(url)['ETag']
+        first = Issue.objects.get(name='issue 0')
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(author=self.author, issue=first,
+                                   description='one more')
+            Comment.objects.filter(issue=self.issue).first().delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        counts = {row['name']: row['comment_count']
+                  for row in response.json()['results']}
+        self.assertEqual(counts['issue 0'], 4)
+        self.assertEqual(counts[self.issue.name], 2)
+
+    def test_etag_per_user(self):
+        etag = self.get(self.issue_url)['ETag']
+        self.client.force_authenticate(self.members[0])
+        response = self.client.get(self.issue_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class ConditionalUpdateTests(SoftDeskTestCase):
+    def patch(self, url, data, **headers):
+        return self.client.patch(url, data, format='json', headers=headers)
+
+    def test_if_match(self):
+        etag = self.get(self.issue_url)['ETag']
+        response = self.patch(self.issue_url, {'name': 'renamed'},
+                              **{'If-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        # The response holds the validators of the saved issue.
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response['ETag'], self.get(self.issue_url)['ETag'])
+
+    def test_if_match_stale(self):
+        etag = self.get(self.issue_url)['ETag']
+        self.patch(self.issue_url, {'name': 'first'})
+        response = self.patch(self.issue_url, {'name': 'second'},
+                              **{'If-Match': etag})
+        self.assertEqual(response.status_code, 412)
+        self.issue.refresh_from_db()
+        self.assertEqual(self.issue.name, 'first')
+
+    def test_if_match_weak(self):
+        etag = self.get(self.issue_url)['ETag']
+        response = self.patch(self.issue_url, {'name': 'renamed'},
+                              **{'If-Match': f'W/{etag}'})
+        self.assertEqual(response.status_code, 412)
+
+    def test_if_match_any(self):
+        response = self.patch(self.issue_url, {'name': 'renamed'},
+                              **{'If-Match': '*'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_project_not_writable(self):
+        other = Project.objects.create(author=self.author, name='Other',
+                                       project_type='iOS')
+        response = self.patch(self.issue_url, {'project': other.pk,
+                                               'name': 'renamed'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['project'], self.project.pk)
+        self.issue.refresh_from_db()
+        self.assertEqual(self.issue.project_id, self.project.pk)
@@ -0,0 +1,73 @@
+"""
+The bulk contributor endpoint, /api/projects/<id>/contributors/.
+"""
+from soft_desk_api.models import Contributor, Issue, Tombstone
+from soft_desk_api.tests.base import SoftDeskTestCase
+
+
+class BulkContributorTests(SoftDeskTestCase):
+    @property
+    def url(self):
+        return f'{self.project_url}contributors/'
+
+    def usernames(self, count):
+        return [member.username for member in self.members[:count]]
+
+    def remove(self, usernames):
+        response = self.client.delete(self.url, {'usernames': usernames},
+                                      format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_add(self):
+        Contributor.objects.filter(user__in=self.members[:2]).delete()
+        response = self.client.post(
+            self.url, {'usernames': self.usernames(3) + ['nobody']},
+            format='json')
+        self.assertEqual(response.json()['results'], {
+            'member0': 'added', 'member1': 'added',
+            'member2': 'already a contributor', 'nobody': 'not a user',
+        })
+        self.assertEqual(Contributor.objects.filter(
+            project=self.project, user__in=self.members[:3]).count(), 3)
+
+    def test_remove(self):
+        removed = self.contributors[:2]
+        results = self.remove(self.usernames(2) + ['author'])
+        self.assertEqual(results, {'member0': 'removed',
+                                   'member1': 'removed',
+                                   'author': 'project author'})
+        self.assertFalse(Contributor.objects.filter(
+            pk__in=[contributor.pk for contributor in removed]).exists())
+        # Their issues are unassigned and marked changed.
+        unassigned = Issue.objects.filter(name__in=['issue 0', 'issue 1'])
+        for issue in unassigned:
+            self.assertIsNone(issue.attribution_id)
+            self.assertGreater(issue.updated_at, issue.created_at)
+        self.assertEqual(
+            list(Tombstone.objects.filter(kind='contributor')
+                 .order_by('object_id').values_list('object_id', 'data')),
+            [(contributor.pk, {'user': contributor.user_id})
+             for contributor in removed])
+
+    def test_remove_queries_do_not_grow(self):
+        # Warms the membership of the author up.
+        self.remove(['nobody'])
+        with self.assertNumQueries(10) as one:
+            self.remove(self.usernames(1))
+        with self.assertNumQueries(len(one.captured_queries)):
+            self.remove(self.usernames(5)[1:])
+        self.assertEqual(Tombstone.objects.filter(kind='contributor').count(),
+                         5)
+
+    def test_sync(self):
+        response = self.client.put(self.url,
+                                   {'usernames': self.usernames(1)},
+                                   format='json')
+        results = response.json()['results']
+        self.assertEqual(results['member0'], 'already a contributor')
+        self.assertEqual(results['member5'], 'removed')
+        self.assertEqual(
+            set(Contributor.objects.filter(project=self.project)
+                .values_list('user__username', flat=True)),
+            {'author', 'member0'})
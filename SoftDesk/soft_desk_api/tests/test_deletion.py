@@ -0,0 +1,136 @@
+"""
+Background deletion of users and projects (soft_desk_api.deletion): the
+purge in batches, its claim and the purge_deletions command.
+"""
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.utils import timezone
+
+from custom_auth.models import User
+from soft_desk_api import deletion
+from soft_desk_api.models import (
+    Comment, Contributor, Deletion, Issue, Project, ProjectStats, Tombstone
+)
+from soft_desk_api.tests.base import SoftDeskTestCase
+
+
+class PurgeTests(SoftDeskTestCase):
+    def test_project(self):
+        pending = deletion.request_project_deletion(self.project)
+        self.assertTrue(deletion.purge(pending, batch_size=4))
+        self.assertFalse(Project.objects.filter(pk=self.project.pk).exists())
+        self.assertFalse(Issue.objects.exists())
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(Tombstone.objects.exists())
+        pending.refresh_from_db()
+        self.assertIsNotNone(pending.finished_at)
+        self.assertEqual(pending.progress, {
+            'comments': 18, 'issues': 6, 'contributors': 7, 'projects': 1})
+
+    def test_user(self):
+        member = self.members[0]
+        pending = deletion.request_user_deletion(member)
+        self.assertTrue(deletion.purge(pending, batch_size=4))
+        self.assertFalse(User.objects.filter(pk=member.pk).exists())
+        self.assertEqual(Comment.objects.count(), 12)
+        self.assertFalse(Contributor.objects.filter(user=member).exists())
+        self.assertIsNone(Issue.objects.get(name='issue 0').attribution)
+        self.assertEqual(ProjectStats.objects.get(
+            project=self.project).comments, 12)
+        self.assertEqual(
+            Tombstone.objects.filter(project_id=self.project.pk).count(), 7)
+
+    def test_batches(self):
+        pending = deletion.request_project_deletion(self.project)
+        with mock.patch.object(
+                deletion, 'claimed_transaction',
+                wraps=deletion.claimed_transaction) as transactions:
+            deletion.purge(pending, batch_size=4)
+        # 18 comments, 6 issues, 7 contributors and no tombstones, four
+        # at a time and a last empty batch each, then the project.
+        self.assertEqual(transactions.call_count, 6 + 3 + 3 + 1 + 1)
+
+
+class ClaimTests(SoftDeskTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pending = deletion.request_project_deletion(self.project)
+
+    def test_claim(self):
+        self.assertTrue(deletion.claim(self.pending, 600))
+        other = Deletion.objects.get(pk=self.pending.pk)
+        self.assertFalse(deletion.claim(other, 600))
+        self.assertFalse(deletion.purge(other))
+        self.assertTrue(Project.objects.filter(pk=self.project.pk).exists())
+
+    def test_stale_claim(self):
+        self.assertTrue(deletion.claim(self.pending, 600))
+        Deletion.objects.filter(pk=self.pending.pk).update(
+            claimed_at=timezone.now() - timedelta(seconds=601))
+        other = Deletion.objects.get(pk=self.pending.pk)
+        self.assertTrue(deletion.purge(other))
+
+    def test_heartbeat(self):
+        self.assertTrue(deletion.claim(self.pending, 600))
+        claimed_at = self.pending.claimed_at - timedelta(seconds=500)
+        Deletion.objects.filter(pk=self.pending.pk).update(
+            claimed_at=claimed_at)
+        self.pending.claimed_at = claimed_at
+        with deletion.claimed_transaction(self.pending):
+            pass
+        self.assertGreater(self.pending.claimed_at, claimed_at)
+        self.assertEqual(
+            Deletion.objects.get(pk=self.pending.pk).claimed_at,
+            self.pending.claimed_at)
+        other = Deletion.objects.get(pk=self.pending.pk)
+        self.assertFalse(deletion.claim(other, 600))
+
+    def test_taken_over(self):
+        taken_over_at = timezone.now() + timedelta(hours=1)
+        record_progress = deletion.record_progress
+
+        def take_over(*args):
+            # Another worker claims the Deletion after the first batch.
+            record_progress(*args)
+            Deletion.objects.filter(pk=self.pending.pk).update(
+                claimed_at=taken_over_at)
+
+        with mock.patch.object(deletion, 'record_progress',
+                               side_effect=take_over), \
+                self.assertLogs(deletion.logger, 'WARNING'):
+            self.assertFalse(deletion.purge(self.pending, batch_size=4))
+        self.assertEqual(Comment.objects.count(), 14)
+        self.pending.refresh_from_db()
+        # Left to the worker holding it.
+        self.assertEqual(self.pending.claimed_at, taken_over_at)
+        self.assertIsNone(self.pending.finished_at)
+        self.assertEqual(self.pending.error, '')
+
+    def test_failure_releases(self):
+        with mock.patch.object(deletion, 'delete_rows',
+                               side_effect=RuntimeError('disk full')), \
+                self.assertLogs(deletion.logger, 'ERROR'), \
+                self.assertRaises(RuntimeError):
+            deletion.purge(self.pending)
+        self.pending.refresh_from_db()
+        self.assertIsNone(self.pending.claimed_at)
+        self.assertIn('disk full', self.pending.error)
+        self.assertEqual(Comment.objects.count(), 18)
+
+
+class PurgeDeletionsCommandTests(SoftDeskTestCase):
+    def test_command(self):
+        deletion.request_user_deletion(self.members[0])
+        deletion.request_project_deletion(self.project)
+        stdout = StringIO()
+        with mock.patch.object(deletion, 'purge_batches',
+                               wraps=deletion.purge_batches) as batches:
+            call_command('purge_deletions', batch_size=5, stdout=stdout)
+        self.assertEqual({call.args[4] for call in batches.call_args_list},
+                         {5})
+        self.assertIn('Purged 2 deletion(s).', stdout.getvalue())
+        self.assertFalse(Deletion.objects.filter(finished_at=None).exists())
+        self.assertFalse(Project.objects.exists())
@@ -0,0 +1,137 @@
+"""
+JSON encoding (soft_desk_api.renderers, soft_desk_api.parsers) and the
+compression of the responses (soft_desk_api.compression).
+"""
+import gzip
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO
+from unittest import skipUnless
+
+from django.test import SimpleTestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+
+from soft_desk_api import compression
+from soft_desk_api.conditional import etag_matches
+from soft_desk_api.parsers import FastJSONParser
+from soft_desk_api.renderers import FastJSONRenderer
+from soft_desk_api.tests.base import SoftDeskTestCase
+
+COMPRESS_ALL = {'MIN_SIZE': 0}
+
+
+class RendererTests(SimpleTestCase):
+    data = {
+        'name': 'caf\xe9 \u2028 \U0001f41b "quoted"',
+        'created_at': datetime(2024, 5, 1, 12, 30, 15, 123456,
+                               tzinfo=dt_timezone.utc),
+        'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        'amount': Decimal('1.50'),
+        'rows': [{'id': 1, 'flag': True, 'empty': None}, []],
+        'large': 2 ** 70,
+    }
+
+    def test_same_bytes(self):
+        self.assertEqual(FastJSONRenderer().render(self.data),
+                         JSONRenderer().render(self.data))
+
+    def test_line_separators_escaped(self):
+        content = FastJSONRenderer().render({'text': '\u2028\u2029'})
+        self.assertEqual(content, b'{"text":"\\u2028\\u2029"}')
+
+    def test_indent(self):
+        media_type = 'application/json; indent=4'
+        self.assertEqual(FastJSONRenderer().render(self.data, media_type),
+                         JSONRenderer().render(self.data, media_type))
+
+    def test_parse(self):
+        content = FastJSONRenderer().render({'name': 'caf\xe9'})
+        self.assertEqual(FastJSONParser().parse(BytesIO(content)),
+                         {'name': 'caf\xe9'})
+
+
+class NegotiationTests(SimpleTestCase):
+    def test_negotiate(self):
+        preferred = compression.supported_encodings()[0]
+        self.assertEqual(compression.negotiate('gzip'), 'gzip')
+        self.assertEqual(compression.negotiate('gzip, br'), preferred)
+        self.assertEqual(compression.negotiate('br;q=0.5, gzip'), 'gzip')
+        self.assertEqual(compression.negotiate('*'), preferred)
+        self.assertEqual(compression.negotiate('gzip;q=0, *;q=0.1'),
+                         'br' if preferred == 'br' else None)
+        self.assertIsNone(compression.negotiate('identity'))
+        self.assertIsNone(compression.negotiate(''))
+
+    def test_etags(self):
+        self.assertEqual(compression.identity_etag('"abc-gzip"'), '"abc"')
+        self.assertEqual(compression.identity_etag('"abc-br"'), '"abc"')
+        self.assertTrue(etag_matches('"abc-gzip"', '"abc"', weak=False))
+        self.assertTrue(etag_matches('W/"abc-gzip"', '"abc"'))
+        self.assertFalse(etag_matches('W/"abc-gzip"', '"abc"', weak=False))
+
+
+@override_settings(SOFT_DESK_COMPRESSION=COMPRESS_ALL)
+class CompressionTests(SoftDeskTestCase):
+    def get_encoded(self, url, encoding, **headers):
+        return self.client.get(url, HTTP_ACCEPT_ENCODING=encoding, **headers)
+
+    def test_gzip(self):
+        url = f'{self.project_url}issues/'
+        plain = self.get(url)
+        response = self.get_encoded(url, 'gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertEqual(response['Content-Length'],
+                         str(len(response.content)))
+        self.assertEqual(response['ETag'],
+                         plain['ETag'][:-1] + '-gzip"')
+
+    @skipUnless(compression.brotli, 'brotli is not installed')
+    def test_brotli(self):
+        url = f'{self.project_url}issues/'
+        plain = self.get(url)
+        response = self.get_encoded(url, 'gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(compression.brotli.decompress(response.content),
+                         plain.content)
+
+    def test_identity(self):
+        response = self.get_encoded(f'{self.project_url}issues/',
+                                    'identity')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    @override_settings(SOFT_DESK_COMPRESSION={'MIN_SIZE': 1 << 20})
+    def test_min_size(self):
+        response = self.get_encoded(f'{self.project_url}issues/', 'gzip')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertFalse(response['ETag'].endswith('-gzip"'))
+
+    def test_stream(self):
+        url = f'{self.project_url}export/'
+        plain = self.client.get(url)
+        plain = b''.join(plain.streaming_content)
+        response = self.get_encoded(url, 'gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(
+            gzip.decompress(b''.join(response.streaming_content)), plain)
+
+    def test_not_modified(self):
+        etag = self.get_encoded(self.issue_url, 'gzip')['ETag']
+        self.assertTrue(etag.endswith('-gzip"'))
+        for encoding in ['gzip', 'identity']:
+            response = self.get_encoded(self.issue_url, encoding,
+                                        HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+    def test_if_match(self):
+        etag = self.get_encoded(self.issue_url, 'gzip')['ETag']
+        response = self.client.patch(self.issue_url, {'name': 'renamed'},
+                                     format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        # The ETag is now stale.
+        response = self.client.patch(self.issue_url, {'name': 'again'},
+                                     format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
@@ -0,0 +1,215 @@
+"""
+The Server-Sent Events streams (soft_desk_api.events): the backend, the
+publication of the changes once committed and the stream of a client.
+"""
+import asyncio
+import json
+from unittest import mock
+
+from django.test import AsyncClient, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from soft_desk_api import events
+from soft_desk_api.models import Comment, Contributor, Issue
+from soft_desk_api.tests.base import SoftDeskTestCase
+
+
+class Recorder:
+    """ A subscription keeping what it is delivered """
+    def __init__(self):
+        self.messages = []
+
+    def deliver(self, message):
+        self.messages.append(message)
+
+    def events(self):
+        return [(name, parse(message)) for name, message in self.messages]
+
+
+def parse(message):
+    """ (event name, data) of an encoded event """
+    lines = dict(line.split(': ', 1)
+                 for line in message.decode().strip().split('\n')
+                 if not line.startswith(('retry:', ':')))
+    return lines['event'], json.loads(lines['data'])
+
+
+class EventsTestCase(SoftDeskTestCase):
+    def setUp(self):
+        super().setUp()
+        # A backend of its own per test.
+        backend, events._backend = events._backend, events.LocalBackend()
+        self.addCleanup(setattr, events, '_backend', backend)
+        self.backend = events._backend
+
+
+class PublishTests(EventsTestCase):
+    def listen(self, channel):
+        recorder = Recorder()
+        self.backend.subscribe(recorder, [channel])
+        return recorder
+
+    def test_backend(self):
+        channel = events.project_channel(self.project.pk)
+        self.assertFalse(self.backend.listening(channel))
+        recorder = self.listen(channel)
+        self.assertTrue(self.backend.listening(channel))
+        self.backend.publish(channel, ('issues', b'x'))
+        self.backend.publish(events.project_channel(0), ('issues', b'y'))
+        self.assertEqual(recorder.messages, [('issues', b'x')])
+        self.backend.unsubscribe(recorder, [channel])
+        self.assertFalse(self.backend.listening(channel))
+
+    def test_published_on_commit(self):
+        recorder = self.listen(events.project_channel(self.project.pk))
+        with self.captureOnCommitCallbacks() as callbacks:
+            issue = Issue.objects.create(
+                author=self.author, project=self.project, name='new issue')
+            self.assertEqual(recorder.messages, [])
+        for callback in callbacks:
+            callback()
+        [(name, (event, data))] = recorder.events()
+        self.assertEqual((name, event), ('issues', 'issues'))
+        self.assertEqual((data['id'], data['name']), (issue.pk, 'new issue'))
+
+    def test_comment_and_deletion(self):
+        recorder = self.listen(events.project_channel(self.project.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            comment = Comment.objects.create(
+                author=self.author, issue=self.issue, description='hello')
+        comment_id = comment.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            comment.delete()
+        names = [name for name, message in recorder.messages]
+        self.assertEqual(names[0], 'comments')
+        self.assertEqual(names[-1], 'deleted')
+        self.assertEqual(recorder.events()[-1][1][1],
+                         {'kind': 'comment', 'object_id': comment_id,
+                          'data': mock.ANY, 'deleted_at': mock.ANY})
+
+    def test_not_listening(self):
+        recorder = self.listen(events.project_channel(0))
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Issue.objects.create(author=self.author, project=self.project,
+                                 name='unseen')
+        self.assertFalse([callback for callback in callbacks
+                          if callback.__qualname__.startswith('publish')])
+        self.assertEqual(recorder.messages, [])
+
+    def test_rolled_back(self):
+        recorder = self.listen(events.project_channel(self.project.pk))
+        with self.captureOnCommitCallbacks() as callbacks:
+            Issue.objects.create(author=self.author, project=self.project,
+                                 name='rolled back')
+        # Never executed: the transaction did not commit.
+        self.assertTrue(callbacks)
+        self.assertEqual(recorder.messages, [])
+
+    def test_membership(self):
+        member = self.members[0]
+        recorder = self.listen(events.user_channel(member.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            Contributor.objects.filter(user=member).delete()
+        self.assertIn(('membership', b''), recorder.messages)
+
+
+@override_settings(SOFT_DESK_EVENTS={'QUEUE_SIZE': 3, 'HEARTBEAT': 0.05})
+class StreamTests(EventsTestCase):
+    async def next_event(self, stream):
+        return parse(await asyncio.wait_for(anext(stream), 5))
+
+    async def test_stream(self):
+        stream = events.stream(self.author)
+        first = await asyncio.wait_for(anext(stream), 5)
+        self.assertTrue(first.startswith(b'retry: 3000\n'))
+        self.assertEqual(parse(first),
+                         ('ready', {'projects': [self.project.pk]}))
+        channel = events.project_channel(self.project.pk)
+        self.assertTrue(self.backend.listening(channel))
+        self.backend.publish(channel,
+                             ('issues', events.encode('issues', {'id': 1})))
+        self.assertEqual(await self.next_event(stream),
+                         ('issues', {'id': 1}))
+        # Idle: a heartbeat comment.
+        self.assertEqual(await asyncio.wait_for(anext(stream), 5),
+                         events.HEARTBEAT)
+        await stream.aclose()
+        self.assertFalse(self.backend.listening(channel))
+        self.assertFalse(self.backend.listening(
+            events.user_channel(self.author.pk)))
+
+    async def test_requested_projects(self):
+        stream = events.stream(self.author, requested={0})
+        self.assertEqual(await self.next_event(stream),
+                         ('ready', {'projects': []}))
+        self.assertFalse(self.backend.listening(
+            events.project_channel(self.project.pk)))
+        await stream.aclose()
+
+    async def test_membership(self):
+        member = self.members[0]
+        stream = events.stream(member)
+        await anext(stream)
+        await Contributor.objects.filter(user=member).adelete()
+        self.backend.publish(events.user_channel(member.pk),
+                             ('membership', b''))
+        self.assertEqual(await self.next_event(stream),
+                         ('membership', {'projects': []}))
+        self.assertFalse(self.backend.listening(
+            events.project_channel(self.project.pk)))
+        await stream.aclose()
+
+    async def test_overflow(self):
+        stream = events.stream(self.author)
+        await anext(stream)
+        channel = events.project_channel(self.project.pk)
+        for index in range(4):
+            self.backend.publish(
+                channel, ('issues', events.encode('issues', {'id': index})))
+        # The deliveries run on the loop: let them.
+        await asyncio.sleep(0)
+        self.assertEqual(await self.next_event(stream), ('overflow', {}))
+        with self.assertRaises(StopAsyncIteration):
+            await anext(stream)
+        self.assertFalse(self.backend.listening(channel))
+
+    def test_subscription_overflow(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        subscription = events.Subscription(loop, 2)
+        for index in range(3):
+            subscription.put(('issues', b'%d' % index))
+        self.assertTrue(subscription.overflowed)
+        subscription.put(('issues', b'late'))
+        self.assertEqual(subscription.queue.qsize(), 1)
+        self.assertEqual(subscription.queue.get_nowait()[0], 'overflow')
+
+
+class EventsViewTests(EventsTestCase):
+    def test_wsgi(self):
+        response = self.client.get('/api/events/')
+        self.assertEqual(response.status_code, 501)
+
+    async def test_anonymous(self):
+        response = await AsyncClient().get('/api/events/')
+        self.assertEqual(response.status_code, 401)
+
+    async def test_invalid_project(self):
+        response = await self.async_get('/api/events/', {'project': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_stream(self):
+        response = await self.async_get('/api/events/',
+                                        {'project': self.project.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache, no-transform')
+        content = aiter(response.streaming_content)
+        self.assertEqual(parse(await asyncio.wait_for(anext(content), 5)),
+                         ('ready', {'projects': [self.project.pk]}))
+        await content.aclose()
+
+    async def async_get(self, url, params):
+        token = AccessToken.for_user(self.author)
+        return await AsyncClient().get(
+            url, params, headers={'Authorization': f'Bearer {token}'})
@@ -0,0 +1,145 @@
+"""
+The job queue (soft_desk_api.jobs): queuing by key, claiming, retries
+with their backoff, lost and finished jobs.
+"""
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from soft_desk_api import jobs
+from soft_desk_api.models import Job
+
+calls = []
+
+
+@jobs.task(name='test_record')
+def record(*args):
+    calls.append(args)
+    return {'args': list(args)}
+
+
+@jobs.task(name='test_fail', max_attempts=3)
+def fail():
+    raise RuntimeError('always fails')
+
+
+@override_settings(SOFT_DESK_JOBS={'RETRY_DELAY': 10, 'TIMEOUT': 60,
+                                   'RETENTION': 3600})
+class JobTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def make_due(self, job):
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+
+    def run_failing(self):
+        [job] = jobs.claim()
+        with self.assertLogs(jobs.logger, 'ERROR'):
+            self.assertFalse(jobs.run_job(job))
+        job.refresh_from_db()
+        return job
+
+    def test_run(self):
+        job = jobs.enqueue('test_record', 1, 'two')
+        self.assertEqual(job.max_attempts, 3)
+        [claimed] = jobs.claim()
+        self.assertEqual((claimed.pk, claimed.status, claimed.attempts),
+                         (job.pk, Job.RUNNING, 1))
+        self.assertEqual(jobs.claim(), [])
+        self.assertTrue(jobs.run_job(claimed))
+        self.assertEqual(calls, [(1, 'two')])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.result, {'args': [1, 'two']})
+        self.assertIsNotNone(job.finished_at)
+
+    def test_claim_due(self):
+        later = jobs.enqueue('test_record', 'later', delay=60)
+        first = jobs.enqueue('test_record', 'first')
+        second = jobs.enqueue('test_record', 'second')
+        self.assertEqual([job.pk for job in jobs.claim(limit=5)],
+                         [first.pk, second.pk])
+        self.make_due(later)
+        self.assertEqual([job.pk for job in jobs.claim()], [later.pk])
+
+    def test_retry_backoff(self):
+        job = jobs.enqueue('test_fail')
+        for attempt, delay in [(1, 10), (2, 20)]:
+            before = timezone.now()
+            job = self.run_failing()
+            self.assertEqual((job.status, job.attempts),
+                             (Job.QUEUED, attempt))
+            self.assertIn('always fails', job.error)
+            self.assertGreaterEqual(job.run_after,
+                                    before + timedelta(seconds=delay))
+            self.assertLess(job.run_after,
+                            before + timedelta(seconds=delay + 5))
+            self.assertEqual(jobs.claim(), [])
+            self.make_due(job)
+        job = self.run_failing()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 3))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_unknown_task(self):
+        Job.objects.create(task='missing', max_attempts=3)
+        job = self.run_failing()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn('missing', job.error)
+
+    def test_key(self):
+        first = jobs.enqueue('test_record', 1, key='project:1')
+        self.assertEqual(jobs.enqueue('test_record', 1, key='project:1').pk,
+                         first.pk)
+        other = jobs.enqueue('test_record', 2, key='project:2')
+        self.assertNotEqual(other.pk, first.pk)
+        # Once running, the key is queued again.
+        jobs.claim(limit=2)
+        again = jobs.enqueue('test_record', 1, key='project:1')
+        self.assertNotEqual(again.pk, first.pk)
+        self.assertEqual(Job.objects.filter(key='project:1').count(), 2)
+
+    def test_key_constraint(self):
+        Job.objects.create(task='test_record', key='project:1')
+        Job.objects.create(task='test_record', key='project:1',
+                           status=Job.DONE)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Job.objects.create(task='test_record', key='project:1')
+
+    def test_requeue_lost(self):
+        jobs.enqueue('test_record')
+        spent = jobs.enqueue('test_record')
+        Job.objects.filter(pk=spent.pk).update(max_attempts=1)
+        jobs.claim(limit=2)
+        jobs.requeue_lost()
+        self.assertEqual(Job.objects.filter(status=Job.RUNNING).count(), 2)
+        Job.objects.update(started_at=timezone.now() - timedelta(seconds=61))
+        jobs.requeue_lost()
+        spent.refresh_from_db()
+        self.assertEqual(spent.status, Job.FAILED)
+        self.assertEqual(spent.error, 'Lost by its worker')
+        [requeued] = jobs.claim()
+        self.assertEqual(requeued.attempts, 2)
+
+    def test_clear_finished(self):
+        old = jobs.enqueue('test_record')
+        recent = jobs.enqueue('test_record')
+        failed = jobs.enqueue('test_record')
+        Job.objects.filter(pk__in=[old.pk, recent.pk]).update(
+            status=Job.DONE, finished_at=timezone.now())
+        Job.objects.filter(pk__in=[old.pk, failed.pk]).update(
+            finished_at=timezone.now() - timedelta(seconds=3601))
+        Job.objects.filter(pk=failed.pk).update(status=Job.FAILED)
+        self.assertEqual(jobs.clear_finished(), 1)
+        self.assertEqual(set(Job.objects.values_list('pk', flat=True)),
+                         {recent.pk, failed.pk})
+
+    def test_queue_stats(self):
+        jobs.enqueue('test_record')
+        jobs.enqueue('test_record', delay=60)
+        counts, lag, throughput = jobs.queue_stats()
+        self.assertEqual(counts, {Job.QUEUED: 2, Job.RUNNING: 0,
+                                  Job.DONE: 0, Job.FAILED: 0})
+        self.assertGreaterEqual(lag, 0)
+        self.assertEqual(throughput, 0)
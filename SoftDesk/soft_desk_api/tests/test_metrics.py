@@ -0,0 +1,44 @@
+"""
+Access to /metrics/ (soft_desk_api.instrumentation.metrics_view).
+"""
+from django.test import TestCase, override_settings
+
+from custom_auth.models import User
+
+
+class MetricsAccessTests(TestCase):
+    def get(self, **kwargs):
+        return self.client.get('/metrics/', **kwargs)
+
+    def test_anonymous(self):
+        # The test client, like a local reverse proxy, is 127.0.0.1.
+        self.assertEqual(self.get().status_code, 403)
+
+    def test_staff(self):
+        user = User.objects.create(username='staff', age=30, is_staff=True)
+        self.client.force_login(user)
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'soft_desk_requests_total', response.content)
+
+    def test_not_staff(self):
+        self.client.force_login(User.objects.create(username='user', age=30))
+        self.assertEqual(self.get().status_code, 403)
+
+    @override_settings(SOFT_DESK_METRICS_TOKEN='s3cret')
+    def test_token(self):
+        response = self.get(headers={'Authorization': 'Bearer s3cret'})
+        self.assertEqual(response.status_code, 200)
+        for header in ['Bearer wrong', 'Basic s3cret', 'Bearer']:
+            with self.subTest(header=header):
+                response = self.get(headers={'Authorization': header})
+                self.assertEqual(response.status_code, 403)
+
+    def test_no_token_configured(self):
+        response = self.get(headers={'Authorization': 'Bearer '})
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(SOFT_DESK_METRICS_ALLOWED_IPS=['10.0.0.5'])
+    def test_allowed_ips(self):
+        self.assertEqual(self.get(REMOTE_ADDR='10.0.0.5').status_code, 200)
+        self.assertEqual(self.get().status_code, 403)
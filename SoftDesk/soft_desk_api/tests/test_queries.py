@@ -0,0 +1,224 @@
+"""
+Query budgets (SOFT_DESK_QUERY_BUDGETS) and query plans of the api
+endpoints, on the fixture of soft_desk_api.tests.base.
+
+SeededEndpointTests calls every endpoint of the benchmark command on a
+small seeded dataset (see soft_desk_api.seeding), and checks its status,
+the shape of its response and its queries.
+"""
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from custom_auth.user_cache import user_cache
+from soft_desk_api.instrumentation import QueryBudgetExceeded
+from soft_desk_api.management.commands.benchmark import (
+    Target, client_for, get_endpoints, prepare
+)
+from soft_desk_api.models import Issue
+from soft_desk_api.seeding import Dataset, seed
+from soft_desk_api.tests.base import SoftDeskTestCase
+
+PAGE = {'count', 'next', 'previous', 'results'}
+PROJECT_ROW = {'id', 'name', 'author'}
+PROJECT = {'id', 'author', 'contributors', 'issues', 'name', 'description',
+           'created_at', 'updated_at', 'project_type'}
+ISSUE_ROW = {'id', 'name', 'status', 'attribution', 'comment_count'}
+ISSUE = {'id', 'name', 'description', 'author', 'project', 'status',
+         'priority', 'flag', 'attribution', 'comment_count', 'created_at',
+         'updated_at'}
+COMMENT_ROW = {'id', 'uuid', 'author', 'description', 'created_at'}
+COMMENT = COMMENT_ROW | {'issue', 'updated_at'}
+DELETION = {'uuid', 'kind', 'object_id', 'status', 'progress',
+            'requested_at', 'finished_at'}
+
+# endpoint: (status, queries, keys of the body, keys of its first row)
+EXPECTED = {
+    'ProjectViewset.list': (200, 4, PAGE, PROJECT_ROW),
+    'ProjectViewset.list (stats)': (200, 4, PAGE, PROJECT_ROW | {'stats'}),
+    'ProjectViewset.retrieve': (200, 5, PROJECT, None),
+    'ProjectViewset.partial_update': (200, 6, PROJECT, None),
+    'ProjectViewset.changes': (200, 6, {'issues', 'comments', 'contributors',
+                                        'deleted', 'cursor', 'has_more'},
+                               None),
+    'ProjectViewset.export': (200, 4, None, None),
+    'ProjectViewset.stats': (200, 2, {'issues', 'status', 'priority', 'flag',
+                                      'comments', 'updated_at'}, None),
+    'ProjectViewset.search': (200, 3, PAGE, None),
+    'SearchViewset.list': (200, 4, PAGE, {'id', 'kind', 'project', 'issue',
+                                          'title', 'snippet', 'rank'}),
+    'ProjectViewset.add_contributors': (400, 7, {'content'}, None),
+    'ProjectViewset.remove_contributors': (400, 3, {'content'}, None),
+    'ProjectViewset.bulk_contributors': (200, 6, {'results'}, None),
+    'IssueViewset.list': (200, 5, PAGE, ISSUE_ROW),
+    'IssueViewset.list (cursor)': (200, 4, {'next', 'previous', 'results'},
+                                   ISSUE_ROW),
+    'IssueViewset.list (triage)': (200, 5, PAGE, None),
+    'IssueViewset.list (assigned)': (200, 5, PAGE, None),
+    'IssueViewset.list (authored)': (200, 5, PAGE, ISSUE_ROW),
+    'IssueViewset.list (unassigned)': (200, 5, PAGE, None),
+    'IssueViewset.create': (201, 5, ISSUE_ROW, None),
+    'IssueViewset.bulk': (200, 11, {'succeeded', 'failed', 'results'},
+                          {'index', 'id'}),
+    'ProjectViewset.bulk_contributors (delete)': (200, 10, {'results'},
+                                                  None),
+    'ProjectViewset.destroy': (202, 9, DELETION, None),
+    'IssueViewset.destroy': (204, 8, None, None),
+    'token_obtain_pair': (200, 1, {'access', 'refresh'}, None),
+    'register': (201, 3, {'detail'}, None),
+    'delete-account': (202, 7, DELETION, None),
+    'IssueViewset.retrieve': (200, 4, ISSUE, None),
+    'IssueViewset.partial_update': (200, 7, ISSUE, None),
+    'CommentViewset.list': (200, 5, PAGE, COMMENT_ROW),
+    'CommentViewset.create': (201, 8, COMMENT_ROW, None),
+    'CommentViewset.destroy': (204, 8, None, None),
+    'CommentViewset.retrieve': (200, 4, COMMENT, None),
+}
+
+
+@override_settings(SOFT_DESK_QUERY_BUDGET_MODE='raise')
+class QueryBudgetTests(SoftDeskTestCase):
+    """ Each endpoint stays within its budget, or the request raises """
+
+    def test_budget_exceeded_raises(self):
+        with override_settings(
+                SOFT_DESK_QUERY_BUDGETS={'ProjectViewset.list': 0}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get('/api/projects/')
+
+    def test_project_list(self):
+        self.get('/api/projects/')
+        cache.clear()
+        self.get('/api/projects/', with_stats='true')
+
+    def test_project_retrieve(self):
+        self.get(self.project_url)
+        cache.clear()
+        self.get(self.project_url, include='issues.comments')
+
+    def test_project_changes(self):
+        self.get(f'{self.project_url}changes/')
+
+    def test_project_export(self):
+        self.get(f'{self.project_url}export/')
+        self.get(f'{self.project_url}export/', output='csv')
+
+    def test_project_stats(self):
+        self.get(f'{self.project_url}stats/')
+
+    def test_project_search(self):
+        self.get(f'{self.project_url}search/', q='issue')
+
+    def test_search(self):
+        self.get('/api/search/', q='synthetic comment')
+
+    def test_issue_list(self):
+        self.get(f'{self.project_url}issues/')
+        cache.clear()
+        self.get(f'{self.project_url}issues/', include='comments')
+        cache.clear()
+        self.get(f'{self.project_url}issues/', pagination='cursor')
+
+    def test_issue_retrieve(self):
+        self.get(self.issue_url)
+
+    def test_comment_list(self):
+        self.get(f'{self.issue_url}comments/')
+
+    def test_comment_retrieve(self):
+        self.get(self.comment_url)
+
+
+class QueryPlanTests(SoftDeskTestCase):
+    """
+    The query plans of the viewsets load each relation once per request,
+    whatever the number of rows. The counts include loading the
+    membership of the user.
+    """
+
+    def test_project_list(self):
+        with self.assertNumQueries(3):
+            self.get('/api/projects/')
+
+    def test_project_retrieve(self):
+        with self.assertNumQueries(4):
+            self.get(self.project_url)
+
+    def test_project_retrieve_included(self):
+        with self.assertNumQueries(4):
+            self.get(self.project_url, include='issues.comments')
+
+    def test_issue_list(self):
+        with self.assertNumQueries(4):
+            self.get(f'{self.project_url}issues/')
+
+    def test_issue_list_included(self):
+        with self.assertNumQueries(5):
+            self.get(f'{self.project_url}issues/', include='comments')
+
+    def test_issue_retrieve(self):
+        with self.assertNumQueries(3):
+            self.get(self.issue_url)
+
+    def test_comment_list(self):
+        with self.assertNumQueries(4):
+            self.get(f'{self.issue_url}comments/')
+
+    def test_comment_retrieve(self):
+        with self.assertNumQueries(3):
+            self.get(self.comment_url)
+
+    def test_more_rows_same_queries(self):
+        url = f'{self.project_url}issues/'
+        self.get(url, include='comments')
+        Issue.objects.create(author=self.author, project=self.project,
+                             name='one more', description='A new issue')
+        cache.clear()
+        with self.assertNumQueries(5):
+            self.get(url, include='comments')
+
+
+class SeededEndpointTests(APITestCase):
+    """
+    The endpoints of the benchmark, each called from cold caches: the
+    query counts include authenticating the JWT.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        projects = seed(Dataset(users=12, projects=3, issues=40,
+                                comments=120, max_contributors=6))
+        cls.target = Target(projects[0])
+
+    def call(self, endpoint):
+        cache.clear()
+        user_cache.clear()
+        client, method, url, data, data_format = prepare(
+            client_for(self.target.user), endpoint)
+        with CaptureQueriesContext(connection) as captured:
+            response = getattr(client, method)(url, data=data,
+                                               format=data_format)
+            if response.streaming:
+                b''.join(response.streaming_content)
+                response.close()
+        return response, len(captured.captured_queries)
+
+    def test_endpoints(self):
+        endpoints = get_endpoints(self.target)
+        self.assertEqual({endpoint[0] for endpoint in endpoints},
+                         set(EXPECTED))
+        for endpoint in endpoints:
+            status, queries, keys, row_keys = EXPECTED[endpoint[0]]
+            with self.subTest(endpoint=endpoint[0]):
+                response, count = self.call(endpoint)
+                self.assertEqual(response.status_code, status)
+                self.assertEqual(count, queries)
+                if keys is None:
+                    continue
+                body = response.json()
+                self.assertEqual(set(body), keys)
+                if row_keys is not None:
+                    rows = body['results']
+                    self.assertTrue(rows)
+                    self.assertEqual(set(rows[0]), row_keys)
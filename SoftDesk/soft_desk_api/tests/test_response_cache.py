@@ -0,0 +1,104 @@
+"""
+The read-through response cache (soft_desk_api.response_cache): the
+entries of a user, invalidated by the writes once they commit.
+"""
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+from soft_desk_api.models import Comment, Contributor, Issue, Project
+from soft_desk_api.tests.base import SoftDeskTestCase
+
+
+class ResponseCacheTests(SoftDeskTestCase):
+    def assertCache(self, url, outcome, client=None, **params):
+        response = (client or self.client).get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Cache'], outcome)
+        return response
+
+    def write(self, method, url, data):
+        # The generations are bumped once the transaction commits.
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(url, data,
+                                                    format='json')
+        self.assertLess(response.status_code, 300)
+        return response
+
+    def test_hit(self):
+        url = f'{self.project_url}issues/'
+        first = self.assertCache(url, 'MISS')
+        second = self.assertCache(url, 'HIT')
+        self.assertEqual(first.json(), second.json())
+        # Query strings are cached apart.
+        self.assertCache(url, 'MISS', limit=2)
+
+    def test_per_user(self):
+        url = f'{self.project_url}issues/'
+        self.assertCache(url, 'MISS')
+        member = APIClient()
+        member.force_authenticate(self.members[0])
+        self.assertCache(url, 'MISS', client=member)
+        self.assertCache(url, 'HIT', client=member)
+
+    def test_issue_update(self):
+        issues = f'{self.project_url}issues/'
+        self.assertCache(issues, 'MISS')
+        self.assertCache(self.issue_url, 'MISS')
+        self.write('patch', self.issue_url, {'name': 'renamed'})
+        response = self.assertCache(self.issue_url, 'MISS')
+        self.assertEqual(response.json()['name'], 'renamed')
+        response = self.assertCache(issues, 'MISS')
+        self.assertIn('renamed',
+                      [row['name'] for row in response.json()['results']])
+
+    def test_comment_create(self):
+        comments = f'{self.issue_url}comments/'
+        count = self.assertCache(comments, 'MISS').json()['count']
+        self.write('post', comments, {'description': 'one more'})
+        self.assertEqual(self.assertCache(comments, 'MISS').json()['count'],
+                         count + 1)
+
+    def test_comment_delete_without_request(self):
+        comments = f'{self.issue_url}comments/'
+        self.assertCache(comments, 'MISS')
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.filter(pk=self.comment.pk).first().delete()
+        response = self.assertCache(comments, 'MISS')
+        self.assertNotIn(self.comment.pk,
+                         [row['id'] for row in response.json()['results']])
+
+    def test_other_project_untouched(self):
+        other = Project.objects.create(author=self.author, name='Other',
+                                       project_type='iOS')
+        issue = Issue.objects.create(author=self.author, project=other,
+                                     name='elsewhere')
+        self.assertCache(self.project_url, 'MISS')
+        self.write('patch',
+                   f'/api/projects/{other.pk}/issues/{issue.pk}/',
+                   {'name': 'renamed'})
+        self.assertCache(self.project_url, 'HIT')
+
+    def test_project_list(self):
+        self.assertCache('/api/projects/', 'MISS')
+        self.write('post', '/api/projects/', {'name': 'Other',
+                                              'project_type': 'iOS'})
+        response = self.assertCache('/api/projects/', 'MISS')
+        self.assertEqual(response.json()['count'], 2)
+
+    def test_removed_contributor(self):
+        url = f'{self.project_url}issues/'
+        member = APIClient()
+        member.force_authenticate(self.members[0])
+        self.assertCache(url, 'MISS', client=member)
+        with self.captureOnCommitCallbacks(execute=True):
+            Contributor.objects.get(user=self.members[0]).delete()
+        response = self.assertCache(url, 'MISS', client=member)
+        self.assertEqual(response.json()['count'], 0)
+
+    def test_stats_list_not_cached(self):
+        response = self.client.get('/api/projects/', {'with_stats': 'true'})
+        self.assertNotIn('X-Cache', response)
+
+    @override_settings(SOFT_DESK_RESPONSE_CACHE={'ENABLED': False})
+    def test_disabled(self):
+        self.assertNotIn('X-Cache', self.client.get(self.project_url))
@@ -0,0 +1,67 @@
+"""
+The values() row serializers (soft_desk_api.rows) against the
+ModelSerializers they mirror: the same JSON, page for page.
+"""
+from django.test import override_settings
+from rest_framework.renderers import JSONRenderer
+
+from soft_desk_api.management.commands.benchmark_serializers import cases
+from soft_desk_api.models import Issue
+from soft_desk_api.serializers import IssueRowSerializer
+from soft_desk_api.tests.base import SoftDeskTestCase
+
+
+class RowSerializerTests(SoftDeskTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # A null relation goes through the converters as well.
+        Issue.objects.filter(pk=cls.issue.pk).update(attribution=None)
+
+    def assertSameJSON(self):
+        renderer = JSONRenderer()
+        for name, model_serializer, queryset, row_serializer \
+                in cases(self.project):
+            with self.subTest(name):
+                self.assertEqual(
+                    renderer.render(row_serializer()
+                                    .serialize_queryset(queryset)),
+                    renderer.render(model_serializer(queryset,
+                                                     many=True).data))
+
+    def test_same_json(self):
+        self.assertSameJSON()
+
+    @override_settings(TIME_ZONE='Europe/Paris')
+    def test_same_json_in_local_time(self):
+        self.assertSameJSON()
+
+    def test_fieldset(self):
+        queryset = Issue.objects.filter(project=self.project).order_by('pk')
+        rows = IssueRowSerializer(['name', 'attribution']) \
+            .serialize_queryset(queryset)
+        full = IssueRowSerializer().serialize_queryset(queryset)
+        self.assertEqual(rows, [
+            {'name': row['name'], 'attribution': row['attribution']}
+            for row in full
+        ])
+        self.assertIsNone(rows[-1]['attribution'])
+
+
+class RowListTests(SoftDeskTestCase):
+    def test_issue_list(self):
+        url = f'{self.project_url}issues/'
+        rows = self.get(url).json()['results']
+        # ?include= is served by the ModelSerializer.
+        nested = self.get(url, include='comments').json()['results']
+        self.assertEqual(rows, [
+            {name: value for name, value in row.items() if name in rows[0]}
+            for row in nested
+        ])
+
+    def test_sparse_list(self):
+        url = f'{self.project_url}issues/'
+        rows = self.get(url, **{'fields[issue]': 'id,status'}) \
+            .json()['results']
+        self.assertEqual(len(rows), 6)
+        self.assertTrue(all(set(row) == {'id', 'status'} for row in rows))
@@ -0,0 +1,41 @@
+"""
+The visible_to() scopes of projects, issues and comments.
+"""
+from django.utils import timezone
+
+from custom_auth.models import User
+from soft_desk_api.models import Project, Issue, Comment
+from soft_desk_api.tests.base import SoftDeskTestCase
+
+
+class VisibleToTests(SoftDeskTestCase):
+    def scopes(self, user):
+        return (Project.objects.visible_to(user),
+                Issue.objects.visible_to(user),
+                Comment.objects.visible_to(user))
+
+    def assertSees(self, user, projects, issues, comments):
+        visible = self.scopes(user)
+        self.assertEqual([queryset.count() for queryset in visible],
+                         [projects, issues, comments])
+
+    def test_author_and_contributor(self):
+        self.assertSees(self.author, 1, 6, 18)
+        self.assertSees(self.members[0], 1, 6, 18)
+
+    def test_outsider(self):
+        outsider = User.objects.create(username='outsider', age=30)
+        self.assertSees(outsider, 0, 0, 0)
+
+    def test_no_duplicates(self):
+        # The author is a contributor too: both branches match.
+        projects, issues, comments = self.scopes(self.author)
+        self.assertEqual(len(projects), len(set(projects)))
+        self.assertEqual(len(issues), len(set(issues)))
+        self.assertEqual(len(comments), len(set(comments)))
+
+    def test_pending_deletion(self):
+        Project.objects.filter(pk=self.project.pk).update(
+            deletion_requested_at=timezone.now())
+        self.assertSees(self.author, 0, 0, 0)
+        self.assertSees(self.members[0], 0, 0, 0)
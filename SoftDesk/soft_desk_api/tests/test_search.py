@@ -0,0 +1,121 @@
+"""
+Full-text search (soft_desk_api.search), through /api/search/ and
+/api/projects/<id>/search/.
+"""
+from custom_auth.models import User
+from soft_desk_api.models import Comment, Issue, Project
+from soft_desk_api.search import (
+    MATCH_START as START, MATCH_STOP as STOP, SearchResults, ScanBackend,
+    markup
+)
+from soft_desk_api.tests.base import SoftDeskTestCase
+
+
+class MarkupTests(SoftDeskTestCase):
+    def test_escaped(self):
+        self.assertEqual(markup(f'<b>{START}bold{STOP}</b> & co'),
+                         '&lt;b&gt;<mark>bold</mark>&lt;/b&gt; &amp; co')
+
+    def test_unbalanced(self):
+        self.assertEqual(markup(f'{STOP}a {START}b {START}c'),
+                         'a <mark>b c</mark>')
+
+
+class SearchTests(SoftDeskTestCase):
+    def search(self, url='/api/search/', **params):
+        return self.get(url, **params).json()
+
+    def test_ranking(self):
+        in_name = Issue.objects.create(
+            author=self.author, project=self.project, name='Crash on login',
+            description='Happens every morning')
+        in_description = Issue.objects.create(
+            author=self.author, project=self.project, name='Slow page',
+            description='The page is slow, then a crash')
+        data = self.search(q='crash')
+        self.assertEqual(data['count'], 2)
+        self.assertEqual([row['id'] for row in data['results']],
+                         [in_name.pk, in_description.pk])
+        first = data['results'][0]
+        self.assertEqual(first['title'], '<mark>Crash</mark> on login')
+        self.assertGreater(first['rank'], data['results'][1]['rank'])
+
+    def test_prefix_and_terms(self):
+        Issue.objects.create(author=self.author, project=self.project,
+                             name='Deadlock in the scheduler')
+        self.assertEqual(self.search(q='dead')['count'], 1)
+        self.assertEqual(self.search(q='deadlock scheduler')['count'], 1)
+        self.assertEqual(self.search(q='deadlock parser')['count'], 0)
+        # Search syntax is dropped, not run.
+        self.assertEqual(self.search(q='"deadlock*" (')['count'], 1)
+
+    def test_escaping(self):
+        Issue.objects.create(
+            author=self.author, project=self.project,
+            name='<img src=x onerror=alert(1)> payload',
+            description='<script>alert("payload")</script>')
+        Comment.objects.create(
+            author=self.author, issue=self.issue,
+            description='payload <a href="javascript:x">link</a>')
+        data = self.search(q='payload')
+        self.assertEqual(data['count'], 2)
+        for row in data['results']:
+            for text in (row['title'], row['snippet']):
+                self.assertNotIn('<img', text)
+                self.assertNotIn('<script', text)
+                self.assertNotIn('<a ', text)
+                self.assertEqual(
+                    text.replace('<mark>', '').replace('</mark>', '')
+                    .count('<'), 0)
+        issue = next(row for row in data['results'] if row['kind'] == 'issue')
+        self.assertEqual(issue['title'],
+                         '&lt;img src=x onerror=alert(1)&gt; '
+                         '<mark>payload</mark>')
+
+    def test_kind_and_project(self):
+        other = Project.objects.create(author=self.author, name='Other',
+                                       project_type='iOS')
+        Issue.objects.create(author=self.author, project=other,
+                             name='A synthetic issue elsewhere')
+        self.assertEqual(self.search(q='synthetic')['count'], 25)
+        self.assertEqual(self.search(q='synthetic', kind='issue')['count'],
+                         7)
+        self.assertEqual(self.search(q='synthetic', kind='comment')['count'],
+                         18)
+        self.assertEqual(
+            self.search(q='synthetic', project=other.pk)['count'], 1)
+        url = f'{self.project_url}search/'
+        self.assertEqual(self.search(url, q='synthetic')['count'], 24)
+
+    def test_index_follows_writes(self):
+        issue = Issue.objects.create(author=self.author, project=self.project,
+                                     name='Flaky test')
+        issue.name = 'Stable test'
+        issue.save()
+        self.assertEqual(self.search(q='flaky')['count'], 0)
+        self.assertEqual(self.search(q='stable')['count'], 1)
+        issue.delete()
+        self.assertEqual(self.search(q='stable')['count'], 0)
+
+    def test_visibility(self):
+        self.client.force_authenticate(
+            User.objects.create(username='outsider', age=30))
+        self.assertEqual(self.search(q='synthetic')['count'], 0)
+        response = self.client.get(f'{self.project_url}search/',
+                                   {'q': 'synthetic'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_invalid(self):
+        for params in [{}, {'q': ' '}, {'q': 'x', 'kind': 'project'}]:
+            with self.subTest(params=params):
+                response = self.client.get('/api/search/', params)
+                self.assertEqual(response.status_code, 400)
+
+    def test_scan_backend(self):
+        Issue.objects.create(author=self.author, project=self.project,
+                             name='<b>bold</b> claim')
+        results = SearchResults('bold', [self.project.pk],
+                                backend=ScanBackend())
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0:10][0]['title'],
+                         '&lt;b&gt;bold&lt;/b&gt; claim')
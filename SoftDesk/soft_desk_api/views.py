@@ -1,21 +1,60 @@
-from rest_framework.viewsets import ModelViewSet
-from rest_framework.permissions import IsAuthenticated
+from types import GeneratorType
+
+from rest_framework.viewsets import ModelViewSet, GenericViewSet
+from rest_framework.generics import RetrieveAPIView
+from rest_framework.mixins import RetrieveModelMixin
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db import IntegrityError
-from django.db.models import Q
+from rest_framework.exceptions import (
+    NotFound, PermissionDenied, ValidationError
+)
+from rest_framework.filters import OrderingFilter
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import OuterRef, Count, F, Max, Sum
+from django.http import FileResponse
+from django.urls import reverse
 from rest_framework import status
 
 from soft_desk_api.serializers import (
     ProjectSerializer,
     ProjectDetailSerializer,
+    ProjectListStatsSerializer,
+    ProjectStatsSerializer,
+    ProjectRowSerializer,
+    IssueRowSerializer,
+    CommentRowSerializer,
     IssueSerializer,
     IssueDetailSerializer,
     CommentSerializer,
-    CommentDetailSerializer
+    CommentDetailSerializer,
+    ContributorBulkSerializer,
+    DeletionSerializer,
+    JobSerializer,
+    SearchResultSerializer,
+    OPEN_ISSUE_STATUSES
     )
-from soft_desk_api.models import Project, Contributor, Issue, Comment
+from soft_desk_api.models import (
+    Project, Contributor, Issue, Comment, Deletion, Job
+)
 from .permissions import IsAuthor, IsContributor
+from .membership import get_membership, to_project_id
+from .pagination import OptionalCursorPagination
+from .response_cache import CachedResponseMixin
+from .conditional import (
+    ConditionalRequestMixin, count_subquery, latest_subquery
+)
+from .parsers import FastJSONParser, NDJSONParser
+from .filters import IssueFilterBackend
+from .fieldsets import SparseFieldsetsMixin, Include, INCLUDED_COMMENTS
+from .rows import RowListMixin
+from .async_views import AsyncReadMixin
+from .instrumentation import InstrumentedViewMixin
+from .search import SearchResults, KINDS
+from . import (
+    contributors, changes, export, bulk_issues, stats, deletion, jobs
+)
 from custom_auth.models import User
 
 
@@ -29,23 +68,157 @@ class MultipleSerializerMixin:
         return super().get_serializer_class()
 
 
-class ProjectViewset(MultipleSerializerMixin, ModelViewSet):
+class QueryPlanMixin:
+    """
+    Applies the select_related / prefetch_related / only() plan declared
+    for the current action in `query_plans`, so that serializing a page
+    costs a fixed number of queries whatever its size.
+    Actions without a plan fall back to the 'default' entry, if any.
+    Viewsets provide the unplanned, permission-scoped queryset through
+    get_scoped_queryset(): projects span every project of the user and
+    are scoped with Project.objects.visible_to(), issues and comments
+    live in the project of the url and are scoped by the membership of
+    the request (get_membership().can_view()), which costs no query.
+    """
+    query_plans = {}
+
+    def get_scoped_queryset(self):
+        """
+        The queryset before its plan. Defaults to the viewset's
+        `queryset`, through GenericAPIView.get_queryset(); viewsets
+        override it to scope the rows to the request.
+        """
+        return super().get_queryset()
+
+    def get_queryset(self):
+        return self.apply_query_plan(self.get_scoped_queryset())
+
+    def get_query_plan(self, action=None):
+        return self.query_plans.get(action or self.action,
+                                    self.query_plans.get('default', {}))
+
+    def apply_query_plan(self, queryset, action=None):
+        plan = self.get_query_plan(action)
+        if plan.get('select_related'):
+            queryset = queryset.select_related(*plan['select_related'])
+        if plan.get('prefetch_related'):
+            queryset = queryset.prefetch_related(*plan['prefetch_related'])
+        if plan.get('only'):
+            queryset = queryset.only(*plan['only'])
+        return queryset
+
+
+PROJECT_DETAIL_PLAN = {
+    'select_related': ['author'],
+}
+
+ISSUE_DETAIL_PLAN = {
+    'select_related': ['author', 'project',
+                       'attribution__user', 'attribution__project'],
+}
+
+COMMENT_DETAIL_PLAN = {
+    'select_related': ['author', 'issue__project'],
+}
+
+LATEST_COMMENTS = Include('comment', 'comments', 'latest_comments',
+                          Comment.objects.order_by('-created_at'),
+                          limit=INCLUDED_COMMENTS)
+
+
+class ProjectViewset(InstrumentedViewMixin, ConditionalRequestMixin,
+                     CachedResponseMixin, SparseFieldsetsMixin, RowListMixin,
+                     AsyncReadMixin, QueryPlanMixin, MultipleSerializerMixin,
+                     ModelViewSet):
     serializer_class = ProjectSerializer
     detail_serializer_class = ProjectDetailSerializer
+    row_serializer_class = ProjectRowSerializer
+    resource_type = 'project'
+    includes = {
+        'issues': Include('issue', 'issues', 'open_issues',
+                          Issue.objects.filter(
+                              status__in=OPEN_ISSUE_STATUSES)),
+        'issues.comments': LATEST_COMMENTS,
+        'contributors': Include('contributor', 'contributors', None),
+    }
+    include_actions = ['retrieve']
+    query_plans = {
+        'list': {
+            'select_related': ['author'],
+            'only': ['id', 'name', 'author__id', 'author__username'],
+        },
+        'list_with_stats': {
+            'select_related': ['author', 'stats'],
+        },
+        'retrieve': PROJECT_DETAIL_PLAN,
+        'update': PROJECT_DETAIL_PLAN,
+        'partial_update': PROJECT_DETAIL_PLAN,
+        'stats': {'select_related': ['stats']},
+    }
 
     permission_classes = [IsAuthenticated, IsAuthor]
 
-    def get_queryset(self):
-        user = self.request.user
-        return Project.objects.filter(
-            Q(author=user) | Q(contributors__user=user)
-        ).distinct()
+    def get_scoped_queryset(self):
+        return Project.objects.visible_to(self.request.user)
+
+    @property
+    def with_stats(self):
+        """ Whether the list was asked for with ?with_stats=true """
+        value = self.request.query_params.get('with_stats', '')
+        return self.action == 'list' and value.lower() in ('1', 'true')
+
+    def get_query_plan(self, action=None):
+        if action is None and self.with_stats:
+            action = 'list_with_stats'
+        return super().get_query_plan(action)
+
+    def get_serializer_class(self):
+        if self.with_stats:
+            return ProjectListStatsSerializer
+        return super().get_serializer_class()
+
+    def is_cacheable(self):
+        # Counters change without bumping the project list generation.
+        return not self.with_stats
+
+    def get_validator_aggregates(self):
+        if self.with_stats:
+            return {'stats_updated_at': Max('stats__updated_at')}
+        return {}
+
+    def get_validator_annotations(self):
+        open_issues = Issue.objects.filter(project=OuterRef('pk'),
+                                           status__in=OPEN_ISSUE_STATUSES)
+        members = Contributor.objects.filter(project=OuterRef('pk'))
+        annotations = {
+            'issues_updated_at': latest_subquery(open_issues),
+            'issues_count': count_subquery(open_issues, 'project'),
+            'contributors_last_id': latest_subquery(members, 'pk'),
+            'contributors_count': count_subquery(members, 'project'),
+        }
+        if self.is_included('issues.comments'):
+            comments = Comment.objects.filter(
+                issue__project=OuterRef('pk'),
+                issue__status__in=OPEN_ISSUE_STATUSES)
+            annotations['comments_updated_at'] = latest_subquery(comments)
+            annotations['comments_count'] = count_subquery(
+                comments, 'issue__project')
+        return annotations
 
     def perform_create(self, serializer):
         project = serializer.save(author=self.request.user)
         Contributor.objects.create(user=self.request.user, project=project)
         return super().perform_create(serializer)
 
+    def destroy(self, request, *args, **kwargs):
+        """
+        Hides the project and answers 202: its issues, comments and
+        contributors are purged in the background, see DeletionView.
+        """
+        project = self.get_object()
+        return deletion_response(
+            request, deletion.request_project_deletion(project))
+
     @action(detail=True, methods=['PATCH'], url_name='add_contributors')
     def add_contributors(self, request, pk=None):
         project = self.get_object()
@@ -57,7 +230,10 @@ class ProjectViewset(MultipleSerializerMixin, ModelViewSet):
                 return handle_contributor_response(error_message,
                                                    status.HTTP_400_BAD_REQUEST)
             try:
-                Contributor.objects.create(user=user, project=project)
+                # A savepoint: the failed insert must not break the
+                # transaction of the request.
+                with transaction.atomic():
+                    Contributor.objects.create(user=user, project=project)
             except IntegrityError:
                 error_message = f'{username} is already a contributor'
                 return handle_contributor_response(error_message,
@@ -83,20 +259,146 @@ class ProjectViewset(MultipleSerializerMixin, ModelViewSet):
             contributor.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=True, methods=['GET'], url_name='changes',
+            permission_classes=[IsAuthenticated, IsAuthor | IsContributor])
+    def changes(self, request, pk=None):
+        """
+        Issues, comments and contributors changed after ?updated_since=
+        (or after the position stored in ?cursor=), and the ones deleted.
+        Pass the returned cursor to the next call to resume from there.
+        """
+        project = self.get_object()
+        try:
+            limit = int(request.query_params.get('limit',
+                                                 changes.DEFAULT_LIMIT))
+        except ValueError:
+            limit = changes.DEFAULT_LIMIT
+        data = changes.get_changes(
+            project.pk,
+            cursor=request.query_params.get('cursor'),
+            updated_since=request.query_params.get('updated_since'),
+            limit=limit,
+        )
+        return Response(data)
+
+    @action(detail=True, methods=['GET'], url_name='export',
+            permission_classes=[IsAuthenticated, IsAuthor | IsContributor])
+    def export(self, request, pk=None):
+        """
+        Streams every issue and comment of the project,
+        as NDJSON by default or as CSV with ?output=csv.
+        With ?deferred=true the export is written by a job instead,
+        downloaded from the job once done, see JobViewset.
+        """
+        project = self.get_object()
+        output = request.query_params.get('output', 'ndjson')
+        deferred = request.query_params.get('deferred', '')
+        if deferred.lower() in ('1', 'true'):
+            if output not in export.CONTENT_TYPES:
+                output = 'ndjson'
+            job = jobs.enqueue('export_project', project.pk, output,
+                               user=request.user)
+            return job_response(request, job)
+        return export.export_response(project, output)
+
+    @action(detail=True, methods=['GET'], url_name='stats',
+            permission_classes=[IsAuthenticated, IsAuthor | IsContributor])
+    def stats(self, request, pk=None):
+        """
+        Issue counts per status, priority and flag, and the comment count
+        of the project, read from its maintained counters.
+        """
+        project = self.get_object()
+        serializer = ProjectStatsSerializer(stats.get_stats(project))
+        return Response(serializer.data)
+
+    @action(detail=True, methods=['GET'], url_name='search',
+            serializer_class=SearchResultSerializer,
+            permission_classes=[IsAuthenticated, IsAuthor | IsContributor])
+    def search(self, request, pk=None):
+        """
+        Full-text search over the issues and comments of the project,
+        see SearchViewset.
+        """
+        project = self.get_object()
+        return search_response(self, request, [project.pk])
+
+    @action(detail=True, methods=['POST', 'PUT', 'DELETE'],
+            url_path='contributors', url_name='contributors',
+            serializer_class=ContributorBulkSerializer)
+    def bulk_contributors(self, request, pk=None):
+        """
+        Takes {"usernames": [...]} and adds them (POST), removes them
+        (DELETE) or makes them the exact contributor set (PUT).
+        Responds with the result of the operation for every username.
+        """
+        project = self.get_object()
+        serializer = ContributorBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        usernames = serializer.validated_data['usernames']
+        if request.method == 'POST':
+            results = contributors.add_contributors(project, usernames)
+        elif request.method == 'DELETE':
+            results = contributors.remove_contributors(project, usernames)
+        else:
+            results = contributors.sync_contributors(project, usernames)
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
 
-class IssueViewset(MultipleSerializerMixin, ModelViewSet):
+class IssueViewset(InstrumentedViewMixin, ConditionalRequestMixin,
+                   CachedResponseMixin, SparseFieldsetsMixin, RowListMixin,
+                   AsyncReadMixin, QueryPlanMixin, MultipleSerializerMixin,
+                   ModelViewSet):
     serializer_class = IssueSerializer
     detail_serializer_class = IssueDetailSerializer
+    row_serializer_class = IssueRowSerializer
+    resource_type = 'issue'
+    includes = {'comments': LATEST_COMMENTS}
+    pagination_class = OptionalCursorPagination
+    filter_backends = [IssueFilterBackend, OrderingFilter]
+    ordering_fields = ['created_at', 'updated_at', 'name', 'id']
+    cache_scope_kwarg = 'project_pk'
+    query_plans = {
+        'list': {
+            'select_related': ['attribution__user', 'attribution__project'],
+            'only': ['id', 'name', 'status', 'comment_count',
+                     'attribution__id',
+                     'attribution__user__id', 'attribution__user__username',
+                     'attribution__project__id',
+                     'attribution__project__name'],
+        },
+        'retrieve': ISSUE_DETAIL_PLAN,
+        'update': ISSUE_DETAIL_PLAN,
+        'partial_update': ISSUE_DETAIL_PLAN,
+        'default': {'select_related': ['project']},
+    }
 
     permission_classes = [IsAuthenticated, (IsAuthor | IsContributor)]
 
-    def get_queryset(self):
-        user = self.request.user
-        project_author = Q(project__author=user)
-        project_contributor = Q(project__contributors__user=user)
-        return Issue.objects.filter(
-            project_author | project_contributor,
-            project_id=self.kwargs['project_pk']).distinct()
+    def get_validator_annotations(self):
+        annotations = {'comments_counted': F('comment_count'),
+                       'attribution_key': F('attribution_id')}
+        if self.is_included('comments'):
+            annotations['comments_updated_at'] = latest_subquery(
+                Comment.objects.filter(issue=OuterRef('pk')))
+        return annotations
+
+    def get_validator_aggregates(self):
+        # Comment writes bump the updated_at of their issue along with its
+        # comment_count (see stats.comment_counted), MAX(updated_at)
+        # covers the counts.
+        aggregates = {'attributions_counted': Count('attribution'),
+                      'attributions_sum': Sum('attribution_id')}
+        if self.is_included('comments'):
+            aggregates['comments_updated_at'] = Max(latest_subquery(
+                Comment.objects.filter(issue=OuterRef('pk'))))
+        return aggregates
+
+    def get_scoped_queryset(self):
+        project_id = self.kwargs['project_pk']
+        if not get_membership(self.request).can_view(project_id):
+            return Issue.objects.none()
+        return Issue.objects.filter(project_id=project_id)
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -104,40 +406,187 @@ class IssueViewset(MultipleSerializerMixin, ModelViewSet):
         return context
 
     def perform_create(self, serializer):
-        project = Project.objects.get(pk=self.kwargs['project_pk'])
-        serializer.context['project_id'] = self.kwargs['project_pk']
         author = self.request.user
         attribution = serializer.validated_data.get('attribution')
-        serializer.save(project=project,
-                        author=author,
-                        attribution=attribution)
-        return super().perform_create(serializer)
+        issue = serializer.save(project_id=self.kwargs['project_pk'],
+                                author=author,
+                                attribution=attribution)
+        if issue.attribution_id is not None:
+            jobs.enqueue('notify_assignee', issue.pk)
+
+    def perform_update(self, serializer):
+        previous = serializer.instance.attribution_id
+        super().perform_update(serializer)
+        issue = serializer.instance
+        if issue.attribution_id not in (None, previous):
+            jobs.enqueue('notify_assignee', issue.pk)
 
+    @action(detail=False, methods=['POST', 'PATCH'], url_name='bulk',
+            parser_classes=[FastJSONParser, NDJSONParser])
+    def bulk(self, request, project_pk=None):
+        """
+        Creates (POST) or updates (PATCH, rows holding their 'id') many
+        issues from a JSON array or an application/x-ndjson stream.
+        Responds with the id or the validation errors of every row.
+        """
+        if not get_membership(request).can_view(project_pk):
+            raise PermissionDenied()
+        rows = request.data
+        # A JSON array, or the generator of NDJSONParser.
+        if not isinstance(rows, (list, GeneratorType)):
+            raise ValidationError(
+                {'non_field_errors': ['Expected a list of issues.']}
+            )
+        if request.method == 'POST':
+            results = bulk_issues.create_issues(int(project_pk),
+                                                request.user, rows)
+        else:
+            results = bulk_issues.update_issues(int(project_pk), rows)
+        failed = sum(1 for result in results if 'errors' in result)
+        data = {'succeeded': len(results) - failed, 'failed': failed,
+                'results': results}
+        return Response(data, status=status.HTTP_200_OK)
 
-class CommentViewset(MultipleSerializerMixin, ModelViewSet):
+
+class CommentViewset(InstrumentedViewMixin, ConditionalRequestMixin,
+                     CachedResponseMixin, SparseFieldsetsMixin, RowListMixin,
+                     AsyncReadMixin, QueryPlanMixin, MultipleSerializerMixin,
+                     ModelViewSet):
     serializer_class = CommentSerializer
     detail_serializer_class = CommentDetailSerializer
+    row_serializer_class = CommentRowSerializer
+    resource_type = 'comment'
+    fieldset_required = {'retrieve': ['issue__project']}
+    pagination_class = OptionalCursorPagination
+    cache_scope_kwarg = 'project_pk'
+    validator_related = ['issue']
+    query_plans = {
+        'list': {
+            'select_related': ['author'],
+            'only': ['id', 'uuid', 'description', 'created_at',
+                     'author__id', 'author__username'],
+        },
+        'retrieve': COMMENT_DETAIL_PLAN,
+        'update': COMMENT_DETAIL_PLAN,
+        'partial_update': COMMENT_DETAIL_PLAN,
+        'default': {'select_related': ['issue__project']},
+    }
 
     permission_classes = [IsAuthenticated, (IsAuthor | IsContributor)]
 
-    def get_queryset(self):
-        user = self.request.user
-        project_author = Q(issue__project__author=user)
-        project_contributor = Q(issue__project__contributors__user=user)
+    def get_scoped_queryset(self):
+        if not get_membership(self.request).can_view(
+                self.kwargs['project_pk']):
+            return Comment.objects.none()
         return Comment.objects.filter(
-            project_author | project_contributor,
-            issue_id=self.kwargs['issue_pk']).distinct()
+            issue_id=self.kwargs['issue_pk'],
+            issue__project_id=self.kwargs['project_pk'])
 
     def perform_create(self, serializer):
         issue = Issue.objects.get(pk=self.kwargs['issue_pk'])
         author = self.request.user
-        serializer.save(author=author, issue=issue)
-        return super().perform_create(serializer)
+        comment = serializer.save(author=author, issue=issue)
+        jobs.enqueue('notify_commented', comment.pk)
+
+
+class SearchViewset(InstrumentedViewMixin, GenericViewSet):
+    """
+    Full-text search over the issues and comments of every project the
+    user can see. Takes ?q=<terms>, and optionally ?project=<id> and
+    ?kind=issue|comment. Results are ranked, best first. Their `title`
+    and `snippet` are escaped HTML, the matched terms highlighted.
+    """
+    serializer_class = SearchResultSerializer
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request):
+        project_ids = get_membership(request).visible
+        project = request.query_params.get('project')
+        if project is not None:
+            project_ids = project_ids & {to_project_id(project)}
+        return search_response(self, request, project_ids)
+
+
+class DeletionView(RetrieveAPIView):
+    """
+    Progress of the deletion of a user or project: its status, pending,
+    running or done, and the rows deleted so far per table. The uuid,
+    given only to whoever asked for the deletion, is the credential:
+    deleted accounts cannot authenticate any more.
+    """
+    queryset = Deletion.objects.all()
+    serializer_class = DeletionSerializer
+    permission_classes = [AllowAny]
+    authentication_classes = []
+    lookup_field = 'uuid'
+
+
+class JobViewset(RetrieveModelMixin, GenericViewSet):
+    """
+    Status and result of the jobs the user asked for, and the file
+    written by the ones producing one (deferred exports) at download/.
+    """
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+    lookup_field = 'uuid'
+
+    def get_queryset(self):
+        return Job.objects.filter(requested_by=self.request.user)
+
+    @action(detail=True, methods=['GET'], url_name='download')
+    def download(self, request, uuid=None):
+        job = self.get_object()
+        result = job.result or {}
+        name = result.get('file')
+        if job.status != Job.DONE or not name:
+            raise NotFound('The job has no file to download.')
+        try:
+            file = default_storage.open(name, 'rb')
+        except FileNotFoundError:
+            raise NotFound('The file of the job was replaced or removed.')
+        return FileResponse(file, as_attachment=True,
+                            filename=name.rsplit('/', 1)[-1],
+                            content_type=result.get('content_type'))
+
+
+def job_response(request, job):
+    """ 202 pointing at the status of job """
+    url = request.build_absolute_uri(
+        reverse('jobs-detail', kwargs={'uuid': job.uuid}))
+    return Response(JobSerializer(job).data,
+                    status=status.HTTP_202_ACCEPTED,
+                    headers={'Location': url})
+
+
+def deletion_response(request, deletion):
+    """ 202 pointing at the progress of deletion """
+    url = request.build_absolute_uri(
+        reverse('deletion', kwargs={'uuid': deletion.uuid}))
+    return Response(DeletionSerializer(deletion).data,
+                    status=status.HTTP_202_ACCEPTED,
+                    headers={'Location': url})
+
+
+def search_response(view, request, project_ids):
+    """ Paginated search results of ?q= and ?kind= within project_ids """
+    query = request.query_params.get('q', '').strip()
+    kind = request.query_params.get('kind')
+    if not query:
+        raise ValidationError({'q': ['This query parameter is required.']})
+    if kind is not None and kind not in KINDS:
+        raise ValidationError(
+            {'kind': [f"Expected one of: {', '.join(KINDS)}."]}
+        )
+    results = SearchResults(query, project_ids, kind)
+    page = view.paginate_queryset(results)
+    serializer = view.get_serializer(page, many=True)
+    return view.get_paginated_response(serializer.data)
 
 
 def check_user_exists(username):
     try:
-        user = User.objects.get(username=username)
+        user = User.objects.get(username=username,
+                                deletion_requested_at=None)
         return user, None
     except User.DoesNotExist:
         return None, f"{username} is not a User"